@@ -0,0 +1,342 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from utils.file_handler import (
+    read_sales_data,
+    parse_transactions,
+    parse_transactions_table,
+    validate_and_filter,
+    stream_sales_data
+)
+from utils.data_processor import (
+    aggregate_transactions,
+    region_wise_sales,
+    top_products,
+    top_customers,
+    customer_analysis,
+    daily_sales_trend
+)
+from utils.rfm import build_rfm_state, rfm_analysis, cohort_retention
+from utils.api_handler import create_product_mapping, enrich_sales_data, save_enriched_data
+from utils.data_generator import generate_sales_data, generate_product_catalog
+from utils.instrumentation import peak_rss_mb
+
+BASELINE_FILE = 'benchmarks/baseline.json'
+BENCH_DATA_DIR = 'data/bench'
+# Above this many rows only the streaming benchmark runs; the list-based
+# hot paths would not fit in memory
+IN_MEMORY_LIMIT = 10 ** 7
+
+
+def parse_size(text):
+    """
+    Parses a row count such as 10000, 1e5, 250k or 10M.
+    Returns: int
+    """
+
+    text = text.strip().lower()
+    multiplier = {'k': 10 ** 3, 'm': 10 ** 6, 'g': 10 ** 9}.get(text[-1:], 1)
+    if multiplier > 1:
+        text = text[:-1]
+    return int(float(text) * multiplier)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the sales analytics hot paths on synthetic data."
+    )
+    parser.add_argument('--rows', nargs='+', type=parse_size, default=[10 ** 4, 10 ** 5],
+                        help="data sizes to benchmark, e.g. 1e4 1e5 1e6 (default: 1e4 1e5)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--products', type=int, default=10, help="distinct products (default: 10)")
+    parser.add_argument('--customers', type=int, default=25, help="distinct customers (default: 25)")
+    parser.add_argument('--regions', type=int, default=4, help="distinct regions (default: 4)")
+    parser.add_argument('--days', type=int, default=31, help="distinct dates (default: 31)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="timed runs per function; the fastest counts (default: 3)")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip the extra tracemalloc run used to measure peak memory")
+    parser.add_argument('--only', nargs='+', metavar='NAME', help="run only these benchmarks")
+    parser.add_argument('--data-dir', default=BENCH_DATA_DIR,
+                        help=f"where generated files are kept (default: {BENCH_DATA_DIR})")
+    parser.add_argument('--baseline', default=BASELINE_FILE,
+                        help=f"baseline file to compare against (default: {BASELINE_FILE})")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed rows/s drop against the baseline before a regression is reported (default: 0.25)")
+    parser.add_argument('--check', action='store_true',
+                        help="exit with status 1 when a regression is found")
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON")
+    parser.add_argument('--generate', metavar='FILE',
+                        help="only write a synthetic sales file of --rows[0] rows to FILE")
+    return parser.parse_args(argv)
+def dataset_path(args, rows):
+    """
+    Returns: path of the generated file for this size and these
+    generator settings (generated on first use)
+    """
+
+    name = f"sales_{rows}_s{args.seed}_p{args.products}_c{args.customers}_r{args.regions}_d{args.days}.txt"
+    path = os.path.join(args.data_dir, name)
+    if not os.path.exists(path):
+        os.makedirs(args.data_dir, exist_ok=True)
+        print(f"Generating {rows:,} rows -> {path}")
+        generate_sales_data(path, rows, args.seed, args.products, args.customers, args.regions, args.days)
+    return path
+def build_benchmarks(path, args):
+    """
+    Lists the benchmarks for one data file. Each stage takes its input
+    from the output of the previous one, prepared once outside the timing.
+    Returns: list of (name, setup, run) tuples; setup(state) prepares
+    inputs and returns the number of rows the call processes, run(state)
+    is the timed call
+    """
+
+    enriched_file = os.path.join(args.data_dir, 'bench_enriched.txt')
+
+    def setup_lines(state):
+        return state['rows']
+
+    def setup_parse(state):
+        if 'lines' not in state:
+            state['lines'] = read_sales_data(path)
+        return len(state['lines'])
+
+    def setup_validate(state):
+        setup_parse(state)
+        if 'parsed' not in state:
+            state['parsed'] = parse_transactions(state['lines'])
+        return len(state['parsed'])
+
+    def setup_valid(state):
+        setup_validate(state)
+        if 'valid' not in state:
+            state['valid'] = validate_and_filter(state['parsed'])[0]
+        return len(state['valid'])
+
+    def setup_valid_paise(state):
+        setup_parse(state)
+        if 'valid_paise' not in state:
+            parsed = parse_transactions(state['lines'], paise=True)
+            state['valid_paise'] = validate_and_filter(parsed, paise=True)[0]
+        return len(state['valid_paise'])
+
+    def setup_enrich(state):
+        rows = setup_valid(state)
+        if 'mapping' not in state:
+            state['mapping'] = create_product_mapping(generate_product_catalog(args.products, args.seed))
+        return rows
+
+    def setup_save(state):
+        rows = setup_enrich(state)
+        if 'enriched' not in state:
+            state['enriched'] = enrich_sales_data(state['valid'], state['mapping'], copy=True)
+        return rows
+
+    def run_rfm(state):
+        rfm_state = build_rfm_state(state['valid'])
+        return rfm_analysis(rfm_state), cohort_retention(rfm_state)
+
+    return [
+        ('read_sales_data', setup_parse, lambda state: read_sales_data(path)),
+        ('parse_transactions', setup_parse, lambda state: parse_transactions(state['lines'])),
+        ('parse_transactions_table', setup_parse, lambda state: parse_transactions_table(state['lines'])),
+        ('parse_paise', setup_parse, lambda state: parse_transactions(state['lines'], paise=True)),
+        ('validate_and_filter', setup_validate, lambda state: validate_and_filter(state['parsed'])),
+        ('aggregate_transactions', setup_valid, lambda state: aggregate_transactions(state['valid'])),
+        ('aggregate_paise', setup_valid_paise,
+         lambda state: aggregate_transactions(state['valid_paise'], paise=True)),
+        ('region_wise_sales', setup_valid, lambda state: region_wise_sales(state['valid'])),
+        ('top_products', setup_valid, lambda state: top_products(state['valid'])),
+        ('top_customers', setup_valid, lambda state: top_customers(state['valid'])),
+        ('customer_analysis', setup_valid, lambda state: customer_analysis(state['valid'])),
+        ('daily_sales_trend', setup_valid, lambda state: daily_sales_trend(state['valid'])),
+        ('rfm_cohorts', setup_valid, run_rfm),
+        ('enrich_sales_data', setup_enrich,
+         lambda state: enrich_sales_data(state['valid'], state['mapping'], copy=True)),
+        ('save_enriched_data', setup_save,
+         lambda state: save_enriched_data(state['enriched'], enriched_file)),
+        ('stream_sales_data', setup_lines, lambda state: stream_sales_data(path))
+    ]
+def measure(run, state, repeat, trace_memory):
+    """
+    Times run(state) repeat times, then optionally once more under
+    tracemalloc for its peak allocation.
+    Returns: tuple (best_seconds, peak_mb or None)
+    """
+
+    best = None
+    # The pipeline functions print progress messages; keep them out of the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            run(state)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        peak_mb = None
+        if trace_memory:
+            gc.collect()
+            tracemalloc.start()
+            try:
+                run(state)
+                peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            finally:
+                tracemalloc.stop()
+
+    return best, peak_mb
+def run_size(rows, args):
+    """
+    Runs every benchmark on a generated file of rows data rows.
+    Returns: dictionary mapping benchmark name to its result
+    """
+
+    path = dataset_path(args, rows)
+    results = {}
+    state = {'rows': rows}
+
+    for name, setup, run in build_benchmarks(path, args):
+        if args.only and name not in args.only:
+            continue
+        if rows > IN_MEMORY_LIMIT and name != 'stream_sales_data':
+            continue
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            processed = setup(state)
+        seconds, peak_mb = measure(run, state, args.repeat, not args.no_memory)
+        results[name] = {
+            'rows': processed,
+            'seconds': seconds,
+            'rows_per_s': processed / seconds if seconds > 0 else None,
+            'peak_mb': peak_mb
+        }
+        print(format_result(name, results[name]))
+
+    return results
+def format_result(name, result, baseline=None, tolerance=None):
+    """
+    Returns: one printable line for a benchmark result, with the change
+    against the baseline when one is given
+    """
+
+    rate = f"{result['rows_per_s']:,.0f}" if result['rows_per_s'] else "-"
+    peak = f"{result['peak_mb']:.1f}" if result['peak_mb'] is not None else "-"
+    line = f"  {name:<24} {result['seconds']:>10.4f} s {rate:>14} rows/s {peak:>9} MB"
+
+    if baseline and baseline.get('rows_per_s') and result['rows_per_s']:
+        change = result['rows_per_s'] / baseline['rows_per_s'] - 1
+        line += f"  {change:>+7.1%} vs baseline"
+        if change < -tolerance:
+            line += "  REGRESSION"
+    return line
+def load_baseline(path):
+    """
+    Returns: stored baseline results, or None if there is none
+    """
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable baseline {path}: {e}")
+        return None
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Prints each result next to its baseline.
+    Returns: list of (rows, name) pairs that regressed by more than tolerance
+    """
+
+    regressions = []
+    print(f"\nCOMPARISON WITH BASELINE ({baseline.get('generated_at', 'unknown date')}, "
+          f"Python {baseline.get('python', '?')})")
+    if baseline.get('platform') != platform.platform() or baseline.get('python') != platform.python_version():
+        print(f"Note: the baseline was measured on {baseline.get('platform', 'an unknown platform')}; "
+              f"throughput from another machine or Python is not comparable")
+
+    for rows, by_name in results.items():
+        stored = baseline['results'].get(rows, {})
+        print(f"{int(rows):,} rows")
+        for name, result in by_name.items():
+            print(format_result(name, result, stored.get(name), tolerance))
+            old = stored.get(name)
+            if old and old.get('rows_per_s') and result['rows_per_s']:
+                if result['rows_per_s'] < old['rows_per_s'] * (1 - tolerance):
+                    regressions.append((rows, name))
+
+    return regressions
+def build_results_document(results, args):
+    return {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'generator': {
+            'seed': args.seed,
+            'products': args.products,
+            'customers': args.customers,
+            'regions': args.regions,
+            'days': args.days
+        },
+        'peak_rss_mb': peak_rss_mb(),
+        'results': results
+    }
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.generate:
+        rows = args.rows[0]
+        generate_sales_data(args.generate, rows, args.seed, args.products, args.customers, args.regions, args.days)
+        print(f"Wrote {rows:,} rows to {args.generate}")
+        return 0
+
+    print("SALES ANALYTICS BENCHMARK")
+    print(f"{'Function':<26} {'Best time':>12} {'Throughput':>21} {'Peak mem':>12}")
+
+    results = {}
+    for rows in args.rows:
+        print(f"{rows:,} rows")
+        # JSON object keys are strings; use them here too so results and
+        # the stored baseline compare directly
+        results[str(rows)] = run_size(rows, args)
+
+    document = build_results_document(results, args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2)
+
+    regressions = []
+    baseline = load_baseline(args.baseline)
+    if baseline is not None:
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.tolerance:.0%}")
+        else:
+            print("\nNo regressions against the baseline.")
+    else:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to store one for this machine.")
+
+    if args.save_baseline:
+        if baseline is not None:
+            # Keep stored sizes that were not re-run this time
+            merged = dict(baseline['results'])
+            merged.update(results)
+            document['results'] = merged
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    return 1 if regressions and args.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
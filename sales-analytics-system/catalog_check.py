@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from utils.api_handler import fetch_all_products
+from utils.catalog_cache import get_cache_metrics, reset_cache_metrics, load_cached_catalog
+
+STUB_PRODUCTS = 250
+
+
+class StubCatalog:
+    """
+    In-memory product catalog served by StubHandler, shaped like the
+    DummyJSON /products endpoint ({'products', 'total', 'skip', 'limit'}).
+    The ETag changes with the version, so bump() makes cached copies stale.
+    Misbehaviour to check the client against:
+    failing     - every request answers 500
+    max_limit   - pages hold at most this many products, whatever the limit
+    short_once  - skips whose first answer drops the last half of the page
+    missing     - products at the end that 'total' counts but are never served
+    slow_first  - earlier pages answer later, so pages finish out of order
+    """
+
+    def __init__(self, count=STUB_PRODUCTS):
+        self.count = count
+        self.version = 1
+        self.failing = False
+        self.max_limit = None
+        self.short_once = set()
+        self.missing = 0
+        self.slow_first = False
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def reset(self):
+        self.failing = False
+        self.max_limit = None
+        self.short_once = set()
+        self.missing = 0
+        self.slow_first = False
+        self.requests = []
+
+    @property
+    def etag(self):
+        return f'"catalog-v{self.version}"'
+
+    def bump(self, count=None):
+        self.version += 1
+        if count is not None:
+            self.count = count
+
+    def page(self, skip, limit):
+        if self.max_limit is not None:
+            limit = min(limit, self.max_limit)
+        ids = list(range(skip + 1, min(skip + limit, self.count - self.missing) + 1))
+        with self.lock:
+            if skip in self.short_once:
+                self.short_once.discard(skip)
+                ids = ids[:len(ids) // 2]
+        if self.slow_first and skip:
+            time.sleep(max(0.0, 0.2 - 0.2 * skip / self.count))
+        return {
+            'products': [{'id': i, 'title': f"Product {i} v{self.version}", 'category': 'stub',
+                          'brand': 'Stub', 'rating': 4.0} for i in ids],
+            'total': self.count,
+            'skip': skip,
+            'limit': limit
+        }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    catalog = None
+
+    def do_GET(self):
+        query = parse_qs(urlsplit(self.path).query)
+        skip = int(query.get('skip', ['0'])[0])
+        limit = int(query.get('limit', ['30'])[0])
+        catalog = self.catalog
+        with catalog.lock:
+            catalog.requests.append((skip, limit, self.headers.get('If-None-Match')))
+
+        if catalog.failing:
+            self.send_error(500)
+            return
+        if skip == 0 and self.headers.get('If-None-Match') == catalog.etag:
+            self.send_response(304)
+            self.send_header('ETag', catalog.etag)
+            self.end_headers()
+            return
+
+        body = json.dumps(catalog.page(skip, limit)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', catalog.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(catalog):
+    """
+    Serves catalog on an ephemeral local port on a daemon thread.
+    Returns: tuple (server, products URL)
+    """
+
+    handler = type('Handler', (StubHandler,), {'catalog': catalog})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/products"
+def check(results, name, passed, detail=""):
+    """
+    Prints and records the outcome of one check.
+    """
+
+    results.append(passed)
+    print(f"{'PASS' if passed else 'FAIL'}  {name}{f' ({detail})' if detail and not passed else ''}")
+def metrics_delta(before):
+    """
+    Returns: cache counters that changed since before
+    """
+
+    after = get_cache_metrics()
+    return {key: after[key] - before[key] for key in after if after[key] != before[key]}
+def check_cache(url, catalog, cache_file, results):
+    """
+    Exercises the TTL and ETag handling of fetch_all_products() against the stub.
+    """
+
+    def fetch(ttl):
+        before = get_cache_metrics()
+        sent = len(catalog.requests)
+        products = fetch_all_products(url, cache_file, ttl=ttl, timeout=5, page_size=100, retries=0)
+        return products, metrics_delta(before), catalog.requests[sent:]
+
+    products, events, requests = fetch(ttl=3600)
+    check(results, "empty cache downloads the catalog and counts a miss",
+          len(products) == catalog.count and events == {'misses': 1}, f"{len(products)} products, {events}")
+    cached = load_cached_catalog(cache_file, url)
+    check(results, "download is cached with its ETag",
+          cached is not None and cached['etag'] == catalog.etag, f"cache entry {cached and cached.get('etag')}")
+
+    products, events, requests = fetch(ttl=3600)
+    check(results, "within the TTL the cache is served without a request",
+          len(products) == catalog.count and events == {'hits': 1} and not requests, f"{events}, {requests}")
+
+    products, events, requests = fetch(ttl=0)
+    check(results, "after the TTL an unchanged catalog is revalidated with If-None-Match",
+          events == {'revalidated': 1} and requests == [(0, 100, catalog.etag)], f"{events}, {requests}")
+
+    catalog.bump()
+    products, events, requests = fetch(ttl=0)
+    check(results, "after the TTL a changed catalog is downloaded again and counts a miss",
+          events == {'misses': 1} and products[0]['title'].endswith(f"v{catalog.version}"), f"{events}")
+
+    catalog.failing = True
+    products, events, requests = fetch(ttl=0)
+    check(results, "an unreachable API serves the stale copy",
+          len(products) == catalog.count and events == {'stale_served': 1}, f"{events}")
+
+    os.remove(cache_file)
+    products, events, requests = fetch(ttl=0)
+    check(results, "an unreachable API without a cache counts a miss and returns nothing",
+          products == [] and events == {'misses': 1}, f"{len(products)} products, {events}")
+    catalog.failing = False
+def check_pagination(url, catalog, cache_file, results):
+    """
+    Exercises the paginated download of fetch_all_products() against the stub.
+    """
+
+    expected = list(range(1, catalog.count + 1))
+
+    def fetch(cache=None, page_size=100):
+        products = fetch_all_products(url, cache, ttl=0, timeout=5, page_size=page_size, retries=0)
+        return [product['id'] for product in products]
+
+    catalog.reset()
+    catalog.slow_first = True
+    check(results, "pages finishing out of order are put together in page order", fetch() == expected)
+    skips = sorted(skip for skip, _, _ in catalog.requests)
+    check(results, "one request per page", skips == list(range(0, catalog.count, 100)), f"skips {skips}")
+
+    catalog.reset()
+    catalog.max_limit = 40
+    check(results, "a server capping the limit is paged by its cap", fetch() == expected)
+
+    catalog.reset()
+    catalog.short_once = {100}
+    ids = fetch()
+    check(results, "a short page is re-requested and the catalog is complete", ids == expected,
+          f"{len(ids)} of {len(expected)} products")
+
+    catalog.reset()
+    catalog.missing = 5
+    ids = fetch(cache_file)
+    check(results, "a catalog short of 'total' is returned as received",
+          ids == expected[:-5], f"{len(ids)} products")
+    check(results, "an incomplete catalog is not cached", load_cached_catalog(cache_file, url) is None)
+    catalog.reset()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check the product catalog client against a local stub of the products API."
+    )
+    parser.add_argument('--products', type=int, default=STUB_PRODUCTS,
+                        help=f"products in the stub catalog (default: {STUB_PRODUCTS})")
+    return parser.parse_args(argv)
+def main(argv=None):
+    args = parse_args(argv)
+    catalog = StubCatalog(args.products)
+    server, url = start_stub(catalog)
+    reset_cache_metrics()
+    results = []
+
+    try:
+        with tempfile.TemporaryDirectory(prefix='catalog-check-') as directory:
+            check_cache(url, catalog, os.path.join(directory, 'catalog_cache.json'), results)
+            check_pagination(url, catalog, os.path.join(directory, 'paged_cache.json'), results)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    failed = results.count(False)
+    print(f"\n{len(results) - failed}/{len(results)} catalog checks passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
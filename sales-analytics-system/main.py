@@ -1,90 +1,178 @@
 import datetime
+import io
+from functools import partial
 
-def generate_sales_report(transactions, enriched_transactions, output_file='output/sales_report.txt'):
+from utils.file_handler import atomic_open
+from utils.money import format_inr, average_amount
+
+COHORT_REPORT_MONTHS = 12  # retention columns shown per cohort
+RFM_SPILL_NOTE = ("RFM scores and cohorts need every customer's state in memory, "
+                  "which --customer-memory-mb keeps out of it.")
+
+def generate_sales_report(transactions, enriched_transactions, output_file='output/sales_report.txt', aggregates=None,
+                          enrichment_summary=None, filter_summary=None, customer_stats=None, rfm_state=None,
+                          rfm_skipped=None):
     """
     Generates a comprehensive formatted text report.
+    Pass the result of aggregate_transactions() as aggregates and the
+    summary filled by enrich_sales_data() as enrichment_summary to avoid
+    re-scanning the transactions; otherwise they are computed here once.
+    Money is formatted from exact integers when the aggregates are in paise.
+    Duplicate transactions counted in filter_summary are reported when any
+    were removed. Pass the result of top_customers() as customer_stats when
+    the aggregates were built without customers, and RFM / cohort state
+    from build_rfm_state() as rfm_state to avoid another scan (without
+    either it or transactions the RFM section is left out). rfm_skipped
+    is the reason to print instead of the RFM section when per-customer
+    state was not kept in memory.
     """
 
+    from utils.data_processor import aggregate_transactions
+
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
+        if aggregates is None:
+            aggregates = aggregate_transactions(transactions)
+        record_count = aggregates['transaction_count']
+        paise = aggregates.get('paise', False)
+        inr = partial(format_inr, paise=paise)
+
+        # Build the whole report in memory, then write it in one go
+        with io.StringIO() as f:
             # 1. HEADER
             f.write("SALES ANALYTICS REPORT\n")
             f.write(f"Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Records Processed: {len(transactions)}\n\n")
+            f.write(f"Records Processed: {record_count}\n\n")
 
             # 2. OVERALL SUMMARY
-            total_revenue = sum(t['Quantity'] * t['UnitPrice'] for t in transactions)
-            avg_order_value = total_revenue / len(transactions) if transactions else 0
-            dates = [t['Date'] for t in transactions]
+            total_revenue = aggregates['total_revenue']
+            avg_order_value = average_amount(total_revenue, record_count, paise)
+            dates = list(aggregates['daily'])
             date_range = f"{min(dates)} to {max(dates)}" if dates else "N/A"
 
             f.write("# OVERALL SUMMARY\n\n")
-            f.write(f"Total Revenue: ₹{total_revenue:,.2f}\n")
-            f.write(f"Total Transactions: {len(transactions)}\n")
-            f.write(f"Average Order Value: ₹{avg_order_value:,.2f}\n")
+            f.write(f"Total Revenue: {inr(total_revenue)}\n")
+            f.write(f"Total Transactions: {record_count}\n")
+            duplicates = (filter_summary or {}).get('duplicates', 0)
+            if duplicates:
+                f.write(f"Duplicate Transactions Removed: {duplicates}\n")
+            f.write(f"Average Order Value: {inr(avg_order_value)}\n")
             f.write(f"Date Range: {date_range}\n\n")
 
             # 3. REGION-WISE PERFORMANCE
             from utils.data_processor import region_wise_sales
-            region_stats = region_wise_sales(transactions)
+            region_stats = region_wise_sales(aggregates)
 
             f.write("## REGION-WISE PERFORMANCE\n\n")
             f.write("Region | Sales | % of Total | Transactions\n")
             f.write("-------------------------------------------\n")
             for region, stats in region_stats.items():
-                f.write(f"{region} | ₹{stats['total_sales']:,.2f} | {stats['percentage']:.2f}% | {stats['transaction_count']}\n")
+                f.write(f"{region} | {inr(stats['total_sales'])} | {stats['percentage']:.2f}% | {stats['transaction_count']}\n")
             f.write("\n")
 
             # 4. TOP 5 PRODUCTS
             from utils.data_processor import top_selling_products
-            top_products = top_selling_products(transactions, n=5)
+            top_products = top_selling_products(aggregates, n=5)
 
             f.write("## TOP 5 PRODUCTS\n\n")
             f.write("Rank | Product | Quantity | Revenue\n")
             f.write("-----------------------------------\n")
             for i, (product, qty, revenue) in enumerate(top_products, start=1):
-                f.write(f"{i} | {product} | {qty} | ₹{revenue:,.2f}\n")
+                f.write(f"{i} | {product} | {qty} | {inr(revenue)}\n")
             f.write("\n")
 
             # 5. TOP 5 CUSTOMERS
-            from utils.data_processor import customer_analysis
-            customer_stats = customer_analysis(transactions)
-            top_customers = list(customer_stats.items())[:5]
+            from utils.data_processor import top_customers
+            top_customer_stats = customer_stats if customer_stats is not None else top_customers(aggregates, n=5)
 
             f.write("## TOP 5 CUSTOMERS\n\n")
             f.write("Rank | CustomerID | Total Spent | Orders\n")
             f.write("----------------------------------------\n")
-            for i, (cust, stats) in enumerate(top_customers, start=1):
-                f.write(f"{i} | {cust} | ₹{stats['total_spent']:,.2f} | {stats['purchase_count']}\n")
+            for i, (cust, stats) in enumerate(top_customer_stats.items(), start=1):
+                f.write(f"{i} | {cust} | {inr(stats['total_spent'])} | {stats['purchase_count']}\n")
             f.write("\n")
 
             # 6. DAILY SALES TREND
-            from utils.data_processor import daily_sales_trend
-            daily_stats = daily_sales_trend(transactions)
+            from utils.data_processor import sales_rollups, daily_sales_trend
+            rollups = sales_rollups(aggregates)
+            daily_stats = daily_sales_trend(rollups)
 
             f.write("## DAILY SALES TREND\n\n")
             f.write("Date | Revenue | Transactions | Unique Customers\n")
             f.write("-----------------------------------------------\n")
             for date, stats in daily_stats.items():
-                f.write(f"{date} | ₹{stats['revenue']:,.2f} | {stats['transaction_count']} | {stats['unique_customers']}\n")
+                f.write(f"{date} | {inr(stats['revenue'])} | {stats['transaction_count']} | {stats['unique_customers']}\n")
             f.write("\n")
 
-            # 7. PRODUCT PERFORMANCE ANALYSIS
+            # 7. WEEKLY / MONTHLY TREND
+            f.write("## WEEKLY AND MONTHLY TREND\n\n")
+            f.write("Period | Revenue | Transactions | Unique Customers | Change vs Previous\n")
+            f.write("----------------------------------------------------------------------\n")
+            for period in ('weekly', 'monthly'):
+                for key, stats in rollups[period].items():
+                    change = f"{stats['change_pct']:+.2f}%" if stats['change_pct'] is not None else "N/A"
+                    f.write(f"{key} | {inr(stats['revenue'])} | {stats['transaction_count']} | "
+                            f"{stats['unique_customers']} | {change}\n")
+            if daily_stats:
+                last_day = list(daily_stats)[-1]
+                windows = " | ".join(f"{window}-day: {inr(by_date.get(last_day, 0))}"
+                                     for window, by_date in rollups['rolling'].items())
+                f.write(f"Rolling revenue to {last_day}: {windows}\n")
+            f.write("\n")
+
+            # 8. PRODUCT PERFORMANCE ANALYSIS
             from utils.data_processor import find_peak_sales_day, low_performing_products
-            peak_day, peak_revenue, peak_txn = find_peak_sales_day(transactions)
-            low_products = low_performing_products(transactions)
+            peak_day, peak_revenue, peak_txn = find_peak_sales_day(rollups)
+            low_products = low_performing_products(aggregates)
 
             f.write("## PRODUCT PERFORMANCE ANALYSIS\n\n")
-            f.write(f"Best Selling Day: {peak_day} | Revenue: ₹{peak_revenue:,.2f} | Transactions: {peak_txn}\n")
+            f.write(f"Best Selling Day: {peak_day} | Revenue: {inr(peak_revenue)} | Transactions: {peak_txn}\n")
             f.write("Low Performing Products:\n")
             for product, qty, revenue in low_products:
-                f.write(f"- {product}: Qty={qty}, Revenue=₹{revenue:,.2f}\n")
+                f.write(f"- {product}: Qty={qty}, Revenue={inr(revenue)}\n")
             f.write("\n")
 
-            # 8. API ENRICHMENT SUMMARY
-            enriched_count = sum(1 for t in enriched_transactions if t['API_Match'])
-            success_rate = (enriched_count / len(enriched_transactions) * 100) if enriched_transactions else 0
-            failed_products = [t['ProductName'] for t in enriched_transactions if not t['API_Match']]
+            # 9. CUSTOMER RFM AND COHORTS
+            from utils.rfm import build_rfm_state, rfm_analysis, cohort_retention
+            if rfm_skipped:
+                f.write("## CUSTOMER RFM AND COHORTS\n\n")
+                f.write(f"Skipped: {rfm_skipped}\n\n")
+            elif rfm_state is None and transactions is not None:
+                rfm_state = build_rfm_state(transactions, paise)
+            if rfm_state is not None and not rfm_skipped:
+                rfm = rfm_analysis(rfm_state)
+                segment_total = sum(stats['monetary'] for stats in rfm['segments'].values())
+
+                f.write("## CUSTOMER RFM AND COHORTS\n\n")
+                f.write(f"RFM Scores as of {rfm['as_of'] or 'N/A'} (quintiles, 5 = best): "
+                        f"{len(rfm['customers'])} customers\n")
+                f.write("Segment | Customers | Revenue | % of Revenue\n")
+                f.write("---------------------------------------------\n")
+                for segment, stats in rfm['segments'].items():
+                    share = stats['monetary'] / segment_total * 100 if segment_total > 0 else 0
+                    f.write(f"{segment} | {stats['customers']} | {inr(stats['monetary'])} | {share:.2f}%\n")
+                f.write("\n")
+
+                cohorts = cohort_retention(rfm_state)
+                months = min(max((len(stats['retention']) for stats in cohorts.values()), default=1),
+                             COHORT_REPORT_MONTHS)
+                f.write("Cohort | Customers | " + " | ".join(f"M+{k}" for k in range(months)) + "\n")
+                f.write("-" * (20 + 9 * months) + "\n")
+                for cohort, stats in cohorts.items():
+                    retention = " | ".join(f"{value:.1f}%" for value in stats['retention'][:months])
+                    f.write(f"{cohort} | {stats['customers']} | {retention}\n")
+                f.write("\n")
+
+            # 10. API ENRICHMENT SUMMARY
+            if enrichment_summary is None:
+                enriched_count = sum(1 for t in enriched_transactions if t['API_Match'])
+                failed_products = list(dict.fromkeys(t['ProductName'] for t in enriched_transactions
+                                                     if not t['API_Match']))
+            else:
+                enriched_count = enrichment_summary['matched']
+                failed_products = enrichment_summary['unmatched_products']
+            enriched_total = len(enriched_transactions) if enrichment_summary is None else \
+                enrichment_summary['matched'] + enrichment_summary['unmatched']
+            success_rate = (enriched_count / enriched_total * 100) if enriched_total else 0
 
             f.write("## API ENRICHMENT SUMMARY\n\n")
             f.write(f"Total Products Enriched: {enriched_count}\n")
@@ -93,92 +181,601 @@ def generate_sales_report(transactions, enriched_transactions, output_file='outp
             for p in failed_products:
                 f.write(f"- {p}\n")
 
+            report = f.getvalue()
+
+        with atomic_open(output_file) as out:
+            out.write(report)
+
         print(f"Report saved to {output_file}")
 
     except Exception as e:
         print(f"Error generating report: {e}")
-from utils.file_handler import read_sales_data, parse_transactions, validate_and_filter
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.file_handler import (
+    read_sales_data,
+    parse_transactions,
+    new_parse_counters,
+    format_rejects,
+    iter_sales_lines,
+    iter_transactions,
+    iter_valid_transactions,
+    validate_and_filter,
+    new_filter_counters,
+    build_filter_summary
+)
 from utils.data_processor import (
+    aggregate_transactions,
+    merge_aggregates,
     calculate_total_revenue,
     region_wise_sales,
     top_selling_products,
+    top_products,
+    top_customers,
     customer_analysis,
     daily_sales_trend,
     find_peak_sales_day,
     low_performing_products
 )
-from utils.api_handler import fetch_all_products, create_product_mapping, enrich_sales_data, save_enriched_data
+from utils.api_handler import (
+    CATALOG_DEADLINE,
+    CatalogFetch,
+    enrich_sales_data,
+    new_enrichment_summary,
+    save_enriched_data
+)
+from utils.catalog_cache import CATALOG_CACHE_TTL, get_cache_metrics
+from utils.parallel_processor import parallel_process_sales_data
+from utils.binary_cache import load_or_parse
+from utils.incremental import STATE_FILE, update_state, save_state, merge_enrichment_summary
+from utils.instrumentation import PipelineProfiler
+from utils.query import TransactionQuery
+from utils.spill import new_spill_stats, partitioned_customer_analysis
+from utils.rfm import new_rfm_state, build_rfm_state, merge_rfm_state
+from utils.dedup import DEDUP_POLICIES, DEDUP_MODES, DEFAULT_BLOOM_MEMORY_MB, DuplicateFilter
+from utils.server import DEFAULT_HOST, DEFAULT_PORT, RESULT_CACHE_SIZE, serve
+from utils.sketches import hll_precision_for_error
+
+# Stage names used for timings and --cprofile
+PIPELINE_STAGES = ['read', 'parse', 'validate', 'analyze', 'fetch', 'enrich', 'save', 'report']
+
+def load_config(path):
+    """
+    Loads a JSON run configuration. Keys match the long option names with
+    dashes replaced by underscores, e.g.
+    {"input": ["data/daily/*.txt"], "region": "North", "output_dir": "output/batch"}
+    Returns: dictionary
+    """
+
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"config file {path} must contain a JSON object")
+    if isinstance(config.get('input'), str):
+        config['input'] = [config['input']]
+    return config
+def parse_args(argv=None):
+    """
+    Parses command line options. Values from --config are used as
+    defaults, so options given on the command line take precedence.
+    """
+
+    parser = argparse.ArgumentParser(description="Sales Analytics System")
+    parser.add_argument('--config', help="JSON file with option values (see load_config)")
+    parser.add_argument('--input', nargs='+', metavar='GLOB',
+                        help="sales files or glob patterns to process in batch mode (no prompts)")
+    parser.add_argument('--output-dir', default='output/batch',
+                        help="where batch mode writes per-file reports and enriched data (default: output/batch)")
+    parser.add_argument('--combined-report', default=None,
+                        help="combined report path for batch mode (default: <output-dir>/combined_report.txt)")
+    parser.add_argument('--region', help="only keep transactions from this region")
+    parser.add_argument('--min-amount', type=float, help="only keep transactions worth at least this amount")
+    parser.add_argument('--max-amount', type=float, help="only keep transactions worth at most this amount")
+    parser.add_argument('--no-prompt', action='store_true',
+                        help="do not ask for filters; use --region/--min-amount/--max-amount as given")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="parse, validate and aggregate with N worker processes (default: 1, serial)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only process rows appended since the last run and merge them into the saved state "
+                             "(no filters)")
+    parser.add_argument('--state-file', default=STATE_FILE,
+                        help=f"aggregate state used by --incremental (default: {STATE_FILE})")
+    parser.add_argument('--binary-cache', action='store_true',
+                        help="keep parsed columns in a sidecar cache next to the sales file and map them on "
+                             "later runs instead of re-parsing")
+    parser.add_argument('--enriched-format', choices=['text', 'binary'], default='text',
+                        help="write enriched data as pipe-delimited text (default) or a columnar store")
+    parser.add_argument('--distinct-error', type=float, default=None,
+                        help="estimate unique customers/products with HyperLogLog sketches at this relative "
+                             "error (e.g. 0.01) instead of exact sets")
+    parser.add_argument('--paise', action='store_true',
+                        help="hold prices and amounts as integer paise so totals are exact and identical across "
+                             "serial, parallel and incremental runs (output format is unchanged)")
+    parser.add_argument('--dedup', choices=DEDUP_POLICIES,
+                        help="drop rows with a repeated TransactionID: keep the first or last occurrence, or reject "
+                             "every copy")
+    parser.add_argument('--dedup-mode', choices=DEDUP_MODES, default='exact',
+                        help="track seen IDs in a set (exact, default) or a fixed-size Bloom filter (bloom) that "
+                             "only keeps suspected repeats; bloom bounds the memory for IDs only, the valid rows "
+                             "are still held in memory for the report")
+    parser.add_argument('--dedup-memory-mb', type=float, default=DEFAULT_BLOOM_MEMORY_MB,
+                        help=f"Bloom filter size for --dedup-mode bloom (default: {DEFAULT_BLOOM_MEMORY_MB})")
+    parser.add_argument('--customer-memory-mb', type=float, default=None,
+                        help="analyse customers out of core: spill rows to temporary partition files by CustomerID "
+                             "and aggregate them within this memory ceiling (single-file runs)")
+    parser.add_argument('--catalog-timeout', type=float, default=CATALOG_DEADLINE,
+                        help="seconds to wait for the product catalog, which is fetched in the background while "
+                             f"the sales data is processed, before enriching without it (default: {CATALOG_DEADLINE})")
+    parser.add_argument('--catalog-ttl', type=float, default=CATALOG_CACHE_TTL,
+                        help="seconds the cached product catalog is used before it is revalidated with the API; "
+                             f"0 revalidates on every run (default: {CATALOG_CACHE_TTL})")
+    parser.add_argument('--serve', action='store_true',
+                        help="load the sales file (or the single --input file) once and answer report queries "
+                             "over HTTP/JSON until interrupted")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"address for --serve (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"port for --serve (default: {DEFAULT_PORT})")
+    parser.add_argument('--cache-size', type=int, default=RESULT_CACHE_SIZE,
+                        help=f"query results kept by --serve (default: {RESULT_CACHE_SIZE})")
+
+    parser.add_argument('--timings-json', metavar='PATH',
+                        help="also write per-stage and per-function timings as JSON")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="record peak Python allocations per stage with tracemalloc (slower)")
+    parser.add_argument('--cprofile', nargs='+', metavar='STAGE',
+                        choices=PIPELINE_STAGES,
+                        help="run these stages under cProfile and print the hottest functions")
+    parser.add_argument('--cprofile-dir', metavar='DIR',
+                        help="also dump .prof files for --cprofile stages into DIR")
+
+    args = parser.parse_args(argv)
+    if args.config:
+        parser.set_defaults(**load_config(args.config))
+        args = parser.parse_args(argv)
+    if args.distinct_error is not None:
+        try:
+            hll_precision_for_error(args.distinct_error)
+        except ValueError as e:
+            parser.error(f"--distinct-error: {e}")
+    return args
+def resolve_filters(args):
+    """
+    Uses the filter options when any is given (or --no-prompt is set),
+    otherwise asks interactively.
+    Returns: tuple (region, min_amount, max_amount), or None for no filtering
+    """
+
+    if args.no_prompt or args.region or args.min_amount is not None or args.max_amount is not None:
+        if args.region or args.min_amount is not None or args.max_amount is not None:
+            return args.region, args.min_amount, args.max_amount
+        return None
+    return prompt_filters()
+def build_dedup(args):
+    """
+    Returns: DuplicateFilter for the --dedup options, or None without --dedup
+    """
+
+    if not args.dedup:
+        return None
+    return DuplicateFilter(args.dedup, args.dedup_mode, args.dedup_memory_mb)
+def expand_inputs(patterns):
+    """
+    Expands file names and glob patterns, keeping the given order and
+    dropping duplicates.
+    Returns: list of file paths
+    """
 
-def main():
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            print(f"Warning: no files match '{pattern}'")
+        for path in matches:
+            if path not in files:
+                files.append(path)
+    return files
+def plan_batch_dedup(files, dedup, paise=False):
+    """
+    Counts the TransactionIDs of the valid rows of every file up front, so
+    that dedup resolves duplicates across the whole batch rather than
+    within each file (see DuplicateFilter.plan()).
+    Returns: number of repeated TransactionIDs
+    """
+
+    def id_pass():
+        for path in files:
+            parsed = iter_transactions(iter_sales_lines(path), paise=paise)
+            for t in iter_valid_transactions(parsed, paise=paise):
+                yield t['TransactionID']
+
+    return dedup.plan(id_pass)
+def process_sales_file(path, args, dedup=None):
+    """
+    Reads, parses, validates, filters and aggregates one sales file
+    without prompting. dedup is the batch's DuplicateFilter, if any.
+    Returns: tuple (transactions, invalid_count, filter_summary, aggregates)
+    """
+
+    filters = (args.region, args.min_amount, args.max_amount)
+
+    if dedup is not None:
+        # Duplicates are resolved among the valid rows, before filtering and
+        # aggregating, so worker aggregates would go unused
+        parsed = iter_transactions(iter_sales_lines(path), paise=args.paise)
+        transactions, invalid_count, summary = validate_and_filter(parsed, *filters, args.paise, dedup)
+        aggregates = aggregate_transactions(transactions, args.distinct_error, args.paise)
+        return transactions, invalid_count, summary, aggregates
+
+    if args.workers > 1:
+        result = parallel_process_sales_data(path, args.workers, *filters, distinct_error=args.distinct_error,
+                                             paise=args.paise, keep_rows=True)
+        return result['transactions'], result['invalid_count'], result['filter_summary'], result['aggregates']
+
+    counters = new_filter_counters()
+    parsed = iter_transactions(iter_sales_lines(path), paise=args.paise)
+    transactions = list(iter_valid_transactions(parsed, *filters, counters, args.paise))
+    aggregates = aggregate_transactions(transactions, args.distinct_error, args.paise)
+    return transactions, counters['invalid'], build_filter_summary(counters, *filters), aggregates
+def write_file_outputs(path, enriched_transactions, aggregates, enrichment_summary, filter_summary, rfm_state,
+                       report_file, enriched_file, args, rfm_skipped=None):
+    """
+    Writes the enriched data and report for one file (runs on the I/O thread).
+    """
+
+    save_enriched_data(enriched_transactions, enriched_file, file_format=args.enriched_format, paise=args.paise)
+    generate_sales_report(enriched_transactions, enriched_transactions, report_file,
+                          aggregates=aggregates, enrichment_summary=enrichment_summary, filter_summary=filter_summary,
+                          rfm_state=rfm_state, rfm_skipped=rfm_skipped)
+def run_batch(args, profiler):
+    """
+    Processes every input file without prompting.
+    The catalog is fetched on a background thread while the first file is
+    parsed (see CatalogFetch), and each file's enriched data and report are written on that
+    thread while the next file is parsed. Writes a per-file report and
+    enriched file into --output-dir plus one combined report.
+    """
+
+    files = expand_inputs(args.input)
+    if not files:
+        print("Error: no input files to process.")
+        return
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    combined_report = args.combined_report or os.path.join(args.output_dir, 'combined_report.txt')
+    enriched_suffix = '.cols' if args.enriched_format == 'binary' else '.txt'
+
+    combined = aggregate_transactions([], args.distinct_error, args.paise)
+    combined_enrichment = new_enrichment_summary()
+    combined_summary = {'duplicates': 0}
+    # Without a memory ceiling, RFM state is kept for the combined report
+    rfm_skipped = RFM_SPILL_NOTE if args.customer_memory_mb is not None else None
+    combined_rfm = new_rfm_state(args.paise) if rfm_skipped is None else None
+    used_names = set()
+    if rfm_skipped:
+        print("Note: batch aggregates keep customers in memory; --customer-memory-mb only leaves out RFM and "
+              "cohorts.\n")
+
+    catalog = CatalogFetch(profiler, args.catalog_ttl)
+    dedup = build_dedup(args)
+    if dedup is not None:
+        print(f"Checking {len(files)} files for duplicate TransactionIDs ...")
+        profiler.begin('validate')
+        repeated = plan_batch_dedup(files, dedup, args.paise)
+        profiler.end('validate')
+        print(f"✓ {repeated} TransactionIDs occur more than once\n")
+        if args.workers > 1:
+            print("Note: with --dedup rows are aggregated after duplicates are dropped, so files are processed "
+                  "without --workers.\n")
+
+    with ThreadPoolExecutor(max_workers=1) as io_pool:
+        pending = []
+
+        for i, path in enumerate(files, start=1):
+            print(f"[{i}/{len(files)}] Processing {path} ...")
+            profiler.begin('read')
+            transactions, invalid_count, summary, aggregates = process_sales_file(path, args, dedup)
+            profiler.end('read', rows=summary['total_input'])
+            merge_aggregates(combined, aggregates)
+            rfm_state = None
+            if combined_rfm is not None:
+                rfm_state = build_rfm_state(transactions, args.paise)
+                merge_rfm_state(combined_rfm, rfm_state)
+            combined_summary['duplicates'] += summary['duplicates']
+            duplicates = f" | Duplicates: {summary['duplicates']}" if args.dedup else ""
+            print(f"✓ Valid: {summary['final_count']} | Invalid: {invalid_count}{duplicates} | "
+                  f"Revenue: {format_inr(aggregates['total_revenue'], args.paise)}")
+
+            profiler.begin('fetch_wait')
+            _, product_mapping = catalog.result(args.catalog_timeout)
+            profiler.end('fetch_wait', rows=len(product_mapping))
+
+            profiler.begin('enrich')
+            enrichment_summary = new_enrichment_summary()
+            enriched_transactions = enrich_sales_data(transactions, product_mapping, summary=enrichment_summary)
+            profiler.end('enrich', rows=len(enriched_transactions))
+            for key in ('matched', 'unmatched'):
+                combined_enrichment[key] += enrichment_summary[key]
+            combined_enrichment['unmatched_products'] = list(dict.fromkeys(
+                combined_enrichment['unmatched_products'] + enrichment_summary['unmatched_products']))
+
+            name = os.path.splitext(os.path.basename(path))[0]
+            if name in used_names:
+                name = f"{name}_{i}"
+            used_names.add(name)
+
+            pending.append(io_pool.submit(
+                write_file_outputs, path, enriched_transactions, aggregates, enrichment_summary, summary, rfm_state,
+                os.path.join(args.output_dir, f"{name}_report.txt"),
+                os.path.join(args.output_dir, f"{name}_enriched{enriched_suffix}"),
+                args, rfm_skipped
+            ))
+            # Keep at most one file's output waiting to be written
+            while len(pending) > 1:
+                pending.pop(0).result()
+
+        for future in pending:
+            future.result()
+
+    generate_sales_report(None, None, combined_report, aggregates=combined, enrichment_summary=combined_enrichment,
+                          filter_summary=combined_summary, rfm_state=combined_rfm, rfm_skipped=rfm_skipped)
+    print(f"\n✓ Processed {len(files)} files; combined report saved to: {combined_report}")
+def prompt_filters():
+    """
+    Asks whether to filter and for the filter values.
+    Returns: tuple (region, min_amount, max_amount), or None for no filtering
+    """
+
+    choice = input("Do you want to filter data? (y/n): ").strip().lower()
+    if choice != 'y':
+        return None
+
+    region = input("Enter region (or leave blank): ").strip() or None
+    min_amount = input("Enter minimum amount (or leave blank): ").strip()
+    max_amount = input("Enter maximum amount (or leave blank): ").strip()
+    min_amount = float(min_amount) if min_amount else None
+    max_amount = float(max_amount) if max_amount else None
+
+    return region, min_amount, max_amount
+def main(argv=None):
+    args = parse_args(argv)
     print("SALES ANALYTICS SYSTEM\n")
 
+    if args.serve:
+        if args.input and len(args.input) > 1:
+            print("Error: --serve takes a single input file.")
+            return
+        filename = args.input[0] if args.input else "data/sales_data.txt"
+        try:
+            serve(filename, args.host, args.port, args.paise, args.distinct_error, args.cache_size)
+        except Exception as e:
+            print(f"Error: {e}")
+        return
+
+    profiler = PipelineProfiler(
+        trace_memory=args.trace_memory,
+        cprofile_stages=args.cprofile or (),
+        cprofile_dir=args.cprofile_dir
+    ).activate()
+
+    if args.input:
+        try:
+            run_batch(args, profiler)
+        except Exception as e:
+            print(f"Error: {e}")
+        finally:
+            profiler.deactivate()
+            print("\nPIPELINE TIMINGS")
+            print(profiler.format_table())
+            if args.timings_json:
+                profiler.write_json(args.timings_json)
+        return
+
+    # Network latency overlaps with steps 1-5; enrichment waits for it
+    catalog = CatalogFetch(profiler, args.catalog_ttl)
+
     try:
-        # [1] Read sales data
-        print("[1/10] Reading sales data ...")
-        raw_lines = read_sales_data("data/sales_data.txt")
-        print(f"✓ Successfully read {len(raw_lines)} transactions\n")
-
-        # [2] Parse and clean data
-        print("[2/10] Parsing and cleaning data ...")
-        transactions = parse_transactions(raw_lines)
-        print(f"✓ Parsed {len(transactions)} records\n")
-
-        # [3] Filter options
-        print("[3/10] Filter Options Available:")
-        regions = set(t['Region'] for t in transactions if t['Region'])
-        amounts = [t['Quantity'] * t['UnitPrice'] for t in transactions]
-        print(f"Regions: {', '.join(regions)}")
-        print(f"Amount Range: ₹{min(amounts):,.0f} - ₹{max(amounts):,.0f}\n")
-
-        choice = input("Do you want to filter data? (y/n): ").strip().lower()
-        if choice == 'y':
-            region = input("Enter region (or leave blank): ").strip() or None
-            min_amount = input("Enter minimum amount (or leave blank): ").strip()
-            max_amount = input("Enter maximum amount (or leave blank): ").strip()
-            min_amount = float(min_amount) if min_amount else None
-            max_amount = float(max_amount) if max_amount else None
-
-            transactions, invalid_count, summary = validate_and_filter(transactions, region, min_amount, max_amount)
+        aggregates = None
+        rfm_state = None
+        state = None
+        summary = None
+        dedup = build_dedup(args)
+
+        if args.incremental:
+            # [1] + [2] Read and parse only what was appended since the last run
+            print("[1/10] Reading new sales data ...")
+            profiler.begin('read')
+            state, transactions, full_rebuild = update_state("data/sales_data.txt", args.state_file, args.distinct_error,
+                                                             args.paise)
+            counters = state['counters']
+            profiler.end('read', rows=len(transactions))
+            print(f"✓ {'Rebuilt state from' if full_rebuild else 'Read'} {len(transactions)} new valid transactions "
+                  f"({counters['total_input']} in total)\n")
+
+            print("[2/10] Parsing and cleaning data ...")
+            print(f"✓ Parsed {counters['total_input']} records\n")
+
+            # [3] Incremental state always covers the unfiltered data
+            print("[3/10] Filter Options Available:")
+            print(f"Regions: {', '.join(state['aggregates']['regions'])}")
+            print("Filtering is not available in incremental mode.\n")
+            if dedup is not None:
+                print("Note: duplicate detection is not applied in incremental mode.\n")
+            if args.customer_memory_mb is not None:
+                print("Note: customers are kept in the saved state in incremental mode.\n")
+
+            invalid_count = counters['invalid']
+            aggregates = state['aggregates']
+            rfm_state = state['rfm']
+        elif args.workers > 1:
+            # [1] + [2] Read, parse and validate in worker processes
+            print(f"[1/10] Reading sales data with {args.workers} workers ...")
+            profiler.begin('read')
+            result = parallel_process_sales_data("data/sales_data.txt", args.workers,
+                                                 distinct_error=args.distinct_error, paise=args.paise, keep_rows=True,
+                                                 track_customers=args.customer_memory_mb is None)
+            profiler.end('read', rows=result['filter_summary']['total_input'])
+            print(f"✓ Successfully read {result['filter_summary']['total_input']} transactions\n")
+
+            print("[2/10] Parsing and cleaning data ...")
+            print(f"✓ Parsed {result['filter_summary']['total_input']} records\n")
+
+            # [3] Filter options
+            print("[3/10] Filter Options Available:")
+            options = result['filter_options']
+            print(f"Regions: {', '.join(options['regions'])}")
+            print(f"Amount Range: {format_inr(options['min_amount'], args.paise, 0)} - "
+                  f"{format_inr(options['max_amount'], args.paise, 0)}\n")
+
+            transactions = result['transactions']
+            invalid_count = result['invalid_count']
+            filters = resolve_filters(args)
+            if filters or dedup is not None:
+                # Rows are already valid; only duplicates and the filters still apply
+                profiler.begin('validate')
+                query = TransactionQuery(transactions, validated=True, paise=args.paise, dedup=dedup)
+                transactions, _, summary = query.filter(*(filters or ()))
+                profiler.end('validate', rows=summary['total_input'])
+            else:
+                aggregates = result['aggregates']
+                rfm_state = result['rfm']
         else:
-            transactions, invalid_count, summary = validate_and_filter(transactions)
+            if args.binary_cache:
+                # [1] + [2] Map previously parsed columns; parse only if the file changed
+                print("[1/10] Reading sales data ...")
+                profiler.begin('read')
+                transactions, from_cache = load_or_parse("data/sales_data.txt", paise=args.paise)
+                profiler.end('read', rows=len(transactions))
+                source = "columnar cache" if from_cache else "text, cache refreshed"
+                print(f"✓ Successfully read {len(transactions)} transactions ({source})\n")
+
+                print("[2/10] Parsing and cleaning data ...")
+                print(f"✓ Parsed {len(transactions)} records\n")
+            else:
+                # [1] Read sales data
+                print("[1/10] Reading sales data ...")
+                profiler.begin('read')
+                raw_lines = read_sales_data("data/sales_data.txt")
+                profiler.end('read', rows=len(raw_lines))
+                print(f"✓ Successfully read {len(raw_lines)} transactions\n")
+
+                # [2] Parse and clean data
+                print("[2/10] Parsing and cleaning data ...")
+                profiler.begin('parse')
+                parse_counters = new_parse_counters()
+                transactions = parse_transactions(raw_lines, parse_counters, args.paise)
+                profiler.end('parse', rows=len(transactions))
+                print(f"✓ Parsed {len(transactions)} records{format_rejects(parse_counters)}\n")
+
+            # [3] Filter options
+            print("[3/10] Filter Options Available:")
+            regions = set(t['Region'] for t in transactions if t['Region'])
+            amounts = [t['Quantity'] * t['UnitPrice'] for t in transactions]
+            print(f"Regions: {', '.join(regions)}")
+            print(f"Amount Range: {format_inr(min(amounts), args.paise, 0)} - "
+                  f"{format_inr(max(amounts), args.paise, 0)}\n")
+
+            filters = resolve_filters(args)
+            profiler.begin('validate')
+            query = TransactionQuery(transactions, paise=args.paise, dedup=dedup)
+            transactions, invalid_count, summary = query.filter(*(filters or ()))
+            profiler.end('validate', rows=summary['total_input'])
 
         # [4] Validation summary
         print("[4/10] Validating transactions ...")
-        print(f"✓ Valid: {len(transactions)} | Invalid: {invalid_count}\n")
+        valid_count = aggregates['transaction_count'] if state else len(transactions)
+        duplicates = f" | Duplicates: {summary['duplicates']}" if dedup is not None and summary else ""
+        print(f"✓ Valid: {valid_count} | Invalid: {invalid_count}{duplicates}\n")
 
         # [5] Data analysis
         print("[5/10] Analyzing sales data ...")
-        total_revenue = calculate_total_revenue(transactions)
-        print(f"✓ Total Revenue: ₹{total_revenue:,.2f}\n")
+        profiler.begin('analyze')
+        spill_customers = args.customer_memory_mb is not None and state is None
+        if aggregates is None:
+            aggregates = aggregate_transactions(transactions, args.distinct_error, args.paise,
+                                                track_customers=not spill_customers)
+        rfm_skipped = None
+        if spill_customers:
+            # RFM scores rank every customer against all others, which
+            # needs the per-customer state the ceiling keeps out of memory
+            rfm_skipped = RFM_SPILL_NOTE
+        elif rfm_state is None:
+            rfm_state = build_rfm_state(transactions, args.paise)
+        customer_stats = None
+        if spill_customers:
+            spill_stats = new_spill_stats()
+            customer_stats = partitioned_customer_analysis(transactions, 5, args.customer_memory_mb,
+                                                           stats=spill_stats)
+        total_revenue = calculate_total_revenue(aggregates)
+        profiler.end('analyze', rows=aggregates['transaction_count'])
+        print(f"✓ Total Revenue: {format_inr(total_revenue, args.paise)}")
+        if spill_customers:
+            print(f"✓ {spill_stats['customers']} customers aggregated out of core "
+                  f"({spill_stats['partitions']} partitions, {spill_stats['resplits']} re-split)")
+        print()
 
         # [6] Fetch products from API
         print("[6/10] Fetching product data from API ...")
-        api_products = fetch_all_products()
-        print(f"✓ Fetched {len(api_products)} products\n")
+        profiler.begin('fetch_wait')
+        api_products, product_mapping = catalog.result(args.catalog_timeout)
+        waited = profiler.end('fetch_wait', rows=len(api_products))['wall_s']
+        metrics = get_cache_metrics()
+        print(f"✓ Fetched {len(api_products)} products "
+              f"(cache hits: {metrics['hits']}, misses: {metrics['misses']}, "
+              f"revalidated: {metrics['revalidated']}, stale: {metrics['stale_served']})")
+        if catalog.elapsed is not None:
+            print(f"✓ Fetch took {catalog.elapsed:.2f}s in the background; waited {waited:.2f}s for it\n")
+        else:
+            print()
 
         # [7] Enrich sales data
         print("[7/10] Enriching sales data ...")
-        product_mapping = create_product_mapping(api_products)
-        enriched_transactions = enrich_sales_data(transactions, product_mapping)
-        enriched_count = sum(1 for t in enriched_transactions if t['API_Match'])
-        print(f"✓ Enriched {enriched_count}/{len(enriched_transactions)} transactions\n")
+        profiler.begin('enrich')
+        enrichment_summary = new_enrichment_summary()
+        enriched_transactions = enrich_sales_data(transactions, product_mapping, summary=enrichment_summary)
+        profiler.end('enrich', rows=len(enriched_transactions))
+        print(f"✓ Enriched {enrichment_summary['matched']}/{len(enriched_transactions)} transactions\n")
+        if state is not None:
+            merge_enrichment_summary(state, enrichment_summary)
+            enrichment_summary = state['enrichment']
 
         # [8] Save enriched data
         print("[8/10] Saving enriched data ...")
-        save_enriched_data(enriched_transactions)
-        print("✓ Saved to: data/enriched_sales_data.txt\n")
+        enriched_file = "data/enriched_sales_data.cols" if args.enriched_format == 'binary' else "data/enriched_sales_data.txt"
+        profiler.begin('save')
+        save_enriched_data(enriched_transactions, enriched_file, append=state is not None and not full_rebuild,
+                           file_format=args.enriched_format, paise=args.paise)
+        profiler.end('save', rows=len(enriched_transactions))
+        print(f"✓ Saved to: {enriched_file}\n")
 
         # [9] Generate report
         print("[9/10] Generating report ...")
-        generate_sales_report(transactions, enriched_transactions)
+        profiler.begin('report')
+        generate_sales_report(transactions, enriched_transactions, aggregates=aggregates,
+                              enrichment_summary=enrichment_summary, filter_summary=summary,
+                              customer_stats=customer_stats, rfm_state=rfm_state, rfm_skipped=rfm_skipped)
+        profiler.end('report', rows=aggregates['transaction_count'])
         print("✓ Report saved to: output/sales_report.txt\n")
 
+        if state is not None:
+            save_state(state, args.state_file)
+
         # [10] Complete
         print("[10/10] Process Complete!")
 
     except Exception as e:
         print(f"Error: {e}")
 
+    finally:
+        profiler.deactivate()
+        print("\nPIPELINE TIMINGS")
+        print(profiler.format_table())
+        if args.timings_json:
+            profiler.write_json(args.timings_json)
+            print(f"Timings saved to {args.timings_json}")
+
 
 if __name__ == "__main__":
     main()
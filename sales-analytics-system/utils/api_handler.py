@@ -1,24 +1,161 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.file_handler import atomic_open, write_lines_batched
+from utils.transaction_table import TransactionTable, BASE_FIELDS
+from utils.binary_cache import save_table, load_table, read_manifest
+from utils.money import paise_text
+from utils.catalog_cache import (
+    CATALOG_CACHE_FILE,
+    CATALOG_CACHE_TTL,
+    load_cached_catalog,
+    save_cached_catalog,
+    is_fresh,
+    record_cache_event
+)
+
+PRODUCTS_URL = "https://dummyjson.com/products"
+PAGE_SIZE = 100
+MAX_PARALLEL_REQUESTS = 8
+MAX_RETRIES = 3
+REQUEST_TIMEOUT = 10  # seconds
+CATALOG_DEADLINE = 60  # seconds enrichment waits for a background catalog fetch
+
+def create_session(max_parallel=MAX_PARALLEL_REQUESTS, retries=MAX_RETRIES):
+    """
+    Creates a requests.Session with a connection pool sized for
+    max_parallel concurrent requests, retrying connection errors and
+    429/5xx responses with exponential backoff.
+    Returns: requests.Session
+    """
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET']
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_parallel, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+def _fetch_page(session, url, skip, limit, timeout):
+    """
+    Fetches one page of products.
+    Returns: list of product dictionaries
+    """
 
-def fetch_all_products():
+    response = session.get(url, params={'skip': skip, 'limit': limit}, timeout=timeout)
+    response.raise_for_status()
+    return response.json().get('products', [])
+def _fetch_range(session, url, skip, count, timeout):
+    """
+    Fetches count products starting at skip. A short page (e.g. the
+    server capped the limit, or dropped items) is followed by a request
+    for the rest, until an empty page shows nothing more is coming.
+    Returns: list of product dictionaries (shorter than count only if the
+    server stopped returning products)
+    """
+
+    products = []
+    while len(products) < count:
+        page = _fetch_page(session, url, skip + len(products), count - len(products), timeout)
+        if not page:
+            break
+        products.extend(page)
+    return products[:count]
+def fetch_all_products(url=PRODUCTS_URL, cache_file=CATALOG_CACHE_FILE, ttl=CATALOG_CACHE_TTL, timeout=REQUEST_TIMEOUT,
+                       page_size=PAGE_SIZE, max_parallel=MAX_PARALLEL_REQUESTS, retries=MAX_RETRIES):
     """
     Fetches all products from DummyJSON API.
+    The first page gives the catalog 'total'; the remaining pages are
+    fetched through skip/limit with up to max_parallel requests in flight
+    over a pooled session, and put together in page order. Short pages
+    are re-requested; a catalog still short of 'total' is reported as
+    incomplete and not cached.
+    The catalog is cached in cache_file for ttl seconds. After that it is
+    revalidated with If-None-Match/If-Modified-Since on the first page
+    (whose body carries 'total', so it changes whenever the catalog grows),
+    and if the API is unreachable the stale copy is used instead of an
+    empty catalog. Pass cache_file=None to always download.
     Returns: list of product dictionaries.
     """
 
-    url = "https://dummyjson.com/products?limit=100"
+    cached = load_cached_catalog(cache_file, url) if cache_file else None
+
+    if cached is not None and is_fresh(cached, ttl):
+        record_cache_event('hits')
+        print(f"Loaded {len(cached['products'])} products from catalog cache.")
+        return cached['products']
+
+    headers = {}
+    if cached is None:
+        # Counted before the download, so failed downloads count too
+        record_cache_event('misses')
+    else:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
 
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise error if request failed
-        data = response.json()
+        with create_session(max_parallel, retries) as session:
+            response = session.get(url, params={'skip': 0, 'limit': page_size}, headers=headers, timeout=timeout)
+
+            if response.status_code == 304 and cached is not None:
+                record_cache_event('revalidated')
+                save_cached_catalog(cache_file, url, cached['products'],
+                                    response.headers.get('ETag', cached.get('etag')),
+                                    response.headers.get('Last-Modified', cached.get('last_modified')))
+                print(f"Catalog not modified; using {len(cached['products'])} cached products.")
+                return cached['products']
+
+            response.raise_for_status()  # Raise error if request failed
+            data = response.json()
+            if cached is not None:
+                # The catalog changed since it was cached
+                record_cache_event('misses')
+
+            products = data.get('products', [])
+            total = data.get('total', len(products))
+
+            # The server may cap limit, so step by what the first page returned
+            step = len(products)
+            if step and total > step:
+                skips = range(step, total, step)
+                with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+                    # map() yields pages in skip order, whichever finishes first
+                    pages = executor.map(
+                        lambda skip: _fetch_range(session, url, skip, min(step, total - skip), timeout), skips
+                    )
+                    for page in pages:
+                        products.extend(page)
+
+        if len(products) < total:
+            # Not cached, so the next run tries again
+            print(f"Warning: incomplete product catalog; received {len(products)} of {total} products.")
+            return products
 
-        products = data.get('products', [])
+        if cache_file:
+            save_cached_catalog(cache_file, url, products,
+                                response.headers.get('ETag'), response.headers.get('Last-Modified'))
         print(f"Successfully fetched {len(products)} products from API.")
         return products
 
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         print(f"Error fetching products: {e}")
+        if cached is not None:
+            record_cache_event('stale_served')
+            print(f"Using {len(cached['products'])} stale products from catalog cache.")
+            return cached['products']
         return []
 def create_product_mapping(api_products):
     """
@@ -45,58 +182,259 @@ def create_product_mapping(api_products):
             }
 
     return product_mapping
-def enrich_sales_data(transactions, product_mapping):
+
+
+class CatalogFetch:
+    """
+    Fetches the product catalog and builds the product mapping on a
+    background thread, so network latency overlaps with reading, parsing
+    and aggregating the sales data. With a profiler the 'fetch' stage is
+    recorded on that thread; its start time and duration next to the other
+    stages show the overlap.
+    """
+
+    def __init__(self, profiler=None, ttl=CATALOG_CACHE_TTL):
+        self.profiler = profiler
+        self.ttl = ttl
+        self.products = []
+        self.mapping = {}
+        self.elapsed = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='catalog-fetch', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        started = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.begin('fetch')
+        try:
+            self.products = fetch_all_products(ttl=self.ttl)
+            self.mapping = create_product_mapping(self.products)
+        except Exception as e:
+            print(f"Error fetching products: {e}")
+        finally:
+            if self.profiler is not None:
+                self.profiler.end('fetch', rows=len(self.products))
+            self.elapsed = time.perf_counter() - started
+            self.done.set()
+
+    def result(self, timeout=CATALOG_DEADLINE):
+        """
+        Waits up to timeout seconds for the fetch to finish.
+        Returns: tuple (products, product_mapping); both are empty when the
+        deadline passes, so enrichment goes ahead without matches
+        """
+
+        if not self.done.wait(timeout):
+            print(f"Product catalog not ready after {timeout:g}s; continuing without it.")
+            return [], {}
+        return self.products, self.mapping
+
+
+ENRICHMENT_FIELDS = ['API_Category', 'API_Brand', 'API_Rating', 'API_Match']
+
+def new_enrichment_summary():
+    """
+    Creates the summary filled in by enrich_sales_data().
+    Format:
+    {
+        'matched': 0,              # transactions found in the catalog
+        'unmatched': 0,            # transactions not found
+        'unmatched_products': []   # each unmatched ProductName once, in first-seen order
+    }
+    """
+
+    return {'matched': 0, 'unmatched': 0, 'unmatched_products': []}
+def build_enrichment_index(product_ids, product_mapping):
+    """
+    Resolves each distinct ProductID against the product mapping once.
+    Returns: dictionary mapping ProductID to its enrichment fields
+    {'P101': {'API_Category': ..., 'API_Brand': ..., 'API_Rating': ..., 'API_Match': True}, ...}
+    """
+
+    no_match = {'API_Category': None, 'API_Brand': None, 'API_Rating': None, 'API_Match': False}
+    index = {}
+
+    for product_id in product_ids:
+        if product_id in index:
+            continue
+        try:
+            # Extract numeric ID from ProductID (e.g., P101 -> 101)
+            api_info = product_mapping.get(int(product_id[1:]))
+        except Exception:
+            api_info = None
+
+        if api_info is None:
+            index[product_id] = no_match
+        else:
+            index[product_id] = {
+                'API_Category': api_info.get('category'),
+                'API_Brand': api_info.get('brand'),
+                'API_Rating': api_info.get('rating'),
+                'API_Match': True
+            }
+
+    return index
+def enrich_sales_data(transactions, product_mapping, copy=False, summary=None):
     """
     Enriches transaction data with API product information.
+    Each distinct ProductID is looked up once and joined onto every row.
+    By default rows are updated in place; pass copy=True to leave the input
+    untouched and get new dictionaries back. Pass a dictionary from
+    new_enrichment_summary() as summary to collect match/miss counts.
+    A TransactionTable is enriched column-wise and returned as a table.
     Returns: list of enriched transaction dictionaries.
     """
 
+    if summary is None:
+        summary = new_enrichment_summary()
+
+    if isinstance(transactions, TransactionTable):
+        return _enrich_table(transactions, product_mapping, copy, summary)
+
+    index = build_enrichment_index((t.get('ProductID') for t in transactions), product_mapping)
     enriched_transactions = []
+    unmatched_products = dict.fromkeys(summary['unmatched_products'])
 
     for t in transactions:
-        try:
-            # Extract numeric ID from ProductID (e.g., P101 -> 101)
-            numeric_id = int(t['ProductID'][1:])
-
-            if numeric_id in product_mapping:
-                api_info = product_mapping[numeric_id]
-                t['API_Category'] = api_info.get('category')
-                t['API_Brand'] = api_info.get('brand')
-                t['API_Rating'] = api_info.get('rating')
-                t['API_Match'] = True
-            else:
-                t['API_Category'] = None
-                t['API_Brand'] = None
-                t['API_Rating'] = None
-                t['API_Match'] = False
+        enrichment = index[t.get('ProductID')]
+        if copy:
+            t = dict(t)
+        t.update(enrichment)
 
-        except Exception:
-            t['API_Category'] = None
-            t['API_Brand'] = None
-            t['API_Rating'] = None
-            t['API_Match'] = False
+        if enrichment['API_Match']:
+            summary['matched'] += 1
+        else:
+            summary['unmatched'] += 1
+            unmatched_products[t['ProductName']] = None
 
         enriched_transactions.append(t)
 
+    summary['unmatched_products'] = list(unmatched_products)
     return enriched_transactions
+def _enrich_table(table, product_mapping, copy, summary):
+    """
+    Enriches a TransactionTable by joining per-code enrichment onto
+    whole columns.
+    Returns: TransactionTable
+    """
+
+    if copy:
+        table = table.take(range(len(table)))
+
+    product_ids = table.values['ProductID']
+    index = build_enrichment_index(product_ids, product_mapping)
+    by_code = [index[product_id] for product_id in product_ids]
+    codes = table.codes['ProductID']
 
+    for field in ENRICHMENT_FIELDS:
+        column_values = [enrichment[field] for enrichment in by_code]
+        table.extra_columns[field] = [column_values[code] for code in codes]
 
-def save_enriched_data(enriched_transactions, filename='data/enriched_sales_data.txt'):
+    names = table.values['ProductName']
+    unmatched_products = dict.fromkeys(summary['unmatched_products'])
+    for code, name_code in zip(codes, table.codes['ProductName']):
+        if by_code[code]['API_Match']:
+            summary['matched'] += 1
+        else:
+            summary['unmatched'] += 1
+            unmatched_products[names[name_code]] = None
+    summary['unmatched_products'] = list(unmatched_products)
+
+    return table
+
+
+def format_enriched_rows(enriched_transactions, paise=False):
+    """
+    Formats enriched transactions as pipe-delimited lines (no newlines).
+    A TransactionTable is formatted column-wise without building row views.
+    Paise prices (paise=True, or a paise table) are written in rupees,
+    exactly as the same price parsed as a float would be.
+    Yields: strings
+    """
+
+    if isinstance(enriched_transactions, TransactionTable):
+        table = enriched_transactions
+        columns = []
+        for field in BASE_FIELDS:
+            if field in table.codes:
+                # Format each distinct value once, then index by code
+                formatted = [str(value) for value in table.values[field]]
+                columns.append([formatted[code] for code in table.codes[field]])
+            elif field == 'UnitPrice' and table.paise:
+                columns.append(map(paise_text, table.unit_price))
+            else:
+                columns.append(map(str, table.column(field)))
+        for field in ENRICHMENT_FIELDS:
+            columns.append(map(str, table.extra_columns.get(field, [None] * len(table))))
+        yield from map('|'.join, zip(*columns))
+        return
+
+    price = paise_text if paise else str
+    for t in enriched_transactions:
+        yield f"{t['TransactionID']}|{t['Date']}|{t['ProductID']}|{t['ProductName']}|{t['Quantity']}|{price(t['UnitPrice'])}|{t['CustomerID']}|{t['Region']}|{t['API_Category']}|{t['API_Brand']}|{t['API_Rating']}|{t['API_Match']}"
+def save_enriched_data(enriched_transactions, filename='data/enriched_sales_data.txt', append=False, file_format='text',
+                       atomic=True, paise=False):
     """
     Saves enriched transactions back to file in pipe-delimited format.
+    Rows are formatted and written in large batches. Unless atomic=False,
+    the file is written to a temporary name and renamed into place, so
+    readers never see a half-written file.
+    With append=True the rows are added to an existing file (the header is
+    only written if the file is new or empty); appends are not atomic.
+    With file_format='binary', filename is written as a columnar store
+    (see utils/binary_cache.py) that load_table() can memory-map.
+    Pass paise=True for transactions parsed in paise mode; text files are
+    then identical to those written from float prices.
     """
 
+    if file_format == 'binary':
+        _save_enriched_binary(enriched_transactions, filename, append, paise)
+        return
+
     header = "TransactionID|Date|ProductID|ProductName|Quantity|UnitPrice|CustomerID|Region|API_Category|API_Brand|API_Rating|API_Match"
 
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(header + "\n")
+        if append:
+            write_header = not os.path.exists(filename) or os.path.getsize(filename) == 0
+            opener = open(filename, 'a', encoding='utf-8')
+        else:
+            write_header = True
+            opener = atomic_open(filename) if atomic else open(filename, 'w', encoding='utf-8')
 
-            for t in enriched_transactions:
-                line = f"{t['TransactionID']}|{t['Date']}|{t['ProductID']}|{t['ProductName']}|{t['Quantity']}|{t['UnitPrice']}|{t['CustomerID']}|{t['Region']}|{t['API_Category']}|{t['API_Brand']}|{t['API_Rating']}|{t['API_Match']}"
-                f.write(line + "\n")
+        with opener as f:
+            if write_header:
+                f.write(header + "\n")
+            write_lines_batched(f, format_enriched_rows(enriched_transactions, paise))
 
         print(f"Enriched data saved to {filename}")
 
     except Exception as e:
         print(f"Error saving enriched data: {e}")
+def _save_enriched_binary(enriched_transactions, path, append, paise=False):
+    """
+    Writes enriched transactions as a columnar store, appending to an
+    existing store by rewriting it with the new rows added.
+    """
+
+    try:
+        if append and read_manifest(path) is not None:
+            existing = load_table(path)
+            if existing.paise != paise:
+                raise ValueError("cannot append to a store written in the other money mode")
+            table = existing.take(range(len(existing)))
+            for field in ENRICHMENT_FIELDS:
+                table.extra_columns.setdefault(field, [None] * len(table))
+            for t in enriched_transactions:
+                table.append(t)
+        elif isinstance(enriched_transactions, TransactionTable):
+            table = enriched_transactions
+        else:
+            table = TransactionTable.from_transactions(enriched_transactions, extra_fields=ENRICHMENT_FIELDS,
+                                                       paise=paise)
+
+        save_table(table, path)
+        print(f"Enriched data saved to {path}")
+
+    except Exception as e:
+        print(f"Error saving enriched data: {e}")
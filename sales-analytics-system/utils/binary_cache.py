@@ -0,0 +1,176 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+from array import array
+
+from utils.file_handler import iter_sales_lines, parse_transactions_table
+from utils.transaction_table import TransactionTable, ENCODED_FIELDS
+
+FORMAT_VERSION = 1
+CACHE_SUFFIX = '.cols'
+
+COLUMNS_FILE = 'columns.bin'
+STRINGS_FILE = 'strings.json'
+MANIFEST_FILE = 'manifest.json'
+
+# (attribute or code field, array typecode); every typecode is 4 or 8 bytes
+NUMERIC_COLUMNS = [('quantity', 'q'), ('unit_price', 'd'), ('amount', 'd')]
+PAISE_NUMERIC_COLUMNS = [('quantity', 'q'), ('unit_price', 'q'), ('amount', 'q')]
+
+
+def cache_path_for(filename):
+    """
+    Returns: path of the sidecar columnar cache for a sales file
+    """
+
+    return filename + CACHE_SUFFIX
+def source_key(filename):
+    """
+    Identifies the exact contents of a source file.
+    Returns: dictionary {'size': ..., 'mtime_ns': ..., 'sha256': ...}
+    """
+
+    stat = os.stat(filename)
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+def save_table(table, path, source=None):
+    """
+    Writes a TransactionTable as a columnar store in directory path:
+    columns.bin   - numeric and code columns back to back, 8-byte aligned
+    strings.json  - TransactionIDs, column dictionaries and extra columns
+    manifest.json - column offsets, row count and the optional source key
+    The store is built in a temporary directory and swapped in at the end,
+    so readers never see a partly written store.
+    """
+
+    final_path = path
+    path = f"{final_path}.{os.getpid()}.tmp"
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    numeric_columns = PAISE_NUMERIC_COLUMNS if table.paise else NUMERIC_COLUMNS
+    columns = [(name, typecode, getattr(table, name)) for name, typecode in numeric_columns]
+    columns += [(f'codes:{field}', 'i', table.codes[field]) for field in ENCODED_FIELDS]
+
+    layout = {}
+    offset = 0
+    with open(os.path.join(path, COLUMNS_FILE), 'wb') as f:
+        for name, typecode, column in columns:
+            data = array(typecode, column).tobytes()
+            layout[name] = {'typecode': typecode, 'offset': offset, 'nbytes': len(data)}
+            f.write(data)
+            offset += len(data)
+            padding = -offset % 8
+            f.write(b'\0' * padding)
+            offset += padding
+
+    with open(os.path.join(path, STRINGS_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            'transaction_ids': list(table.transaction_ids),
+            'values': table.values,
+            'extra_columns': table.extra_columns
+        }, f)
+
+    with open(os.path.join(path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': FORMAT_VERSION,
+            'rows': len(table),
+            'paise': table.paise,
+            'columns': layout,
+            'source': source
+        }, f)
+
+    # Directories cannot be replaced in one step, so move the old one aside first
+    old_path = f"{final_path}.{os.getpid()}.old"
+    if os.path.isdir(final_path):
+        os.rename(final_path, old_path)
+    os.rename(path, final_path)
+    if os.path.isdir(old_path):
+        shutil.rmtree(old_path)
+def read_manifest(path):
+    """
+    Returns: manifest dictionary of a columnar store, or None if missing
+    or written by another format version
+    """
+
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != FORMAT_VERSION:
+        return None
+    return manifest
+def load_table(path, manifest=None):
+    """
+    Opens a columnar store written by save_table().
+    Numeric and code columns are memory-mapped copy-on-write and exposed
+    as typed memoryviews, so nothing is parsed or copied up front and
+    edits never reach the file. The returned table cannot grow (append()
+    is not supported on mapped columns).
+    Returns: TransactionTable
+    """
+
+    manifest = manifest or read_manifest(path)
+    if manifest is None:
+        raise ValueError(f"'{path}' is not a columnar transaction store")
+
+    with open(os.path.join(path, STRINGS_FILE), 'r', encoding='utf-8') as f:
+        strings = json.load(f)
+
+    table = TransactionTable(manifest.get('paise', False))
+    table.transaction_ids = strings['transaction_ids']
+    table.values = strings['values']
+    table.lookup = {field: {value: code for code, value in enumerate(values)}
+                    for field, values in table.values.items()}
+    table.extra_columns = strings['extra_columns']
+
+    buffer = None
+    if os.path.getsize(os.path.join(path, COLUMNS_FILE)) > 0:
+        with open(os.path.join(path, COLUMNS_FILE), 'rb') as f:
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))
+
+    for name, spec in manifest['columns'].items():
+        if buffer is None:
+            column = array(spec['typecode'])
+        else:
+            column = buffer[spec['offset']:spec['offset'] + spec['nbytes']].cast(spec['typecode'])
+        if name.startswith('codes:'):
+            table.codes[name[len('codes:'):]] = column
+        else:
+            setattr(table, name, column)
+
+    return table
+def load_or_parse(filename, cache_path=None, verify_hash=True, paise=False):
+    """
+    Returns the parsed transactions of a sales file as a TransactionTable,
+    from the sidecar columnar cache when it matches the file's size, mtime
+    and (unless verify_hash=False) sha256 and was built in the same money
+    mode (paise), otherwise by parsing the text and refreshing the cache.
+    Returns: tuple (table, from_cache)
+    """
+
+    cache_path = cache_path or cache_path_for(filename)
+    manifest = read_manifest(cache_path)
+    stat = os.stat(filename)
+
+    if manifest is not None and manifest.get('source') and manifest.get('paise', False) == paise:
+        cached = manifest['source']
+        if cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            if not verify_hash or source_key(filename)['sha256'] == cached['sha256']:
+                return load_table(cache_path, manifest), True
+
+    table = parse_transactions_table(iter_sales_lines(filename), paise=paise)
+    try:
+        save_table(table, cache_path, source_key(filename))
+    except OSError as e:
+        print(f"Warning: could not write columnar cache: {e}")
+
+    return table, False
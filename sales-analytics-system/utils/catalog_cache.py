@@ -0,0 +1,90 @@
+import json
+import os
+import time
+
+from utils.file_handler import atomic_open
+
+CATALOG_CACHE_FILE = 'data/product_catalog_cache.json'
+CATALOG_CACHE_TTL = 24 * 60 * 60  # seconds
+
+# Counters for the current process; see get_cache_metrics()
+_metrics = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stale_served': 0}
+
+
+def get_cache_metrics():
+    """
+    Returns: dictionary of catalog cache counters
+    {'hits': 0, 'misses': 0, 'revalidated': 0, 'stale_served': 0}
+    hits         - served from cache without a request (within TTL)
+    misses       - no usable cache entry, full download
+    revalidated  - TTL expired, server answered 304 Not Modified
+    stale_served - TTL expired and the request failed, old entry served
+    """
+
+    return dict(_metrics)
+def reset_cache_metrics():
+    """
+    Resets the catalog cache counters to zero.
+    """
+
+    for key in _metrics:
+        _metrics[key] = 0
+def record_cache_event(event):
+    """
+    Increments one of the catalog cache counters.
+    """
+
+    _metrics[event] += 1
+def load_cached_catalog(cache_file, url):
+    """
+    Loads the cached catalog entry for url.
+    Returns: dictionary with keys
+    ['products', 'fetched_at', 'etag', 'last_modified'], or None
+    """
+
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    entry = cache.get(url)
+    if not isinstance(entry, dict) or 'products' not in entry:
+        return None
+    return entry
+def save_cached_catalog(cache_file, url, products, etag=None, last_modified=None, fetched_at=None):
+    """
+    Stores the catalog for url, replacing the cache file atomically so a
+    crashed run never leaves a half-written cache behind.
+    """
+
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if not isinstance(cache, dict):
+            cache = {}
+    except (OSError, ValueError):
+        cache = {}
+
+    cache[url] = {
+        'products': products,
+        'fetched_at': time.time() if fetched_at is None else fetched_at,
+        'etag': etag,
+        'last_modified': last_modified
+    }
+
+    directory = os.path.dirname(cache_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    try:
+        with atomic_open(cache_file) as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print(f"Warning: could not write catalog cache: {e}")
+def is_fresh(entry, ttl):
+    """
+    Returns: True if the cache entry is younger than ttl seconds
+    """
+
+    return time.time() - entry.get('fetched_at', 0) < ttl
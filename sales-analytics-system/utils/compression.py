@@ -0,0 +1,117 @@
+import bz2
+import gzip
+import lzma
+import queue
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Leading bytes of each supported compressed format
+MAGIC_NUMBERS = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd')
+]
+PREFETCH_DEPTH = 4  # decompressed blocks buffered ahead of the reader
+
+# Raised while reading a corrupt or truncated compressed stream
+DECOMPRESSION_ERRORS = (OSError, EOFError, lzma.LZMAError) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+def detect_compression(filename):
+    """
+    Identifies a compressed file by its magic bytes, whatever its name.
+    Returns: 'gzip', 'bz2', 'xz' or 'zstd', or None for plain files
+    """
+
+    with open(filename, 'rb') as f:
+        head = f.read(8)
+    for magic, name in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return name
+    return None
+def open_decompressed(filename, compression):
+    """
+    Opens a compressed file as a binary stream of its decompressed bytes.
+    Multi-member gzip and multi-stream bz2/xz/zstd files are read through
+    to the end. zstd needs the optional 'zstandard' package.
+    Returns: binary file object
+    """
+
+    if compression == 'gzip':
+        return gzip.open(filename, 'rb')
+    if compression == 'bz2':
+        return bz2.open(filename, 'rb')
+    if compression == 'xz':
+        return lzma.open(filename, 'rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("the 'zstandard' package is required to read zstd-compressed files")
+        return zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), read_across_frames=True,
+                                                          closefd=True)
+    raise ValueError(f"unsupported compression: {compression}")
+
+
+class PrefetchReader:
+    """
+    Reads a binary stream on a background thread, keeping up to depth
+    blocks of block_size bytes ready. zlib, bz2 and lzma release the GIL
+    while decompressing, so the next blocks are decompressed while the
+    caller decodes and parses the current one.
+    read() returns whole blocks regardless of the size asked for, and b''
+    at the end of the stream; errors from the stream are raised in read().
+    """
+
+    def __init__(self, stream, block_size, depth=PREFETCH_DEPTH):
+        self.stream = stream
+        self.block_size = block_size
+        self.blocks = queue.Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        self.finished = False
+        self.thread = threading.Thread(target=self._fill, name='sales-prefetch', daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        # Time out now and then so close() can stop a blocked producer
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fill(self):
+        try:
+            while True:
+                block = self.stream.read(self.block_size)
+                if not self._put(block) or not block:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def read(self, size=-1):
+        if self.finished:
+            return b''
+        block = self.blocks.get()
+        if isinstance(block, Exception):
+            self.finished = True
+            raise block
+        if not block:
+            self.finished = True
+        return block
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
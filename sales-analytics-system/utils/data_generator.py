@@ -0,0 +1,171 @@
+import datetime
+import random
+
+from utils.file_handler import atomic_open, write_lines_batched, WRITE_BATCH_SIZE
+
+HEADER = "TransactionID|Date|ProductID|ProductName|Quantity|UnitPrice|CustomerID|Region"
+
+# (name, low price, high price, variant suffixes) modelled on data/sales_data.txt
+BASE_PRODUCTS = [
+    ('Laptop', 45000, 85000, ['Premium']),
+    ('Mouse', 300, 1100, ['Wireless']),
+    ('Keyboard', 1200, 3000, ['Mechanical']),
+    ('Monitor', 9000, 24000, ['LED']),
+    ('Webcam', 2500, 4500, ['HD']),
+    ('Headphones', 1500, 7000, ['Noise Cancelling']),
+    ('USB Cable', 150, 400, ['Braided']),
+    ('External Hard Drive', 3000, 9000, ['1TB']),
+    ('Wireless Mouse', 500, 1800, ['Gaming']),
+    ('Laptop Charger', 1200, 3000, ['65W'])
+]
+BASE_REGIONS = ['North', 'South', 'East', 'West']
+
+# Share of rows for each kind of dirty row; the rest are clean.
+# The defaults roughly match the mix found in data/sales_data.txt.
+DEFAULT_DIRTY_RATES = {
+    'comma_number': 0.08,      # UnitPrice written as 1,916 (valid once parsed)
+    'comma_name': 0.12,        # ProductName written as Laptop,Premium (valid once parsed)
+    'zero_quantity': 0.02,     # invalid
+    'bad_transaction_id': 0.03,  # X123 instead of T123, invalid
+    'bad_product_id': 0.01,    # invalid
+    'bad_customer_id': 0.01,   # invalid
+    'missing_customer': 0.02,  # empty CustomerID, invalid
+    'missing_region': 0.01,    # empty Region, invalid
+    'wrong_field_count': 0.02  # a field dropped or added, rejected by the parser
+}
+
+
+def build_catalog(n_products=10, seed=42):
+    """
+    Builds the synthetic product list used by generate_sales_data().
+    The first products follow BASE_PRODUCTS; beyond that names get a
+    model number (e.g. 'Monitor 3').
+    Returns: list of dictionaries with keys
+    ['ProductID', 'ProductName', 'low', 'high', 'variants']
+    """
+
+    rng = random.Random(seed)
+    catalog = []
+    for i in range(n_products):
+        name, low, high, variants = BASE_PRODUCTS[i % len(BASE_PRODUCTS)]
+        model = i // len(BASE_PRODUCTS)
+        if model:
+            name = f"{name} {model + 1}"
+            scale = rng.uniform(0.7, 1.5)
+            low, high = int(low * scale), int(high * scale)
+        catalog.append({
+            'ProductID': f"P{101 + i}",
+            'ProductName': name,
+            'low': low,
+            'high': high,
+            'variants': variants
+        })
+    return catalog
+def build_regions(n_regions=4):
+    """
+    Returns: list of n_regions region names (North, South, East, West,
+    then Region5, Region6, ...)
+    """
+
+    return BASE_REGIONS[:n_regions] + [f"Region{i + 1}" for i in range(len(BASE_REGIONS), n_regions)]
+def generate_product_catalog(n_products=10, seed=42, match_rate=1.0):
+    """
+    Builds an API-style product list matching build_catalog(), so
+    enrichment can be benchmarked without network access. Only about
+    match_rate of the products are included.
+    Returns: list of dictionaries in the format returned by fetch_all_products()
+    """
+
+    rng = random.Random(seed + 1)
+    products = []
+    for product in build_catalog(n_products, seed):
+        if rng.random() >= match_rate:
+            continue
+        products.append({
+            'id': int(product['ProductID'][1:]),
+            'title': product['ProductName'],
+            'category': rng.choice(['laptops', 'mobile-accessories', 'tablets', 'groceries']),
+            'brand': rng.choice(['Apple', 'Samsung', 'Dell', 'Logitech', 'HP']),
+            'rating': round(rng.uniform(2.5, 5.0), 2)
+        })
+    return products
+def _make_row(rng, number, catalog, customers, regions, dates, kind):
+    """
+    Builds one pipe-delimited line; kind is None for a clean row or one
+    of the DEFAULT_DIRTY_RATES keys.
+    """
+
+    product = catalog[rng.randrange(len(catalog))]
+    transaction_id = f"T{number:03d}"
+    product_id = product['ProductID']
+    name = product['ProductName']
+    quantity = str(rng.randint(1, 10))
+    price = rng.randint(product['low'], product['high'])
+    unit_price = str(price)
+    customer_id = customers[rng.randrange(len(customers))]
+    region = regions[rng.randrange(len(regions))]
+
+    if kind == 'comma_number':
+        unit_price = f"{price:,}"
+    elif kind == 'comma_name':
+        name = f"{name},{rng.choice(product['variants'])}"
+    elif kind == 'zero_quantity':
+        quantity = '0'
+    elif kind == 'bad_transaction_id':
+        transaction_id = f"X{number}"
+    elif kind == 'bad_product_id':
+        product_id = 'Q' + product_id[1:]
+    elif kind == 'bad_customer_id':
+        customer_id = 'K' + customer_id[1:]
+    elif kind == 'missing_customer':
+        customer_id = ''
+    elif kind == 'missing_region':
+        region = ''
+
+    fields = [transaction_id, dates[rng.randrange(len(dates))], product_id, name,
+              quantity, unit_price, customer_id, region]
+    if kind == 'wrong_field_count':
+        if rng.random() < 0.5:
+            del fields[rng.randrange(len(fields))]
+        else:
+            fields.append('extra')
+    return '|'.join(fields)
+def iter_sales_rows(rows, seed=42, n_products=10, n_customers=25, n_regions=4, n_days=31,
+                    start_date='2024-12-01', dirty_rates=None):
+    """
+    Streams synthetic sales lines (without header) in the format of
+    data/sales_data.txt. The same arguments always produce the same lines.
+    Yields: strings without line endings
+    """
+
+    rng = random.Random(seed)
+    catalog = build_catalog(n_products, seed)
+    customers = [f"C{i + 1:03d}" for i in range(n_customers)]
+    regions = build_regions(n_regions)
+    first_day = datetime.date.fromisoformat(start_date)
+    dates = [(first_day + datetime.timedelta(days=i)).isoformat() for i in range(n_days)]
+
+    rates = DEFAULT_DIRTY_RATES if dirty_rates is None else dirty_rates
+    kinds = [None] + list(rates)
+    weights = [max(0.0, 1.0 - sum(rates.values()))] + list(rates.values())
+
+    number = 0
+    while number < rows:
+        # Draw the row kinds a batch at a time; choices() is much cheaper
+        # per item than one random() call per row
+        batch = min(WRITE_BATCH_SIZE, rows - number)
+        for kind in rng.choices(kinds, weights, k=batch):
+            number += 1
+            yield _make_row(rng, number, catalog, customers, regions, dates, kind)
+def generate_sales_data(filename, rows, seed=42, n_products=10, n_customers=25, n_regions=4, n_days=31,
+                        start_date='2024-12-01', dirty_rates=None):
+    """
+    Writes a synthetic sales file of the given number of data rows.
+    Returns: filename
+    """
+
+    lines = iter_sales_rows(rows, seed, n_products, n_customers, n_regions, n_days, start_date, dirty_rates)
+    with atomic_open(filename, encoding='utf-8') as f:
+        f.write(HEADER + '\n')
+        write_lines_batched(f, lines)
+    return filename
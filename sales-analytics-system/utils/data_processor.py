@@ -1,9 +1,194 @@
+import heapq
+
+from utils.instrumentation import timed
+from utils.rollups import ROLLING_WINDOWS, build_rollups, is_rollups
+from utils.sketches import SpaceSaving, HyperLogLog
+from utils.transaction_table import TransactionTable
+
+
+@timed
+def aggregate_transactions(transactions, distinct_error=None, paise=False, track_customers=True):
+    """
+    Computes every group-by used by the analysis functions in a single scan.
+    Returns: dictionary of aggregate state.
+    Format:
+    {
+        'total_revenue': 3527808.0,
+        'transaction_count': 70,
+        'paise': False,
+        'regions': {'North': {'total_sales': 1321605.0, 'transaction_count': 21}, ...},
+        'products': {'Mouse': {'total_quantity': 61, 'total_revenue': 40297.0}, ...},
+        'customers': {'C001': {'total_spent': 95000.0, 'purchase_count': 3, 'products_bought': {...}}, ...},
+        'daily': {'2024-12-01': {'revenue': 125000.0, 'transaction_count': 8, 'unique_customers': {...}}, ...}
+    }
+    Groups keep the order in which their key was first seen, so the
+    analysis functions below sort them exactly as a per-function scan would.
+    A TransactionTable is aggregated with group-bys over its code columns.
+    By default products_bought and unique_customers are exact sets. Pass a
+    relative error (e.g. 0.01) as distinct_error to keep mergeable
+    HyperLogLog sketches instead, which use far less memory on
+    high-cardinality data; len() of a sketch gives the estimated count.
+    Pass paise=True for transactions parsed in paise mode: every money
+    value is then an exact int number of paise, and 'paise' is set so the
+    report formats them correctly (a TransactionTable sets it itself).
+    With track_customers=False 'customers' is left empty, for callers that
+    analyse customers out of core (see partitioned_customer_analysis()).
+    """
+
+    if isinstance(transactions, TransactionTable):
+        if distinct_error is None:
+            aggregates = transactions.aggregate()
+            if not track_customers:
+                aggregates['customers'] = {}
+            return aggregates
+        paise = transactions.paise
+
+    if distinct_error is None:
+        new_distinct = set
+    else:
+        def new_distinct():
+            return HyperLogLog(distinct_error)
+
+    # Sums keep the type of the amounts: exact ints in paise mode
+    zero = 0 if paise else 0.0
+    total_revenue = zero
+    transaction_count = 0
+    regions = {}
+    products = {}
+    customers = {}
+    daily = {}
+
+    for t in transactions:
+        quantity = t['Quantity']
+        amount = quantity * t['UnitPrice']
+
+        total_revenue += amount
+        transaction_count += 1
+
+        region = t['Region']
+        stats = regions.get(region)
+        if stats is None:
+            stats = regions[region] = {'total_sales': zero, 'transaction_count': 0}
+        stats['total_sales'] += amount
+        stats['transaction_count'] += 1
+
+        product = t['ProductName']
+        stats = products.get(product)
+        if stats is None:
+            stats = products[product] = {'total_quantity': 0, 'total_revenue': zero}
+        stats['total_quantity'] += quantity
+        stats['total_revenue'] += amount
+
+        customer = t['CustomerID']
+        if track_customers:
+            stats = customers.get(customer)
+            if stats is None:
+                stats = customers[customer] = {'total_spent': zero, 'purchase_count': 0,
+                                               'products_bought': new_distinct()}
+            stats['total_spent'] += amount
+            stats['purchase_count'] += 1
+            stats['products_bought'].add(product)
+
+        date = t['Date']
+        stats = daily.get(date)
+        if stats is None:
+            stats = daily[date] = {'revenue': zero, 'transaction_count': 0, 'unique_customers': new_distinct()}
+        stats['revenue'] += amount
+        stats['transaction_count'] += 1
+        stats['unique_customers'].add(customer)
+
+    return {
+        'total_revenue': total_revenue,
+        'transaction_count': transaction_count,
+        'paise': paise,
+        'regions': regions,
+        'products': products,
+        'customers': customers,
+        'daily': daily
+    }
+@timed
+def merge_aggregates(target, other):
+    """
+    Merges the aggregate state other into target in place.
+    Groups new to target are appended after its existing groups, so merging
+    partial states in input order keeps the first-seen order of a single scan.
+    Exact sets and HyperLogLog sketches both merge with |=, but the two
+    states must have been built with the same distinct_error. Float and
+    paise states cannot be mixed; paise states merge exactly in any order.
+    Returns: target
+    """
+
+    if target.get('paise', False) != other.get('paise', False):
+        raise ValueError("cannot merge aggregates in rupees with aggregates in paise")
+
+    target['total_revenue'] += other['total_revenue']
+    target['transaction_count'] += other['transaction_count']
+
+    for region, stats in other['regions'].items():
+        merged = target['regions'].get(region)
+        if merged is None:
+            target['regions'][region] = dict(stats)
+            continue
+        merged['total_sales'] += stats['total_sales']
+        merged['transaction_count'] += stats['transaction_count']
+
+    for product, stats in other['products'].items():
+        merged = target['products'].get(product)
+        if merged is None:
+            target['products'][product] = dict(stats)
+            continue
+        merged['total_quantity'] += stats['total_quantity']
+        merged['total_revenue'] += stats['total_revenue']
+
+    for customer, stats in other['customers'].items():
+        merged = target['customers'].get(customer)
+        if merged is None:
+            target['customers'][customer] = dict(stats, products_bought=stats['products_bought'].copy())
+            continue
+        merged['total_spent'] += stats['total_spent']
+        merged['purchase_count'] += stats['purchase_count']
+        merged['products_bought'] |= stats['products_bought']
+
+    for date, stats in other['daily'].items():
+        merged = target['daily'].get(date)
+        if merged is None:
+            target['daily'][date] = dict(stats, unique_customers=stats['unique_customers'].copy())
+            continue
+        merged['revenue'] += stats['revenue']
+        merged['transaction_count'] += stats['transaction_count']
+        merged['unique_customers'] |= stats['unique_customers']
+
+    return target
+def _as_aggregates(transactions):
+    """
+    Accepts a list of transactions, a TransactionTable or the result of
+    aggregate_transactions(), so callers can aggregate once and reuse it.
+    """
+
+    if isinstance(transactions, dict):
+        return transactions
+    return aggregate_transactions(transactions)
+def _products_bought_fields(products_bought):
+    """
+    Exact sets are reported as a 'products_bought' list; sketches can only
+    report the estimated number of distinct products.
+    """
+
+    if isinstance(products_bought, HyperLogLog):
+        return {'distinct_products': len(products_bought)}
+    return {'products_bought': list(products_bought)}
+@timed
 def calculate_total_revenue(transactions):
     """
     Calculates total revenue from all transactions.
     Returns: float (total revenue)
     """
 
+    if isinstance(transactions, dict):
+        return transactions['total_revenue']
+    if isinstance(transactions, TransactionTable):
+        return transactions.total_revenue()
+
     total = 0.0
     for t in transactions:
         try:
@@ -12,6 +197,7 @@ def calculate_total_revenue(transactions):
             continue
 
     return total
+@timed
 def region_wise_sales(transactions):
     """
     Analyzes sales by region.
@@ -27,64 +213,119 @@ def region_wise_sales(transactions):
     }
     """
 
-    region_stats = {}
-    total_revenue = calculate_total_revenue(transactions)
-
-    for t in transactions:
-        region = t['Region']
-        amount = t['Quantity'] * t['UnitPrice']
-
-        if region not in region_stats:
-            region_stats[region] = {
-                'total_sales': 0.0,
-                'transaction_count': 0
-            }
+    aggregates = _as_aggregates(transactions)
+    total_revenue = aggregates['total_revenue']
 
-        region_stats[region]['total_sales'] += amount
-        region_stats[region]['transaction_count'] += 1
-
-    # Calculate percentages
-    for region, stats in region_stats.items():
-        stats['percentage'] = (stats['total_sales'] / total_revenue * 100) if total_revenue > 0 else 0
+    region_stats = {}
+    for region, stats in aggregates['regions'].items():
+        region_stats[region] = {
+            'total_sales': stats['total_sales'],
+            'transaction_count': stats['transaction_count'],
+            'percentage': (stats['total_sales'] / total_revenue * 100) if total_revenue > 0 else 0
+        }
 
     # Sort by total_sales descending
     sorted_stats = dict(sorted(region_stats.items(), key=lambda x: x[1]['total_sales'], reverse=True))
 
     return sorted_stats
-def top_selling_products(transactions, n=5):
+PRODUCT_RANK_KEYS = {'quantity': 1, 'revenue': 2}
+
+@timed
+def top_products(transactions, n=5, by='quantity'):
     """
-    Finds top n products by total quantity sold.
+    Finds top n products by total quantity or revenue with a bounded heap
+    instead of sorting every product.
     Returns: list of tuples in format:
     [(ProductName, TotalQuantity, TotalRevenue), ...]
     """
 
-    product_stats = {}
+    if by not in PRODUCT_RANK_KEYS:
+        raise ValueError(f"by must be one of {sorted(PRODUCT_RANK_KEYS)}")
+    position = PRODUCT_RANK_KEYS[by]
 
-    for t in transactions:
-        product = t['ProductName']
-        amount = t['Quantity'] * t['UnitPrice']
+    products = _as_aggregates(transactions)['products']
+    product_list = (
+        (product, stats['total_quantity'], stats['total_revenue'])
+        for product, stats in products.items()
+    )
 
-        if product not in product_stats:
-            product_stats[product] = {
-                'total_quantity': 0,
-                'total_revenue': 0.0
-            }
+    # nlargest keeps ties in input order, like a stable descending sort
+    return heapq.nlargest(n, product_list, key=lambda x: x[position])
+@timed
+def bottom_products(transactions, n=5, by='quantity'):
+    """
+    Finds the n weakest products by total quantity or revenue with a
+    bounded heap.
+    Returns: list of tuples in format:
+    [(ProductName, TotalQuantity, TotalRevenue), ...]
+    """
 
-        product_stats[product]['total_quantity'] += t['Quantity']
-        product_stats[product]['total_revenue'] += amount
+    if by not in PRODUCT_RANK_KEYS:
+        raise ValueError(f"by must be one of {sorted(PRODUCT_RANK_KEYS)}")
+    position = PRODUCT_RANK_KEYS[by]
 
-    # Convert to list of tuples
-    product_list = [
+    products = _as_aggregates(transactions)['products']
+    product_list = (
         (product, stats['total_quantity'], stats['total_revenue'])
-        for product, stats in product_stats.items()
-    ]
+        for product, stats in products.items()
+    )
 
-    # Sort by total_quantity descending
-    product_list.sort(key=lambda x: x[1], reverse=True)
+    return heapq.nsmallest(n, product_list, key=lambda x: x[position])
+@timed
+def top_selling_products(transactions, n=5):
+    """
+    Finds top n products by total quantity sold.
+    Returns: list of tuples in format:
+    [(ProductName, TotalQuantity, TotalRevenue), ...]
+    """
 
-    # Return top n products
-    return product_list[:n]
-def customer_analysis(transactions):
+    return top_products(transactions, n, by='quantity')
+@timed
+def top_customers(transactions, n=5, memory_mb=None):
+    """
+    Finds the n customers with the highest total spent with a bounded heap.
+    With memory_mb, transactions are analysed out of core within that
+    memory ceiling (see partitioned_customer_analysis()).
+    Returns: dictionary in the customer_analysis() format holding only
+    those n customers, sorted by total_spent descending.
+    """
+
+    if memory_mb is not None and not isinstance(transactions, dict):
+        from utils.spill import partitioned_customer_analysis
+        return partitioned_customer_analysis(transactions, n, memory_mb)
+
+    customers = _as_aggregates(transactions)['customers']
+    heaviest = heapq.nlargest(n, customers.items(), key=lambda x: x[1]['total_spent'])
+
+    return {
+        customer: {
+            'total_spent': stats['total_spent'],
+            'purchase_count': stats['purchase_count'],
+            **_products_bought_fields(stats['products_bought']),
+            'avg_order_value': stats['total_spent'] / stats['purchase_count'] if stats['purchase_count'] > 0 else 0.0
+        }
+        for customer, stats in heaviest
+    }
+@timed
+def streaming_top_customers(transactions, n=5, capacity=1000, summary=None):
+    """
+    Approximates the top n customers by total spent with a Space-Saving
+    summary of at most capacity customers, for when per-customer state
+    does not fit in memory. Pass an existing SpaceSaving as summary to keep
+    adding to it (e.g. across chunks).
+    Returns: list of tuples in format:
+    [(CustomerID, EstimatedSpent, MaxOverestimate), ...]
+    """
+
+    if summary is None:
+        summary = SpaceSaving(capacity)
+
+    for t in transactions:
+        summary.update(t['CustomerID'], t['Quantity'] * t['UnitPrice'])
+
+    return summary.top(n)
+@timed
+def customer_analysis(transactions, memory_mb=None):
     """
     Analyzes customer purchase patterns.
     Returns: dictionary of customer statistics.
@@ -98,38 +339,45 @@ def customer_analysis(transactions):
         },
         'C002': { ... }
     }
+    When aggregated with distinct_error, 'products_bought' is replaced by
+    'distinct_products' (estimated count).
+    With memory_mb, transactions are hash-partitioned to temporary files
+    and aggregated within that memory ceiling instead of all at once
+    (see partitioned_customer_analysis()).
     """
 
-    customer_stats = {}
+    if memory_mb is not None and not isinstance(transactions, dict):
+        from utils.spill import partitioned_customer_analysis
+        return partitioned_customer_analysis(transactions, memory_mb=memory_mb)
 
-    for t in transactions:
-        customer = t['CustomerID']
-        amount = t['Quantity'] * t['UnitPrice']
-        product = t['ProductName']
+    aggregates = _as_aggregates(transactions)
 
-        if customer not in customer_stats:
-            customer_stats[customer] = {
-                'total_spent': 0.0,
-                'purchase_count': 0,
-                'products_bought': set()
-            }
-
-        customer_stats[customer]['total_spent'] += amount
-        customer_stats[customer]['purchase_count'] += 1
-        customer_stats[customer]['products_bought'].add(product)
-
-    # Calculate average order value and convert products to list
-    for customer, stats in customer_stats.items():
-        if stats['purchase_count'] > 0:
-            stats['avg_order_value'] = stats['total_spent'] / stats['purchase_count']
-        else:
-            stats['avg_order_value'] = 0.0
-        stats['products_bought'] = list(stats['products_bought'])
+    customer_stats = {}
+    for customer, stats in aggregates['customers'].items():
+        customer_stats[customer] = {
+            'total_spent': stats['total_spent'],
+            'purchase_count': stats['purchase_count'],
+            **_products_bought_fields(stats['products_bought']),
+            'avg_order_value': stats['total_spent'] / stats['purchase_count'] if stats['purchase_count'] > 0 else 0.0
+        }
 
     # Sort by total_spent descending
     sorted_stats = dict(sorted(customer_stats.items(), key=lambda x: x[1]['total_spent'], reverse=True))
 
     return sorted_stats
+@timed
+def sales_rollups(transactions, windows=ROLLING_WINDOWS):
+    """
+    Builds daily, weekly and monthly buckets plus rolling revenue windows.
+    Accepts transactions, the result of aggregate_transactions() or an
+    existing rollup (returned as is).
+    Returns: dictionary in the format returned by build_rollups()
+    """
+
+    if is_rollups(transactions):
+        return transactions
+    return build_rollups(_as_aggregates(transactions), windows)
+@timed
 def daily_sales_trend(transactions):
     """
     Analyzes sales trends by date.
@@ -145,32 +393,8 @@ def daily_sales_trend(transactions):
     }
     """
 
-    trend = {}
-
-    for t in transactions:
-        date = t['Date']
-        amount = t['Quantity'] * t['UnitPrice']
-        customer = t['CustomerID']
-
-        if date not in trend:
-            trend[date] = {
-                'revenue': 0.0,
-                'transaction_count': 0,
-                'unique_customers': set()
-            }
-
-        trend[date]['revenue'] += amount
-        trend[date]['transaction_count'] += 1
-        trend[date]['unique_customers'].add(customer)
-
-    # Convert unique_customers set to count
-    for date, stats in trend.items():
-        stats['unique_customers'] = len(stats['unique_customers'])
-
-    # Sort by date (chronologically)
-    sorted_trend = dict(sorted(trend.items(), key=lambda x: x[0]))
-
-    return sorted_trend
+    return sales_rollups(transactions)['daily']
+@timed
 def find_peak_sales_day(transactions):
     """
     Identifies the date with highest revenue.
@@ -178,19 +402,8 @@ def find_peak_sales_day(transactions):
     Example: ('2024-12-15', 185000.0, 12)
     """
 
-    daily_stats = daily_sales_trend(transactions)
-
-    peak_day = None
-    peak_revenue = 0.0
-    peak_transactions = 0
-
-    for date, stats in daily_stats.items():
-        if stats['revenue'] > peak_revenue:
-            peak_day = date
-            peak_revenue = stats['revenue']
-            peak_transactions = stats['transaction_count']
-
-    return (peak_day, peak_revenue, peak_transactions)
+    return sales_rollups(transactions)['peak_day']
+@timed
 def low_performing_products(transactions, threshold=10):
     """
     Identifies products with low sales.
@@ -198,25 +411,12 @@ def low_performing_products(transactions, threshold=10):
     [(ProductName, TotalQuantity, TotalRevenue), ...]
     """
 
-    product_stats = {}
-
-    for t in transactions:
-        product = t['ProductName']
-        amount = t['Quantity'] * t['UnitPrice']
-
-        if product not in product_stats:
-            product_stats[product] = {
-                'total_quantity': 0,
-                'total_revenue': 0.0
-            }
-
-        product_stats[product]['total_quantity'] += t['Quantity']
-        product_stats[product]['total_revenue'] += amount
+    aggregates = _as_aggregates(transactions)
 
     # Filter products below threshold
     low_products = [
         (product, stats['total_quantity'], stats['total_revenue'])
-        for product, stats in product_stats.items()
+        for product, stats in aggregates['products'].items()
         if stats['total_quantity'] < threshold
     ]
 
@@ -224,4 +424,3 @@ def low_performing_products(transactions, threshold=10):
     low_products.sort(key=lambda x: x[1])
 
     return low_products
-
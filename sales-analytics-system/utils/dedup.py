@@ -0,0 +1,159 @@
+from utils.sketches import BloomFilter
+
+DEDUP_POLICIES = ('keep_first', 'keep_last', 'reject_all')
+DEDUP_MODES = ('exact', 'bloom')
+DEFAULT_BLOOM_MEMORY_MB = 64
+
+
+class DuplicateFilter:
+    """
+    Finds transactions whose TransactionID was already delivered and
+    applies a policy to them:
+    keep_first - keep the first row of each ID, drop the repeats
+    keep_last  - keep the last row of each ID, drop the earlier ones
+    reject_all - drop every row of an ID that occurs more than once
+    In 'exact' mode every ID is held in a set. In 'bloom' mode a Bloom
+    filter of memory_mb megabytes screens the IDs and only those it flags
+    (the real repeats plus a few false positives) are kept exactly, so the
+    memory for IDs stays fixed for hundreds of millions of them. It bounds
+    only the IDs: keep_offsets() and select() work on rows the caller
+    already holds in a list, and are exact in both modes (flagged IDs are
+    recounted in a second pass). For input split over several files,
+    plan() counts the IDs of all of them first; keep_offsets() and
+    select() then resolve each file against the whole input. seen_before()
+    is the single-pass streaming check used by stream_sales_data(), which
+    holds no rows; it only supports keep_first, and in bloom mode a false
+    positive drops a unique row.
+    """
+
+    def __init__(self, policy='keep_first', mode='exact', memory_mb=DEFAULT_BLOOM_MEMORY_MB):
+        if policy not in DEDUP_POLICIES:
+            raise ValueError(f"policy must be one of {DEDUP_POLICIES}")
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"mode must be one of {DEDUP_MODES}")
+        self.policy = policy
+        self.mode = mode
+        self.memory_mb = memory_mb
+        self._seen = None
+        # Set by plan(): repeated IDs of the whole input, the repeated IDs
+        # already kept (keep_first) and the rows of each still to come (keep_last)
+        self._counts = None
+        self._kept = None
+        self._remaining = None
+
+    def _new_seen(self):
+        if self.mode == 'bloom':
+            return BloomFilter(int(self.memory_mb * 1024 * 1024))
+        return set()
+
+    def find_duplicates(self, ids):
+        """
+        Counts the IDs that occur more than once. ids must be a sequence
+        (it is scanned twice in bloom mode).
+        Returns: dictionary {TransactionID: occurrences} for repeated IDs
+        """
+
+        return self._count_duplicates(lambda: ids)
+
+    def _count_duplicates(self, id_pass):
+        """
+        Counts repeated IDs over the iterable returned by id_pass(), which
+        is called once in exact mode and twice in bloom mode.
+        """
+
+        counts = {}
+        if self.mode == 'exact':
+            seen = set()
+            for transaction_id in id_pass():
+                if transaction_id in seen:
+                    counts[transaction_id] = counts.get(transaction_id, 1) + 1
+                else:
+                    seen.add(transaction_id)
+            return counts
+
+        bloom = self._new_seen()
+        flagged = {transaction_id for transaction_id in id_pass() if bloom.add(transaction_id)}
+        for transaction_id in id_pass():
+            if transaction_id in flagged:
+                counts[transaction_id] = counts.get(transaction_id, 0) + 1
+        return {transaction_id: n for transaction_id, n in counts.items() if n > 1}
+
+    def plan(self, id_pass):
+        """
+        Prepares the filter for input split over several files. id_pass()
+        must return an iterable of the TransactionIDs of all of them, in
+        processing order; it is called once in exact mode and twice in
+        bloom mode. Afterwards each keep_offsets() or select() call takes
+        the next file and drops its rows by the policy over all files.
+        Returns: number of repeated IDs found
+        """
+
+        self._counts = self._count_duplicates(id_pass)
+        self._kept = set()
+        self._remaining = dict(self._counts)
+        return len(self._counts)
+
+    def keep_offsets(self, ids):
+        """
+        Applies the policy to a sequence of TransactionIDs (after plan(),
+        to the next part of the planned input).
+        Returns: tuple (offsets of the rows to keep in original order,
+        number of rows dropped as duplicates)
+        """
+
+        if self._counts is None:
+            counts = self.find_duplicates(ids)
+            kept, remaining = set(), dict(counts)
+        else:
+            counts, kept, remaining = self._counts, self._kept, self._remaining
+        if not counts:
+            return list(range(len(ids))), 0
+
+        keep = []
+        if self.policy == 'keep_first':
+            for i, transaction_id in enumerate(ids):
+                if transaction_id in counts:
+                    if transaction_id in kept:
+                        continue
+                    kept.add(transaction_id)
+                keep.append(i)
+        elif self.policy == 'keep_last':
+            for i, transaction_id in enumerate(ids):
+                if transaction_id in remaining:
+                    remaining[transaction_id] -= 1
+                    if remaining[transaction_id]:
+                        continue
+                keep.append(i)
+        else:
+            keep = [i for i, transaction_id in enumerate(ids) if transaction_id not in counts]
+
+        return keep, len(ids) - len(keep)
+
+    def select(self, transactions):
+        """
+        Applies the policy to a list of transactions.
+        Returns: tuple (list of kept transactions, number dropped)
+        """
+
+        offsets, dropped = self.keep_offsets([t['TransactionID'] for t in transactions])
+        if not dropped:
+            return list(transactions), 0
+        return [transactions[i] for i in offsets], dropped
+
+    def seen_before(self, transaction_id):
+        """
+        Streaming keep_first check: records the ID and tells whether it
+        was seen earlier in the stream.
+        Returns: True if the row is a duplicate to drop
+        """
+
+        if self.policy != 'keep_first':
+            raise ValueError(f"the {self.policy} policy needs the whole input; use validate_and_filter()")
+        if self._seen is None:
+            self._seen = self._new_seen()
+        if self.mode == 'bloom':
+            return self._seen.add(transaction_id)
+        if transaction_id in self._seen:
+            return True
+        self._seen.add(transaction_id)
+        return False
@@ -1,146 +1,503 @@
+import os
+import threading
+from contextlib import contextmanager
+from itertools import islice
+
+from utils.transaction_table import TransactionTable, BASE_FIELDS
+from utils.money import parse_paise, amount_bounds
+from utils.compression import detect_compression, open_decompressed, PrefetchReader, DECOMPRESSION_ERRORS
+
+ENCODINGS_TO_TRY = ['utf-8', 'latin-1', 'cp1252']
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+WRITE_BATCH_SIZE = 10000  # lines joined per write() call
+PARSE_BLOCK_SIZE = 2000  # lines parsed per block
+
+# Whitespace that str.strip() removes, other than the space itself
+ASCII_WHITESPACE = '\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f'
+
+
+def _decode_lines(block, encodings, state):
+    """
+    Decodes a block of complete lines, falling back to the next encoding
+    from the current line onwards when a line fails to decode.
+    Returns: list of decoded lines (strings)
+    """
+
+    try:
+        return block.decode(encodings[state['encoding_index']]).split('\n')
+    except UnicodeDecodeError:
+        pass
+
+    lines = []
+    for raw in block.split(b'\n'):
+        while True:
+            try:
+                lines.append(raw.decode(encodings[state['encoding_index']]))
+                break
+            except UnicodeDecodeError:
+                if state['encoding_index'] + 1 >= len(encodings):
+                    raise
+                state['encoding_index'] += 1
+                print(f"Switching to {encodings[state['encoding_index']]} encoding at line {state['line_number'] + len(lines) + 1}.")
+    return lines
+def _iter_decoded_lines(f, encodings, state, chunk_size, end=None):
+    """
+    Reads an open binary file from its current position up to byte offset
+    end (or EOF) in chunks, decoding only complete lines.
+    Yields: decoded lines (strings), not stripped
+    """
+
+    remaining = None if end is None else end - f.tell()
+    remainder = b''
+
+    while True:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        chunk = f.read(size) if size > 0 else b''
+        if remaining is not None:
+            remaining -= len(chunk)
+
+        if chunk:
+            block = remainder + chunk
+            cut = block.rfind(b'\n')
+            if cut == -1:
+                remainder = block
+                continue
+            block, remainder = block[:cut], block[cut + 1:]
+        elif remainder:
+            block, remainder = remainder, b''
+        else:
+            break
+
+        for line in _decode_lines(block, encodings, state):
+            state['line_number'] += 1
+            yield line
+
+        if not chunk:
+            break
+def iter_sales_lines(filename, chunk_size=DEFAULT_CHUNK_SIZE, encodings=None):
+    """
+    Streams sales data from file handling encoding issues.
+    Reads the file in binary chunks of chunk_size bytes, so memory stays
+    bounded by the chunk size rather than the file size. If a line does not
+    decode with the current encoding, decoding continues from that line with
+    the next encoding instead of re-reading the file from the top.
+    gzip, bz2, xz and zstd files are recognised by their magic bytes and
+    decompressed on the fly, chunk_size bytes at a time, on a background
+    thread that runs ahead of the decoding and parsing.
+    Yields: raw lines (strings), header skipped, stripped, empty lines removed
+    """
+
+    encodings = encodings or ENCODINGS_TO_TRY
+    state = {'encoding_index': 0, 'line_number': 0}
+
+    try:
+        compression = detect_compression(filename)
+        if compression is None:
+            f = open(filename, 'rb')
+        else:
+            f = PrefetchReader(open_decompressed(filename, compression), chunk_size)
+    except FileNotFoundError:
+        print(f"Error: File '{filename}' not found.")
+        return
+    except ImportError as e:
+        print(f"Error: {e}")
+        return
+
+    with f:
+        try:
+            for line in _iter_decoded_lines(f, encodings, state, chunk_size):
+                # Skip header row (first line)
+                if state['line_number'] == 1:
+                    continue
+                line = line.strip()
+                if line != "":
+                    yield line
+
+        except UnicodeDecodeError:
+            print("Error: Could not read file with available encodings.")
+            return
+        except DECOMPRESSION_ERRORS as e:
+            print(f"Error: Could not decompress '{filename}': {e}")
+            return
+
+    source = f" ({compression}-compressed)" if compression else ""
+    print(f"Successfully read file{source} using {encodings[state['encoding_index']]} encoding.")
+def iter_range_lines(filename, start, end, chunk_size=DEFAULT_CHUNK_SIZE, encodings=None):
+    """
+    Streams the lines between byte offsets start and end of a sales file.
+    Both offsets must fall on line boundaries (see split_file_ranges()).
+    The header is not skipped, so ranges should start after it.
+    Compressed files cannot be read by range; use iter_sales_lines().
+    Yields: raw lines (strings), stripped, empty lines removed
+    """
+
+    encodings = encodings or ENCODINGS_TO_TRY
+    state = {'encoding_index': 0, 'line_number': 0}
+
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        for line in _iter_decoded_lines(f, encodings, state, chunk_size, end):
+            line = line.strip()
+            if line != "":
+                yield line
+def split_file_ranges(filename, n_ranges):
+    """
+    Splits a sales file into byte ranges aligned on newlines.
+    The first range starts just after the header line.
+    Returns: list of (start, end) byte offset tuples
+    """
+
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        f.readline()
+        header_end = f.tell()
+
+        boundaries = [header_end]
+        step = max((size - header_end) // max(n_ranges, 1), 1)
+        for i in range(1, n_ranges):
+            target = header_end + i * step
+            if target <= boundaries[-1]:
+                continue
+            if target >= size:
+                break
+            # Move forward to the start of the next full line
+            f.seek(target - 1)
+            f.readline()
+            boundary = f.tell()
+            if boundary > boundaries[-1] and boundary < size:
+                boundaries.append(boundary)
+        boundaries.append(size)
+
+    return [(boundaries[i], boundaries[i + 1]) for i in range(len(boundaries) - 1)
+            if boundaries[i + 1] > boundaries[i]]
 def read_sales_data(filename):
     """
     Reads sales data from file handling encoding issues.
     Returns: list of raw lines (strings)
     """
 
-    encodings_to_try = ['utf-8', 'latin-1', 'cp1252']
-    raw_lines = []
+    return list(iter_sales_lines(filename))
+def new_parse_counters():
+    """
+    Creates the counters filled in by iter_transactions(); rejected lines
+    are counted by reason instead of being dropped silently.
+    field_count - not exactly 8 pipe-separated fields
+    bad_int     - Quantity is not an integer
+    bad_float   - UnitPrice is not a number
+    """
+
+    return {'lines': 0, 'parsed': 0, 'field_count': 0, 'bad_int': 0, 'bad_float': 0}
+def format_rejects(counters):
+    """
+    Describes the lines rejected by the parser.
+    Returns: string such as ' (rejected 3: 2 wrong field count, 1 bad quantity)',
+    or '' when nothing was rejected
+    """
 
-    for enc in encodings_to_try:
-        try:
-            with open(filename, 'r', encoding=enc) as f:
-                # Read all lines
-                lines = f.readlines()
+    reasons = [(counters['field_count'], 'wrong field count'),
+               (counters['bad_int'], 'bad quantity'),
+               (counters['bad_float'], 'bad unit price')]
+    rejected = sum(count for count, _ in reasons)
+    if not rejected:
+        return ''
+    details = ', '.join(f"{count} {reason}" for count, reason in reasons if count)
+    return f" (rejected {rejected}: {details})"
+def _needs_strip(joined):
+    """
+    Checks a block of '|'-joined lines for whitespace at a field boundary.
+    Most files have none, and then the per-field strip() can be skipped.
+    """
 
-                # Skip header row (first line)
-                lines = lines[1:]
+    if ' |' in joined or '| ' in joined or joined[:1] == ' ' or joined[-1:] == ' ':
+        return True
+    if not joined.isascii():
+        # Every other whitespace character is non-printable
+        return not joined.isprintable()
+    return any(c in joined for c in ASCII_WHITESPACE)
+def _parse_block(lines, counters, paise=False):
+    """
+    Parses a block of raw lines into transaction dictionaries.
+    Whitespace around fields is checked once for the whole block, and
+    commas are only removed on lines that contain one.
+    With paise=True UnitPrice is parsed to an exact integer number of paise.
+    Returns: list of dictionaries
+    """
+
+    strip = _needs_strip('|'.join(lines))
+    to_price = parse_paise if paise else float
+    transactions = []
+    append = transactions.append
 
-                # Remove empty lines and strip spaces
-                raw_lines = [line.strip() for line in lines if line.strip() != ""]
+    for line in lines:
+        parts = line.split('|')
 
-            print(f"Successfully read file using {enc} encoding.")
-            return raw_lines
+        # Skip rows with incorrect number of fields
+        if len(parts) != 8:
+            counters['field_count'] += 1
+            continue
+        if strip:
+            parts = [p.strip() for p in parts]
 
-        except FileNotFoundError:
-            print(f"Error: File '{filename}' not found.")
-            return []
+        transaction_id, date, product_id, product_name, quantity, unit_price, customer_id, region = parts
 
-        except UnicodeDecodeError:
-            # Try next encoding if this one fails
+        # Remove commas from product name and numbers
+        if ',' in line:
+            product_name = product_name.replace(',', '')
+            quantity = quantity.replace(',', '')
+            unit_price = unit_price.replace(',', '')
+
+        try:
+            quantity = int(quantity)
+            unit_price = to_price(unit_price)
+        except ValueError:
+            if isinstance(quantity, str):
+                counters['bad_int'] += 1
+            else:
+                counters['bad_float'] += 1
             continue
 
-    # If none of the encodings worked
-    print("Error: Could not read file with available encodings.")
-    return []
-def parse_transactions(raw_lines):
+        append({
+            'TransactionID': transaction_id,
+            'Date': date,
+            'ProductID': product_id,
+            'ProductName': product_name,
+            'Quantity': quantity,
+            'UnitPrice': unit_price,
+            'CustomerID': customer_id,
+            'Region': region
+        })
+
+    counters['lines'] += len(lines)
+    counters['parsed'] += len(transactions)
+    return transactions
+def iter_transactions(raw_lines, counters=None, block_size=PARSE_BLOCK_SIZE, paise=False):
+    """
+    Streams raw lines into clean transaction dictionaries, parsing
+    block_size lines at a time. Pass a dictionary from
+    new_parse_counters() as counters to see why lines were rejected.
+    With paise=True UnitPrice is an int number of paise (see utils/money.py).
+    Yields: dictionaries with the same keys as parse_transactions()
+    """
+
+    if counters is None:
+        counters = new_parse_counters()
+
+    lines = iter(raw_lines)
+    while True:
+        block = list(islice(lines, block_size))
+        if not block:
+            break
+        yield from _parse_block(block, counters, paise)
+def parse_transactions(raw_lines, counters=None, paise=False):
     """
     Parses raw lines into clean list of dictionaries.
+    UnitPrice is a float in rupees, or with paise=True an exact int number
+    of paise, which keeps every total computed from it exact.
     Returns: list of dictionaries with keys:
     ['TransactionID', 'Date', 'ProductID', 'ProductName',
      'Quantity', 'UnitPrice', 'CustomerID', 'Region']
     """
 
+    if counters is None:
+        counters = new_parse_counters()
+
     transactions = []
-    for line in raw_lines:
-        try:
-            parts = [p.strip() for p in line.split('|')]
+    lines = iter(raw_lines)
+    while True:
+        block = list(islice(lines, PARSE_BLOCK_SIZE))
+        if not block:
+            break
+        transactions.extend(_parse_block(block, counters, paise))
+    return transactions
+def parse_transactions_table(raw_lines, counters=None, block_size=PARSE_BLOCK_SIZE, paise=False):
+    """
+    Parses raw lines into a TransactionTable. Each block is parsed by the
+    same code as parse_transactions() and appended column-wise, so only
+    one block of dictionaries exists at a time. With paise=True the price
+    and amount columns hold int64 paise.
+    Returns: TransactionTable
+    """
 
-            # Skip rows with incorrect number of fields
-            if len(parts) != 8:
-                continue
+    if counters is None:
+        counters = new_parse_counters()
 
-            transaction_id, date, product_id, product_name, quantity, unit_price, customer_id, region = parts
+    table = TransactionTable(paise)
+    lines = iter(raw_lines)
+    while True:
+        block = list(islice(lines, block_size))
+        if not block:
+            break
+        transactions = _parse_block(block, counters, paise)
+        table.extend_columns({field: [t[field] for t in transactions] for field in BASE_FIELDS})
+    return table
+def _is_valid_transaction(t):
+    """
+    Applies the validation rules to one transaction.
+    Returns: True if the transaction is valid
+    """
 
-            # Remove commas from product name
-            product_name = product_name.replace(',', '')
+    try:
+        if not t['TransactionID'].startswith('T'):
+            return False
+        if not t['ProductID'].startswith('P'):
+            return False
+        if not t['CustomerID'].startswith('C'):
+            return False
+        if t['Quantity'] <= 0 or t['UnitPrice'] <= 0:
+            return False
+        if not t['Region']:
+            return False
+        return True
 
-            # Remove commas from numbers and convert types
-            quantity = int(quantity.replace(',', ''))
-            unit_price = float(unit_price.replace(',', ''))
-
-            # Build dictionary
-            transaction = {
-                'TransactionID': transaction_id,
-                'Date': date,
-                'ProductID': product_id,
-                'ProductName': product_name,
-                'Quantity': quantity,
-                'UnitPrice': unit_price,
-                'CustomerID': customer_id,
-                'Region': region
-            }
-
-            transactions.append(transaction)
-
-        except Exception:
-            # Skip any problematic line
-            continue
+    except Exception:
+        return False
+def new_filter_counters():
+    """
+    Creates the counters filled in by iter_valid_transactions().
+    """
 
-    return transactions
-def validate_and_filter(transactions, region=None, min_amount=None, max_amount=None):
+    return {'total_input': 0, 'invalid': 0, 'duplicates': 0, 'valid': 0, 'region_match': 0, 'final_count': 0}
+def iter_valid_transactions(transactions, region=None, min_amount=None, max_amount=None, counters=None,
+                            paise=False, dedup=None):
     """
-    Validates transactions and applies optional filters.
-    Returns: tuple (valid_transactions, invalid_count, filter_summary)
+    Streams valid transactions that pass the optional filters.
+    Pass a dictionary from new_filter_counters() as counters to collect
+    the numbers needed for build_filter_summary().
+    The amount bounds are always in rupees; pass paise=True when the
+    transactions were parsed in paise mode.
+    With a keep_first DuplicateFilter as dedup, valid rows whose
+    TransactionID was already seen are dropped and counted as duplicates
+    (other policies need the whole input; see validate_and_filter()).
+    Yields: transaction dictionaries
     """
 
-    valid_transactions = []
-    invalid_count = 0
+    if counters is None:
+        counters = new_filter_counters()
+    low, high = amount_bounds(min_amount, max_amount, paise)
 
     for t in transactions:
-        try:
-            # Validation rules
-            if not t['TransactionID'].startswith('T'):
-                invalid_count += 1
-                continue
-            if not t['ProductID'].startswith('P'):
-                invalid_count += 1
-                continue
-            if not t['CustomerID'].startswith('C'):
-                invalid_count += 1
-                continue
-            if t['Quantity'] <= 0 or t['UnitPrice'] <= 0:
-                invalid_count += 1
-                continue
-            if not t['Region']:
-                invalid_count += 1
-                continue
+        counters['total_input'] += 1
 
-            # Passed validation
-            valid_transactions.append(t)
-
-        except Exception:
-            invalid_count += 1
+        if not _is_valid_transaction(t):
+            counters['invalid'] += 1
             continue
+        if dedup is not None and dedup.seen_before(t['TransactionID']):
+            counters['duplicates'] += 1
+            continue
+        counters['valid'] += 1
 
-    # Filtering
-    filtered_transactions = valid_transactions
-
-    # Filter by region
-    if region:
-        filtered_transactions = [t for t in filtered_transactions if t['Region'] == region]
+        # Filter by region
+        if region:
+            if t['Region'] != region:
+                continue
+            counters['region_match'] += 1
 
-    # Filter by amount (Quantity * UnitPrice)
-    if min_amount or max_amount:
-        temp = []
-        for t in filtered_transactions:
+        # Filter by amount (Quantity * UnitPrice)
+        if low is not None or high is not None:
             amount = t['Quantity'] * t['UnitPrice']
-            if min_amount and amount < min_amount:
+            if low is not None and amount < low:
                 continue
-            if max_amount and amount > max_amount:
+            if high is not None and amount > high:
                 continue
-            temp.append(t)
-        filtered_transactions = temp
-
-    # Build summary
-    filter_summary = {
-        'total_input': len(transactions),
-        'invalid': invalid_count,
-        'filtered_by_region': len(valid_transactions) - len([t for t in valid_transactions if t['Region'] == region]) if region else 0,
-        'filtered_by_amount': len(valid_transactions) - len(filtered_transactions) if (min_amount or max_amount) else 0,
-        'final_count': len(filtered_transactions)
+
+        counters['final_count'] += 1
+        yield t
+def build_filter_summary(counters, region=None, min_amount=None, max_amount=None):
+    """
+    Builds the filter summary from counters filled by iter_valid_transactions().
+    Returns: dictionary in the format returned by validate_and_filter()
+    """
+
+    return {
+        'total_input': counters['total_input'],
+        'invalid': counters['invalid'],
+        # Counters saved before duplicate detection existed have no entry
+        'duplicates': counters.get('duplicates', 0),
+        'filtered_by_region': counters['valid'] - counters['region_match'] if region else 0,
+        'filtered_by_amount': counters['valid'] - counters['final_count'] if (min_amount or max_amount) else 0,
+        'final_count': counters['final_count']
     }
+def validate_and_filter(transactions, region=None, min_amount=None, max_amount=None, paise=False, dedup=None):
+    """
+    Validates transactions and applies optional filters.
+    Amount bounds are in rupees, also for transactions parsed with paise=True.
+    With a DuplicateFilter as dedup, repeated TransactionIDs among the
+    valid rows are resolved by its policy before the filters apply.
+    Returns: tuple (valid_transactions, invalid_count, filter_summary)
+    """
+
+    counters = new_filter_counters()
+    if dedup is not None:
+        valid = list(iter_valid_transactions(transactions, counters=counters, paise=paise))
+        kept, counters['duplicates'] = dedup.select(valid)
+        # The kept rows are valid; this pass only applies the filters
+        pass_counters = new_filter_counters()
+        filtered_transactions = list(iter_valid_transactions(kept, region, min_amount, max_amount, pass_counters,
+                                                             paise))
+        for key in ('valid', 'region_match', 'final_count'):
+            counters[key] = pass_counters[key]
+    else:
+        filtered_transactions = list(iter_valid_transactions(transactions, region, min_amount, max_amount, counters,
+                                                             paise))
+    filter_summary = build_filter_summary(counters, region, min_amount, max_amount)
+
+    return filtered_transactions, counters['invalid'], filter_summary
+def stream_sales_data(filename, region=None, min_amount=None, max_amount=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                      distinct_error=None, paise=False, dedup=None):
+    """
+    Reads, parses, validates and aggregates a sales file in a single pass
+    without holding its transactions in memory. dedup may be a keep_first
+    DuplicateFilter (a bloom-mode one keeps memory fixed).
+    Returns: tuple (aggregates, invalid_count, filter_summary)
+    where aggregates is the result of aggregate_transactions()
+    (distinct_error and paise are passed through to it)
+    """
 
-    return filtered_transactions, invalid_count, filter_summary
+    from utils.data_processor import aggregate_transactions
 
+    counters = new_filter_counters()
+    lines = iter_sales_lines(filename, chunk_size)
+    valid = iter_valid_transactions(iter_transactions(lines, paise=paise), region, min_amount, max_amount, counters,
+                                    paise, dedup)
+    aggregates = aggregate_transactions(valid, distinct_error, paise)
+    filter_summary = build_filter_summary(counters, region, min_amount, max_amount)
+
+    return aggregates, counters['invalid'], filter_summary
+@contextmanager
+def atomic_open(filename, mode='w', encoding='utf-8'):
+    """
+    Opens a temporary file next to filename for writing and renames it over
+    filename only once the block finishes without an error, so readers see
+    either the old file or the complete new one, never a partial write.
+    Yields: file object
+    """
+
+    directory, name = os.path.split(filename)
+    temp_file = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(temp_file, mode, encoding=None if 'b' in mode else encoding) as f:
+            yield f
+        os.replace(temp_file, filename)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+def write_lines_batched(f, lines, batch_size=WRITE_BATCH_SIZE):
+    """
+    Writes an iterable of lines (without newlines) to f, joining them into
+    one string per batch_size lines so each write() call moves a large buffer.
+    Returns: int (number of lines written)
+    """
 
+    count = 0
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            f.write('\n'.join(batch) + '\n')
+            count += len(batch)
+            batch = []
+    if batch:
+        f.write('\n'.join(batch) + '\n')
+        count += len(batch)
+    return count
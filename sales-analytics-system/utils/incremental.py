@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+
+from utils.file_handler import (
+    atomic_open,
+    iter_sales_lines,
+    iter_range_lines,
+    iter_transactions,
+    iter_valid_transactions,
+    new_filter_counters,
+    build_filter_summary
+)
+from utils.data_processor import aggregate_transactions, merge_aggregates
+from utils.rfm import new_rfm_state, build_rfm_state, merge_rfm_state, rfm_state_to_dict, rfm_state_from_dict
+from utils.sketches import HyperLogLog
+from utils.compression import detect_compression
+
+STATE_FILE = 'data/sales_state.json'
+STATE_VERSION = 3
+CHECKSUM_WINDOW = 64 * 1024  # bytes hashed at each end of the processed region
+
+
+def _checksum(filename, start, end):
+    """
+    Returns: hex sha256 of the bytes between offsets start and end
+    """
+
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(remaining, 1024 * 1024))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+def build_watermark(filename, offset):
+    """
+    Records how far into filename the state has consumed, with checksums
+    of the first and last CHECKSUM_WINDOW bytes of that region so a
+    rewritten file can be told apart from an appended one.
+    Returns: dictionary
+    """
+
+    ends_with_newline = True
+    if offset > 0:
+        with open(filename, 'rb') as f:
+            f.seek(offset - 1)
+            ends_with_newline = f.read(1) == b'\n'
+
+    return {
+        'source': os.path.abspath(filename),
+        'offset': offset,
+        'head_checksum': _checksum(filename, 0, min(offset, CHECKSUM_WINDOW)),
+        'tail_checksum': _checksum(filename, max(0, offset - CHECKSUM_WINDOW), offset),
+        'ends_with_newline': ends_with_newline
+    }
+def check_watermark(filename, watermark):
+    """
+    Checks whether filename is the file the watermark was taken from with
+    only new data appended after it.
+    Returns: tuple (ok, reason)
+    """
+
+    if watermark.get('source') != os.path.abspath(filename):
+        return False, "state belongs to a different file"
+
+    size = os.path.getsize(filename)
+    offset = watermark['offset']
+    if size < offset:
+        return False, "file was truncated"
+    if size > offset and not watermark.get('ends_with_newline', True):
+        return False, "last processed line was extended"
+    if _checksum(filename, 0, min(offset, CHECKSUM_WINDOW)) != watermark['head_checksum']:
+        return False, "file was rewritten"
+    if _checksum(filename, max(0, offset - CHECKSUM_WINDOW), offset) != watermark['tail_checksum']:
+        return False, "file was rewritten"
+    return True, "appended"
+def _encode_distinct(values):
+    if isinstance(values, HyperLogLog):
+        return {'hll': values.to_dict()}
+    return list(values)
+def _decode_distinct(values):
+    if isinstance(values, dict):
+        return HyperLogLog.from_dict(values['hll'])
+    return set(values)
+def _encode_aggregates(aggregates):
+    """
+    Converts aggregate state to JSON-serialisable form (sets become lists,
+    HyperLogLog sketches become dictionaries).
+    """
+
+    encoded = dict(aggregates)
+    encoded['customers'] = {
+        customer: dict(stats, products_bought=_encode_distinct(stats['products_bought']))
+        for customer, stats in aggregates['customers'].items()
+    }
+    encoded['daily'] = {
+        date: dict(stats, unique_customers=_encode_distinct(stats['unique_customers']))
+        for date, stats in aggregates['daily'].items()
+    }
+    return encoded
+def _decode_aggregates(encoded):
+    """
+    Restores aggregate state written by _encode_aggregates().
+    """
+
+    aggregates = dict(encoded)
+    aggregates['customers'] = {
+        customer: dict(stats, products_bought=_decode_distinct(stats['products_bought']))
+        for customer, stats in encoded['customers'].items()
+    }
+    aggregates['daily'] = {
+        date: dict(stats, unique_customers=_decode_distinct(stats['unique_customers']))
+        for date, stats in encoded['daily'].items()
+    }
+    return aggregates
+def load_state(state_file=STATE_FILE):
+    """
+    Loads persisted aggregate state.
+    Returns: state dictionary, or None if missing, unreadable or outdated
+    """
+
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable state file {state_file}: {e}")
+        return None
+
+    if state.get('version') != STATE_VERSION:
+        return None
+
+    state['aggregates'] = _decode_aggregates(state['aggregates'])
+    state['rfm'] = rfm_state_from_dict(state['rfm'])
+    return state
+def save_state(state, state_file=STATE_FILE):
+    """
+    Persists aggregate state, replacing the file atomically.
+    """
+
+    data = dict(state, aggregates=_encode_aggregates(state['aggregates']), rfm=rfm_state_to_dict(state['rfm']))
+
+    directory = os.path.dirname(state_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with atomic_open(state_file) as f:
+        json.dump(data, f)
+def _header_end(filename):
+    """
+    Returns: byte offset just after the header line
+    """
+
+    with open(filename, 'rb') as f:
+        f.readline()
+        return f.tell()
+def update_state(filename, state_file=STATE_FILE, distinct_error=None, paise=False):
+    """
+    Brings the persisted state up to date with filename.
+    Only the bytes appended since the last run are parsed and merged in.
+    If the file was truncated or rewritten, there is no state yet, or the
+    state was built with a different distinct_error or money mode (paise),
+    the state is rebuilt from the whole file. Paise state stays exact no
+    matter how many runs it was merged over.
+    The updated state is returned but not saved; call save_state() once
+    the rest of the run has succeeded.
+    Returns: tuple (state, new_transactions, full_rebuild)
+    """
+
+    state = load_state(state_file)
+    full_rebuild = state is None
+    # Offsets into compressed bytes cannot be resumed from
+    compressed = detect_compression(filename) is not None
+
+    if state is not None:
+        ok, reason = check_watermark(filename, state['watermark'])
+        if ok and state.get('distinct_error') != distinct_error:
+            ok, reason = False, "distinct count mode changed"
+        if ok and state.get('paise', False) != paise:
+            ok, reason = False, "money mode changed"
+        if ok and compressed:
+            ok, reason = False, "compressed files are always re-read in full"
+        if not ok:
+            print(f"Incremental state is stale ({reason}); rebuilding from scratch.")
+            full_rebuild = True
+
+    if full_rebuild:
+        state = {
+            'version': STATE_VERSION,
+            'distinct_error': distinct_error,
+            'paise': paise,
+            'counters': new_filter_counters(),
+            'aggregates': aggregate_transactions([], distinct_error, paise),
+            'rfm': new_rfm_state(paise),
+            'enrichment': {'matched': 0, 'unmatched': 0, 'unmatched_products': []}
+        }
+        start = _header_end(filename)
+    else:
+        start = state['watermark']['offset']
+
+    end = os.path.getsize(filename)
+
+    counters = new_filter_counters()
+    lines = iter_sales_lines(filename) if compressed else iter_range_lines(filename, start, end)
+    new_transactions = list(iter_valid_transactions(iter_transactions(lines, paise=paise), counters=counters,
+                                                    paise=paise))
+
+    for key, value in counters.items():
+        state['counters'][key] = state['counters'].get(key, 0) + value
+    merge_aggregates(state['aggregates'], aggregate_transactions(new_transactions, distinct_error, paise))
+    merge_rfm_state(state['rfm'], build_rfm_state(new_transactions, paise))
+    state['watermark'] = build_watermark(filename, end)
+
+    return state, new_transactions, full_rebuild
+def merge_enrichment_summary(state, summary):
+    """
+    Adds the enrichment counts of this run to the persisted totals.
+    Rows keep the match status they had when they were first enriched.
+    Unmatched products are kept once each, in first-seen order, as in
+    enrich_sales_data(), so the state does not grow with every run.
+    """
+
+    enrichment = state['enrichment']
+    enrichment['matched'] += summary['matched']
+    enrichment['unmatched'] += summary['unmatched']
+    # States written before names were deduplicated may repeat them
+    enrichment['unmatched_products'] = list(dict.fromkeys(enrichment['unmatched_products'] +
+                                                          summary['unmatched_products']))
+
+def state_filter_summary(state):
+    """
+    Returns: filter summary for all rows folded into the state
+    """
+
+    return build_filter_summary(state['counters'])
@@ -0,0 +1,253 @@
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Profiler that @timed functions report to; None means instrumentation is off
+_active = None
+# Per-thread depth of @timed calls, so only the outermost call is recorded
+_timed_calls = threading.local()
+
+
+def peak_rss_mb():
+    """
+    Returns: float (peak resident set size of this process in MB), or None
+    where the platform does not report it
+    """
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+class PipelineProfiler:
+    """
+    Records wall time, CPU time, memory and row counts per pipeline stage.
+    Stages are opened with begin() and closed with end(rows=...); stage
+    names listed in cprofile_stages are also run under cProfile. While the
+    profiler is active, functions decorated with @timed record a call entry
+    too. CPU time is process-wide, so stages overlapping with other threads
+    include their CPU time as well. The tracemalloc peak is process-wide
+    too: it is only reset when a stage starts with no other stage open,
+    and stages that overlap another one have their peak marked as shared.
+    """
+
+    def __init__(self, trace_memory=False, cprofile_stages=(), cprofile_dir=None):
+        self.trace_memory = trace_memory
+        self.cprofile_stages = set(cprofile_stages)
+        self.cprofile_dir = cprofile_dir
+        self.records = []
+        self._open = {}
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    def activate(self):
+        """
+        Makes this the profiler that @timed functions report to.
+        """
+
+        global _active
+        _active = self
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return self
+
+    def deactivate(self):
+        global _active
+        if _active is self:
+            _active = None
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def begin(self, name):
+        """
+        Starts timing a stage.
+        """
+
+        stage = {
+            'wall': time.perf_counter(),
+            'cpu': time.process_time(),
+            'started_at': time.perf_counter() - self.started,
+            'profile': None,
+            'shared_peak': False
+        }
+        with self._lock:
+            if self._open:
+                # Another stage (e.g. the background fetch) is running; a
+                # reset would clobber its peak, and ours includes its memory
+                stage['shared_peak'] = True
+                for other in self._open.values():
+                    other['shared_peak'] = True
+            elif self.trace_memory and tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            self._open[name] = stage
+        if name in self.cprofile_stages:
+            stage['profile'] = cProfile.Profile()
+            stage['profile'].enable()
+
+    def end(self, name, rows=None):
+        """
+        Finishes a stage started with begin().
+        Returns: the recorded entry
+        """
+
+        with self._lock:
+            stage = self._open.pop(name)
+        if stage['profile'] is not None:
+            stage['profile'].disable()
+            self._save_profile(name, stage['profile'])
+
+        record = {
+            'stage': name,
+            'kind': 'stage',
+            'started_at': round(stage['started_at'], 6),
+            'wall_s': time.perf_counter() - stage['wall'],
+            'cpu_s': time.process_time() - stage['cpu'],
+            'rows': rows,
+            'peak_rss_mb': peak_rss_mb(),
+            'peak_traced_mb': None,
+            'peak_shared': stage['shared_peak']
+        }
+        if self.trace_memory and tracemalloc.is_tracing():
+            record['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def record_call(self, name, wall_s, cpu_s, rows=None):
+        with self._lock:
+            self.records.append({
+                'stage': name,
+                'kind': 'function',
+                'started_at': None,
+                'wall_s': wall_s,
+                'cpu_s': cpu_s,
+                'rows': rows,
+                'peak_rss_mb': None,
+                'peak_traced_mb': None,
+                'peak_shared': False
+            })
+
+    def _save_profile(self, name, profile):
+        stream = io.StringIO()
+        stats = pstats.Stats(profile, stream=stream).sort_stats('cumulative')
+        stats.print_stats(15)
+        print(f"\ncProfile for stage '{name}':\n{stream.getvalue()}")
+        if self.cprofile_dir:
+            safe_name = ''.join(c if c.isalnum() else '_' for c in name)
+            os.makedirs(self.cprofile_dir, exist_ok=True)
+            stats.dump_stats(os.path.join(self.cprofile_dir, f"profile_{safe_name}.prof"))
+
+    def summary(self):
+        """
+        Combines records with the same name (e.g. repeated function calls).
+        Returns: list of dictionaries in first-seen order
+        """
+
+        combined = {}
+        for record in self.records:
+            entry = combined.get(record['stage'])
+            if entry is None:
+                entry = combined[record['stage']] = dict(record, calls=0, wall_s=0.0, cpu_s=0.0, rows=None)
+            entry['calls'] += 1
+            entry['wall_s'] += record['wall_s']
+            entry['cpu_s'] += record['cpu_s']
+            entry['peak_shared'] = entry['peak_shared'] or record['peak_shared']
+            if record['rows'] is not None:
+                entry['rows'] = (entry['rows'] or 0) + record['rows']
+            for key in ('peak_rss_mb', 'peak_traced_mb'):
+                if record[key] is not None:
+                    entry[key] = max(entry[key] or 0, record[key])
+        return list(combined.values())
+
+    def format_table(self):
+        """
+        Returns: the summary as a printable table (string)
+        """
+
+        entries = self.summary()
+        names = [entry['stage'] if entry['kind'] == 'stage' else f"  {entry['stage']}" for entry in entries]
+        # Wide enough for the longest name, so @timed functions stay distinguishable
+        width = max([len('Stage')] + [len(name) for name in names])
+        lines = [
+            f"{'Stage':<{width}} {'Calls':>5} {'Wall s':>9} {'CPU s':>9} {'Rows':>10} {'Rows/s':>11} {'RSS MB':>8} "
+            f"{'Traced MB':>9}",
+            "-" * (width + 68)
+        ]
+        shared = False
+        for name, entry in zip(names, entries):
+            rows = entry['rows']
+            rate = f"{rows / entry['wall_s']:,.0f}" if rows and entry['wall_s'] > 0 else "-"
+            rss = f"{entry['peak_rss_mb']:.1f}" if entry['peak_rss_mb'] is not None else "-"
+            traced = f"{entry['peak_traced_mb']:.1f}" if entry['peak_traced_mb'] is not None else "-"
+            if entry['peak_traced_mb'] is not None and entry['peak_shared']:
+                traced += "*"
+                shared = True
+            lines.append(
+                f"{name:<{width}} {entry['calls']:>5} {entry['wall_s']:>9.4f} {entry['cpu_s']:>9.4f} "
+                f"{rows if rows is not None else '-':>10} {rate:>11} {rss:>8} {traced:>9}"
+            )
+        if shared:
+            lines.append("* peak shared with stages running at the same time")
+        lines.append(f"Total wall time: {time.perf_counter() - self.started:.4f} s")
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        """
+        Writes the raw records and the summary as JSON for tracking
+        regressions across runs.
+        """
+
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'total_wall_s': time.perf_counter() - self.started,
+                'summary': self.summary(),
+                'records': self.records
+            }, f, indent=2)
+
+
+def timed(func):
+    """
+    Decorator that records each call of func with the active profiler.
+    When no profiler is active it only costs one global lookup per call.
+    Row counts are taken from len() of the first argument when it has one.
+    Calls made from inside another @timed function are not recorded, so
+    nested work is not counted twice.
+    """
+
+    name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _active
+        depth = getattr(_timed_calls, 'depth', 0)
+        if profiler is None or depth:
+            return func(*args, **kwargs)
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        _timed_calls.depth = 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _timed_calls.depth = 0
+            first = args[0] if args else None
+            # Aggregate state is a dict; only count rows for row containers
+            rows = len(first) if hasattr(first, '__len__') and not isinstance(first, (dict, str)) else None
+            profiler.record_call(name, time.perf_counter() - wall, time.process_time() - cpu, rows)
+
+    return wrapper
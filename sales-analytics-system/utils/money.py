@@ -0,0 +1,93 @@
+from decimal import Decimal, InvalidOperation, ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_UP
+
+PAISE_PER_RUPEE = 100
+
+
+def parse_paise(text):
+    """
+    Converts a rupee amount written in decimal (e.g. '1916', '1916.5',
+    '0.75') to an exact whole number of paise, without going through a
+    binary float. Digits past the second decimal place are rounded half up.
+    Raises ValueError, like float(), for text that is not a finite number.
+    Returns: int
+    """
+
+    # Whole rupees and unsigned 'rupees.paise' are the common cases and
+    # need no Decimal (or a raised exception)
+    whole, dot, fraction = text.partition('.')
+    if not dot:
+        try:
+            return int(text) * PAISE_PER_RUPEE
+        except ValueError:
+            pass
+    elif 0 < len(fraction) <= 2 and fraction.isdecimal() and whole.isdecimal():
+        return int(whole) * PAISE_PER_RUPEE + int(fraction) * (10 if len(fraction) == 1 else 1)
+
+    try:
+        value = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"could not convert string to paise: {text!r}") from None
+    if not value.is_finite():
+        raise ValueError(f"could not convert string to paise: {text!r}")
+    return int(value.scaleb(2).to_integral_value(ROUND_HALF_UP))
+def to_paise(amount):
+    """
+    Converts a rupee amount given as a number to whole paise, using its
+    shortest decimal form (so 0.29 becomes 29, not 28).
+    Returns: int
+    """
+
+    return parse_paise(str(amount))
+def amount_bounds(min_amount, max_amount, paise=False):
+    """
+    Normalises the rupee bounds of an amount filter; a falsy bound means
+    no bound. With paise=True the bounds are converted to whole paise,
+    rounding the lower bound up and the upper bound down, so comparing
+    integer amounts against them keeps exactly the rows a comparison in
+    rupees would.
+    Returns: tuple (low, high), each None when unbounded
+    """
+
+    low = min_amount or None
+    high = max_amount or None
+    if paise:
+        if low is not None:
+            low = int(Decimal(str(low)).scaleb(2).to_integral_value(ROUND_CEILING))
+        if high is not None:
+            high = int(Decimal(str(high)).scaleb(2).to_integral_value(ROUND_FLOOR))
+    return low, high
+def paise_text(amount):
+    """
+    Formats whole paise the way str() formats the same price parsed as a
+    float rupee value (19165 -> '191.65', 191600 -> '1916.0'), so files
+    written in paise mode are identical to the default ones.
+    Returns: string
+    """
+
+    # int / int is correctly rounded and repr() is the shortest round-trip
+    # form, which is the exact two-decimal value for any realistic price
+    return str(amount / PAISE_PER_RUPEE)
+def average_amount(total, count, paise=False):
+    """
+    Divides a money total by a count. In paise mode the quotient is kept
+    as an exact Decimal number of paise, so format_inr() rounds it
+    correctly instead of a rounded float.
+    Returns: float, or Decimal paise when paise=True (0 when count is 0)
+    """
+
+    if not count:
+        return 0
+    if paise:
+        return Decimal(total) / count
+    return total / count
+def format_inr(amount, paise=False, digits=2):
+    """
+    Formats a money value as '₹1,234.50'. In paise mode amount is a whole
+    (or Decimal) number of paise and is formatted exactly; the output is
+    identical to f"₹{rupees:,.2f}" on the equivalent rupee value.
+    Returns: string
+    """
+
+    if paise:
+        amount = Decimal(amount).scaleb(-2)
+    return f"₹{amount:,.{digits}f}"
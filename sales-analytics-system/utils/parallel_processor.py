@@ -0,0 +1,112 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from utils.file_handler import (
+    iter_sales_lines,
+    iter_range_lines,
+    iter_transactions,
+    iter_valid_transactions,
+    new_filter_counters,
+    build_filter_summary,
+    split_file_ranges
+)
+from utils.data_processor import aggregate_transactions, merge_aggregates
+from utils.compression import detect_compression
+from utils.rfm import new_rfm_state, build_rfm_state, merge_rfm_state
+
+
+def _process_range(task):
+    """
+    Worker: parses, validates, filters and aggregates one byte range.
+    Only the mergeable state goes back to the parent, never the rows.
+    Returns: tuple (counters, aggregates, rfm_state or None, filter_options)
+    """
+
+    filename, start, end, region, min_amount, max_amount, distinct_error, paise, track_customers = task
+
+    # Regions and amount range over all parsed rows, for the filter prompt
+    options = {'regions': set(), 'min_amount': None, 'max_amount': None}
+
+    def track_options(transactions):
+        for t in transactions:
+            if t['Region']:
+                options['regions'].add(t['Region'])
+            amount = t['Quantity'] * t['UnitPrice']
+            if options['min_amount'] is None or amount < options['min_amount']:
+                options['min_amount'] = amount
+            if options['max_amount'] is None or amount > options['max_amount']:
+                options['max_amount'] = amount
+            yield t
+
+    counters = new_filter_counters()
+    # A range of (None, None) stands for the whole (compressed) file
+    lines = iter_sales_lines(filename) if start is None else iter_range_lines(filename, start, end)
+    parsed = track_options(iter_transactions(lines, paise=paise))
+    valid = list(iter_valid_transactions(parsed, region, min_amount, max_amount, counters, paise))
+
+    return (counters, aggregate_transactions(valid, distinct_error, paise, track_customers),
+            build_rfm_state(valid, paise) if track_customers else None, options)
+def _read_valid_rows(filename, region, min_amount, max_amount, paise):
+    """
+    Returns: list of the valid transactions of filename that pass the filters
+    """
+
+    parsed = iter_transactions(iter_sales_lines(filename), paise=paise)
+    return list(iter_valid_transactions(parsed, region, min_amount, max_amount, paise=paise))
+def parallel_process_sales_data(filename, workers, region=None, min_amount=None, max_amount=None, chunks_per_worker=4,
+                                distinct_error=None, paise=False, keep_rows=False, track_customers=True):
+    """
+    Reads, parses, validates and aggregates a sales file across a pool of
+    worker processes. The file is split into newline-aligned byte ranges;
+    partial results are merged in file order, so transactions and groups
+    come out in the same order as a serial run. With distinct_error the
+    per-worker HyperLogLog sketches are merged instead of exact sets.
+    With paise=True money is summed as integer paise, so the totals are
+    exactly those of a serial run whatever the number of workers.
+    Compressed files cannot be split at byte offsets, so they are streamed
+    whole by a single worker (decompression still overlaps with parsing).
+    The per-worker RFM / cohort states are merged the same way.
+    Sending rows back from the workers costs more than parsing them, so
+    they never do: with keep_rows (for callers that need the rows, e.g. to
+    enrich them) the parent parses the valid rows itself on a thread while
+    the workers aggregate, and otherwise 'transactions' is None. With
+    track_customers=False no per-customer state is built: 'customers' in
+    the aggregates is empty and 'rfm' is None.
+    Returns: dictionary with keys
+    'transactions', 'invalid_count', 'filter_summary', 'aggregates', 'rfm', 'filter_options'
+    """
+
+    if detect_compression(filename):
+        ranges = [(None, None)]
+    else:
+        ranges = split_file_ranges(filename, max(workers, 1) * chunks_per_worker)
+    tasks = [(filename, start, end, region, min_amount, max_amount, distinct_error, paise, track_customers)
+             for start, end in ranges]
+
+    counters = new_filter_counters()
+    aggregates = aggregate_transactions([], distinct_error, paise)
+    rfm_state = new_rfm_state(paise) if track_customers else None
+    options = {'regions': set(), 'min_amount': None, 'max_amount': None}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, ThreadPoolExecutor(max_workers=1) as reader:
+        rows = reader.submit(_read_valid_rows, filename, region, min_amount, max_amount, paise) if keep_rows else None
+        # map() yields results in submission (file) order
+        for part_counters, part_aggregates, part_rfm, part_options in executor.map(_process_range, tasks):
+            for key, value in part_counters.items():
+                counters[key] += value
+            merge_aggregates(aggregates, part_aggregates)
+            if track_customers:
+                merge_rfm_state(rfm_state, part_rfm)
+
+            options['regions'] |= part_options['regions']
+            for key, pick in (('min_amount', min), ('max_amount', max)):
+                if part_options[key] is not None:
+                    options[key] = part_options[key] if options[key] is None else pick(options[key], part_options[key])
+
+    return {
+        'transactions': rows.result() if keep_rows else None,
+        'invalid_count': counters['invalid'],
+        'filter_summary': build_filter_summary(counters, region, min_amount, max_amount),
+        'aggregates': aggregates,
+        'rfm': rfm_state,
+        'filter_options': options
+    }
@@ -0,0 +1,159 @@
+from bisect import bisect_left, bisect_right
+
+from utils.file_handler import _is_valid_transaction
+from utils.data_processor import aggregate_transactions
+from utils.money import amount_bounds
+from utils.transaction_table import TransactionTable
+
+
+class TransactionQuery:
+    """
+    Answers repeated region / amount filters over one set of transactions
+    without re-scanning or re-validating them.
+    Validation runs once when the query is built. Row offsets are then kept
+    sorted by amount (Quantity * UnitPrice), once for all rows and once per
+    region, so a filter is a dictionary lookup plus two binary searches.
+    Selected rows come back in their original order, which keeps reports
+    identical to validate_and_filter(). Aggregations of a filter are
+    memoized, so building many report variants from one dataset only
+    aggregates each distinct filter once.
+    Filter bounds are always given in rupees; pass paise=True for
+    transactions parsed in paise mode (a TransactionTable says so itself).
+    With a DuplicateFilter as dedup, repeated TransactionIDs among the
+    valid rows are resolved once, before indexing.
+    """
+
+    def __init__(self, transactions, validated=False, paise=False, dedup=None):
+        self.transactions = transactions
+        self.total_input = len(transactions)
+        self.paise = transactions.paise if isinstance(transactions, TransactionTable) else paise
+
+        if validated:
+            self.valid_offsets = list(range(len(transactions)))
+        else:
+            self.valid_offsets = [i for i, t in enumerate(transactions) if _is_valid_transaction(t)]
+        self.invalid_count = self.total_input - len(self.valid_offsets)
+
+        self.duplicate_count = 0
+        if dedup is not None:
+            if isinstance(transactions, TransactionTable):
+                ids = [transactions.transaction_ids[i] for i in self.valid_offsets]
+            else:
+                ids = [transactions[i]['TransactionID'] for i in self.valid_offsets]
+            keep, self.duplicate_count = dedup.keep_offsets(ids)
+            if self.duplicate_count:
+                self.valid_offsets = [self.valid_offsets[k] for k in keep]
+
+        if isinstance(transactions, TransactionTable):
+            amounts = transactions.amount
+        else:
+            amounts = [t['Quantity'] * t['UnitPrice'] for t in transactions]
+
+        by_amount = sorted(self.valid_offsets, key=amounts.__getitem__)
+        self._all = ([amounts[i] for i in by_amount], by_amount)
+
+        # Walking the rows in amount order keeps every region's list sorted too
+        self._regions = {}
+        for i in by_amount:
+            region = transactions[i]['Region']
+            entry = self._regions.get(region)
+            if entry is None:
+                entry = self._regions[region] = ([], [])
+            entry[0].append(amounts[i])
+            entry[1].append(i)
+
+        self._selections = {}
+        self._aggregates = {}
+
+    def regions(self):
+        """
+        Returns: list of regions present in the valid rows
+        """
+
+        return list(self._regions)
+
+    def amount_range(self):
+        """
+        Returns: tuple (min_amount, max_amount) over the valid rows (in
+        paise for a paise query), or (None, None) when there are none
+        """
+
+        amounts = self._all[0]
+        return (amounts[0], amounts[-1]) if amounts else (None, None)
+
+    def offsets(self, region=None, min_amount=None, max_amount=None):
+        """
+        Finds the rows passing the filters, with the same rules as
+        validate_and_filter() (a falsy bound means no bound).
+        Returns: list of row offsets in original order
+        """
+
+        key = (region, min_amount, max_amount)
+        if key in self._selections:
+            return self._selections[key]
+
+        if region:
+            amounts, offsets = self._regions.get(region, ([], []))
+        else:
+            amounts, offsets = self._all
+
+        low, high = amount_bounds(min_amount, max_amount, self.paise)
+        start = bisect_left(amounts, low) if low is not None else 0
+        end = bisect_right(amounts, high) if high is not None else len(amounts)
+
+        selected = sorted(offsets[start:end])
+        self._selections[key] = selected
+        return selected
+
+    def select(self, region=None, min_amount=None, max_amount=None):
+        """
+        Returns: the transactions passing the filters (a list, or a
+        TransactionTable when the query was built from one)
+        """
+
+        offsets = self.offsets(region, min_amount, max_amount)
+        if isinstance(self.transactions, TransactionTable):
+            return self.transactions.take(offsets)
+        transactions = self.transactions
+        return [transactions[i] for i in offsets]
+
+    def filter_summary(self, region=None, min_amount=None, max_amount=None):
+        """
+        Returns: dictionary in the format returned by validate_and_filter()
+        """
+
+        valid = len(self.valid_offsets)
+        final_count = len(self.offsets(region, min_amount, max_amount))
+        region_match = len(self._regions.get(region, ([], []))[1]) if region else valid
+
+        return {
+            'total_input': self.total_input,
+            'invalid': self.invalid_count,
+            'duplicates': self.duplicate_count,
+            'filtered_by_region': valid - region_match if region else 0,
+            'filtered_by_amount': valid - final_count if (min_amount or max_amount) else 0,
+            'final_count': final_count
+        }
+
+    def filter(self, region=None, min_amount=None, max_amount=None):
+        """
+        Drop-in replacement for validate_and_filter() on the indexed rows.
+        Returns: tuple (valid_transactions, invalid_count, filter_summary)
+        """
+
+        return (self.select(region, min_amount, max_amount), self.invalid_count,
+                self.filter_summary(region, min_amount, max_amount))
+
+    def aggregate(self, region=None, min_amount=None, max_amount=None, distinct_error=None):
+        """
+        Aggregates the rows passing the filters; repeated calls with the
+        same arguments return the memoized result, so treat it as read-only.
+        Returns: dictionary in the format returned by aggregate_transactions()
+        """
+
+        key = (region, min_amount, max_amount, distinct_error)
+        if key not in self._aggregates:
+            self._aggregates[key] = aggregate_transactions(
+                self.select(region, min_amount, max_amount), distinct_error, self.paise
+            )
+        return self._aggregates[key]
@@ -0,0 +1,246 @@
+import datetime
+from bisect import bisect_left, bisect_right
+
+from utils.instrumentation import timed
+
+RFM_BINS = 5  # quintile scores, 1 (worst) to 5 (best)
+
+# Segments by recency and frequency score, first match wins:
+# (name, (lowest R, highest R), (lowest F, highest F))
+RFM_SEGMENTS = [
+    ('Champions', (4, 5), (4, 5)),
+    ('Loyal Customers', (3, 5), (3, 5)),
+    ('New Customers', (4, 5), (1, 1)),
+    ('Potential Loyalists', (3, 5), (1, 2)),
+    ('At Risk', (1, 2), (3, 5)),
+    ('Hibernating', (1, 2), (1, 2))
+]
+
+
+def new_rfm_state(paise=False):
+    """
+    Creates empty RFM / cohort state for update_rfm_state().
+    Format:
+    {
+        'paise': False,
+        'skipped': 0,
+        'customers': {'C001': {'first_purchase': '2024-12-01', 'last_purchase': '2024-12-20',
+                               'frequency': 3, 'monetary': 95000.0, 'months': {'2024-12'}}, ...}
+    }
+    """
+
+    return {'paise': paise, 'skipped': 0, 'customers': {}}
+@timed
+def update_rfm_state(state, transactions):
+    """
+    Adds transactions to RFM state in one pass, keeping per customer the
+    first and last purchase date, purchase count, money spent and the
+    months with a purchase. Rows whose Date is not an ISO date are
+    counted in 'skipped'. Chunks can be added one after another, or built
+    separately and combined with merge_rfm_state().
+    Returns: state
+    """
+
+    customers = state['customers']
+    # Date -> ('YYYY-MM-DD', 'YYYY-MM'), or None when it is not a valid date;
+    # a file holds few distinct dates, so each is parsed once
+    dates = {}
+    skipped = 0
+
+    for t in transactions:
+        parsed = dates.get(t['Date'], False)
+        if parsed is False:
+            try:
+                day = datetime.date.fromisoformat(t['Date'])
+                parsed = dates[t['Date']] = (day.isoformat(), day.isoformat()[:7])
+            except (TypeError, ValueError):
+                parsed = dates[t['Date']] = None
+        if parsed is None:
+            skipped += 1
+            continue
+        date, month = parsed
+
+        amount = t['Quantity'] * t['UnitPrice']
+        stats = customers.get(t['CustomerID'])
+        if stats is None:
+            customers[t['CustomerID']] = {'first_purchase': date, 'last_purchase': date, 'frequency': 1,
+                                          'monetary': amount, 'months': {month}}
+            continue
+        # ISO dates compare chronologically as strings
+        if date < stats['first_purchase']:
+            stats['first_purchase'] = date
+        if date > stats['last_purchase']:
+            stats['last_purchase'] = date
+        stats['frequency'] += 1
+        stats['monetary'] += amount
+        stats['months'].add(month)
+
+    state['skipped'] += skipped
+    return state
+def build_rfm_state(transactions, paise=False):
+    """
+    Returns: RFM state for transactions (see new_rfm_state())
+    """
+
+    return update_rfm_state(new_rfm_state(paise), transactions)
+def merge_rfm_state(target, other):
+    """
+    Merges the RFM state other into target in place. Customers new to
+    target are appended after its existing ones, like merge_aggregates().
+    Returns: target
+    """
+
+    if target['paise'] != other['paise']:
+        raise ValueError("cannot merge RFM state in rupees with RFM state in paise")
+
+    target['skipped'] += other['skipped']
+    for customer, stats in other['customers'].items():
+        merged = target['customers'].get(customer)
+        if merged is None:
+            target['customers'][customer] = dict(stats, months=set(stats['months']))
+            continue
+        merged['first_purchase'] = min(merged['first_purchase'], stats['first_purchase'])
+        merged['last_purchase'] = max(merged['last_purchase'], stats['last_purchase'])
+        merged['frequency'] += stats['frequency']
+        merged['monetary'] += stats['monetary']
+        merged['months'] |= stats['months']
+    return target
+def rfm_state_to_dict(state):
+    """
+    Returns: JSON-serialisable form of RFM state (month sets become sorted lists)
+    """
+
+    return dict(state, customers={
+        customer: dict(stats, months=sorted(stats['months']))
+        for customer, stats in state['customers'].items()
+    })
+def rfm_state_from_dict(data):
+    """
+    Restores RFM state written by rfm_state_to_dict().
+    """
+
+    return dict(data, customers={
+        customer: dict(stats, months=set(stats['months']))
+        for customer, stats in data['customers'].items()
+    })
+def _quantile_scores(values):
+    """
+    Scores values 1..RFM_BINS by rank, higher values scoring higher. Equal
+    values share the score of the middle of their run, so a value every
+    customer shares scores in the middle rather than at either end.
+    Returns: list of scores in the order of values
+    """
+
+    ordered = sorted(values)
+    n = len(ordered)
+    # A value's run of equal values covers [left, right) of the sorted list;
+    # its midpoint, as a fraction of n, picks the bin
+    return [1 + (bisect_left(ordered, value) + bisect_right(ordered, value)) * RFM_BINS // (2 * n)
+            for value in values]
+def _segment(r_score, f_score):
+    for name, (r_low, r_high), (f_low, f_high) in RFM_SEGMENTS:
+        if r_low <= r_score <= r_high and f_low <= f_score <= f_high:
+            return name
+    return 'Others'
+@timed
+def rfm_analysis(state, as_of=None):
+    """
+    Scores every customer on recency (days since the last purchase, as of
+    as_of; by default the latest purchase date in the data), frequency
+    (purchases) and monetary value (money spent) by quintile, 5 being the
+    best, and assigns a segment from RFM_SEGMENTS.
+    Returns: dictionary
+    {
+        'as_of': '2024-12-31',
+        'customers': {'C001': {'first_purchase': '2024-12-01', 'last_purchase': '2024-12-20',
+                               'recency_days': 11, 'frequency': 3, 'monetary': 95000.0,
+                               'r_score': 4, 'f_score': 5, 'm_score': 5, 'rfm_score': '455',
+                               'segment': 'Champions'}, ...},
+        'segments': {'Champions': {'customers': 6, 'monetary': 1520000.0}, ...}
+    }
+    Customers are sorted by RFM score, then monetary value, both descending;
+    segments follow the order of RFM_SEGMENTS.
+    """
+
+    customers = state['customers']
+    if not customers:
+        return {'as_of': as_of, 'customers': {}, 'segments': {}}
+
+    if as_of is None:
+        as_of = max(stats['last_purchase'] for stats in customers.values())
+    as_of_day = datetime.date.fromisoformat(as_of)
+
+    ids = list(customers)
+    recency = [(as_of_day - datetime.date.fromisoformat(customers[c]['last_purchase'])).days for c in ids]
+    # Fewer days since the last purchase is better, so rank the negation
+    r_scores = _quantile_scores([-days for days in recency])
+    f_scores = _quantile_scores([customers[c]['frequency'] for c in ids])
+    m_scores = _quantile_scores([customers[c]['monetary'] for c in ids])
+
+    scored = {}
+    for i, customer in enumerate(ids):
+        stats = customers[customer]
+        scored[customer] = {
+            'first_purchase': stats['first_purchase'],
+            'last_purchase': stats['last_purchase'],
+            'recency_days': recency[i],
+            'frequency': stats['frequency'],
+            'monetary': stats['monetary'],
+            'r_score': r_scores[i],
+            'f_score': f_scores[i],
+            'm_score': m_scores[i],
+            'rfm_score': f"{r_scores[i]}{f_scores[i]}{m_scores[i]}",
+            'segment': _segment(r_scores[i], f_scores[i])
+        }
+    scored = dict(sorted(scored.items(), key=lambda x: (x[1]['rfm_score'], x[1]['monetary']), reverse=True))
+
+    segments = {name: {'customers': 0, 'monetary': 0} for name, _, _ in RFM_SEGMENTS}
+    for stats in scored.values():
+        segment = segments.setdefault(stats['segment'], {'customers': 0, 'monetary': 0})
+        segment['customers'] += 1
+        segment['monetary'] += stats['monetary']
+
+    return {'as_of': as_of, 'customers': scored, 'segments': segments}
+def _month_index(month):
+    year, number = month.split('-')
+    return int(year) * 12 + int(number) - 1
+@timed
+def cohort_retention(state):
+    """
+    Groups customers by the month of their first purchase and counts, for
+    each later month up to the last month in the data, how many of them
+    bought again in it.
+    Returns: dictionary sorted by cohort month
+    {
+        '2024-11': {'customers': 20, 'active': [20, 9, 7], 'retention': [100.0, 45.0, 35.0]},
+        '2024-12': {'customers': 8, 'active': [8, 3], 'retention': [100.0, 37.5]},
+        ...
+    }
+    where active[k] and retention[k] (percent) are for the k-th month
+    after the cohort month
+    """
+
+    customers = state['customers']
+    if not customers:
+        return {}
+
+    last_index = max(_month_index(max(stats['months'])) for stats in customers.values())
+
+    cohorts = {}
+    for stats in customers.values():
+        cohort = min(stats['months'])
+        start = _month_index(cohort)
+        active = cohorts.get(cohort)
+        if active is None:
+            active = cohorts[cohort] = [0] * (last_index - start + 1)
+        for month in stats['months']:
+            active[_month_index(month) - start] += 1
+
+    return {
+        cohort: {
+            'customers': active[0],
+            'active': active,
+            'retention': [count / active[0] * 100 for count in active]
+        }
+        for cohort, active in sorted(cohorts.items())
+    }
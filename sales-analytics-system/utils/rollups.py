@@ -0,0 +1,122 @@
+import datetime
+from collections import deque
+
+ROLLING_WINDOWS = (7, 30)  # days
+
+
+def _new_bucket(start):
+    return {'start': start, 'revenue': 0, 'transaction_count': 0, 'customers': None}
+def _add_to_bucket(bucket, stats):
+    bucket['revenue'] += stats['revenue']
+    bucket['transaction_count'] += stats['transaction_count']
+    # Copy the first day's customers so the daily aggregates stay untouched
+    if bucket['customers'] is None:
+        bucket['customers'] = stats['unique_customers'].copy()
+    else:
+        bucket['customers'] |= stats['unique_customers']
+def _finish_buckets(buckets, previous_key):
+    """
+    Replaces customer sets with counts and adds the change against the
+    previous period (None when that period had no sales).
+    Returns: buckets
+    """
+
+    for key, bucket in buckets.items():
+        bucket['unique_customers'] = len(bucket.pop('customers'))
+        previous = buckets.get(previous_key(bucket['start']))
+        if previous and previous['revenue']:
+            bucket['change_pct'] = (bucket['revenue'] - previous['revenue']) / previous['revenue'] * 100
+        else:
+            bucket['change_pct'] = None
+    return buckets
+def _week_key(day):
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+def _previous_week_key(start):
+    return _week_key(datetime.date.fromisoformat(start) - datetime.timedelta(days=7))
+def _previous_month_key(start):
+    day = datetime.date.fromisoformat(start)
+    return f"{day.year - 1}-12" if day.month == 1 else f"{day.year}-{day.month - 1:02d}"
+def build_rollups(aggregates, windows=ROLLING_WINDOWS):
+    """
+    Builds day, week (ISO) and month buckets and trailing rolling revenue
+    in one chronological pass over the daily aggregates, so the cost grows
+    with the number of days rather than days x window length.
+    Rolling sums cover calendar days (days without sales count as zero)
+    and slide in O(1) per day: each day is added once and removed once.
+    Dates that are not valid ISO dates appear in 'daily' only.
+    Returns: dictionary
+    {
+        'daily': {'2024-12-01': {'revenue': ..., 'transaction_count': ..., 'unique_customers': ...}, ...},
+        'weekly': {'2024-W49': {'start': '2024-12-02', 'revenue': ..., 'transaction_count': ...,
+                                'unique_customers': ..., 'change_pct': ...}, ...},
+        'monthly': {'2024-12': {...same keys as weekly...}, ...},
+        'rolling': {7: {'2024-12-01': 123969.0, ...}, 30: {...}},
+        'peak_day': ('2024-12-02', 882906.0, 5)
+    }
+    """
+
+    daily_stats = aggregates['daily']
+
+    daily = {}
+    weekly = {}
+    monthly = {}
+    rolling = {window: {} for window in windows}
+    # Start from int 0 so paise revenue stays an exact int
+    sums = {window: 0 for window in windows}
+    queues = {window: deque() for window in windows}
+
+    peak_day, peak_revenue, peak_transactions = None, 0.0, 0
+
+    # ISO dates sort chronologically as strings, so ties resolve to the earliest day
+    for date in sorted(daily_stats):
+        stats = daily_stats[date]
+        revenue = stats['revenue']
+        daily[date] = {
+            'revenue': revenue,
+            'transaction_count': stats['transaction_count'],
+            'unique_customers': len(stats['unique_customers'])
+        }
+        if revenue > peak_revenue:
+            peak_day, peak_revenue, peak_transactions = date, revenue, stats['transaction_count']
+
+        try:
+            day = datetime.date.fromisoformat(date)
+        except ValueError:
+            continue
+
+        week = _week_key(day)
+        if week not in weekly:
+            weekly[week] = _new_bucket((day - datetime.timedelta(days=day.weekday())).isoformat())
+        _add_to_bucket(weekly[week], stats)
+
+        month = date[:7]
+        if month not in monthly:
+            monthly[month] = _new_bucket(f"{month}-01")
+        _add_to_bucket(monthly[month], stats)
+
+        ordinal = day.toordinal()
+        for window in windows:
+            queue = queues[window]
+            queue.append((ordinal, revenue))
+            sums[window] += revenue
+            while queue[0][0] <= ordinal - window:
+                sums[window] -= queue.popleft()[1]
+            if len(queue) == 1:
+                # Restart from the exact value so float error cannot build up
+                sums[window] = revenue
+            rolling[window][date] = sums[window]
+
+    return {
+        'daily': daily,
+        'weekly': _finish_buckets(weekly, _previous_week_key),
+        'monthly': _finish_buckets(monthly, _previous_month_key),
+        'rolling': rolling,
+        'peak_day': (peak_day, peak_revenue, peak_transactions)
+    }
+def is_rollups(value):
+    """
+    Returns: True if value was returned by build_rollups()
+    """
+
+    return isinstance(value, dict) and 'rolling' in value and 'peak_day' in value
@@ -0,0 +1,400 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from utils.file_handler import read_sales_data, parse_transactions
+from utils.data_processor import (
+    region_wise_sales,
+    top_products,
+    bottom_products,
+    top_customers,
+    customer_analysis,
+    sales_rollups,
+    daily_sales_trend,
+    find_peak_sales_day,
+    low_performing_products
+)
+from utils.api_handler import CATALOG_DEADLINE, CatalogFetch, enrich_sales_data, new_enrichment_summary
+from utils.money import average_amount
+from utils.query import TransactionQuery
+from utils.sketches import HyperLogLog
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8000
+RESULT_CACHE_SIZE = 256  # encoded responses kept by the LRU cache
+
+# Query parameters that select rows, as for validate_and_filter()
+FILTER_PARAMS = ('region', 'min_amount', 'max_amount')
+
+
+class LRUCache:
+    """
+    Least-recently-used cache of at most maxsize entries, with hit and
+    miss counters. Not thread-safe on its own; AnalyticsService guards it.
+    """
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns: the cached value (marking it most recently used), or None
+        """
+
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        """
+        Returns: dictionary {'size': ..., 'maxsize': ..., 'hits': ..., 'misses': ...}
+        """
+
+        return {'size': len(self.entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+def _json_default(value):
+    """
+    Encodes the non-JSON values found in analysis results.
+    """
+
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, HyperLogLog):
+        return len(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serialisable")
+def _parse_filters(params):
+    """
+    Reads region / min_amount / max_amount from query parameters.
+    Returns: tuple (region, min_amount, max_amount)
+    """
+
+    region = params.get('region') or None
+    bounds = []
+    for name in ('min_amount', 'max_amount'):
+        text = params.get(name)
+        try:
+            bounds.append(float(text) if text else None)
+        except ValueError:
+            raise ValueError(f"{name} must be a number") from None
+    return region, bounds[0], bounds[1]
+def _int_param(params, name, default):
+    text = params.get(name)
+    if not text:
+        return default
+    try:
+        value = int(text)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer") from None
+    if value < 0:
+        raise ValueError(f"{name} must not be negative")
+    return value
+
+
+class AnalyticsService:
+    """
+    Keeps one sales file parsed, validated, indexed and enriched in memory
+    and answers report queries from it.
+    Rows are loaded once into a TransactionQuery, so a filter costs two
+    binary searches and each distinct filter is aggregated once. Encoded
+    responses are kept in an LRU cache keyed by endpoint and parameters.
+    Every request compares the file's size and mtime with the loaded copy;
+    when the file changed, the data is reloaded and the cache cleared.
+    A reload is built outside the request lock and swapped in under it, so
+    other requests keep answering from the loaded copy meanwhile; only one
+    request reloads at a time.
+    Reloads enrich with the product mapping already held and start a
+    CatalogFetch in the background; a request arriving after it finished
+    swaps the new mapping in, so no request waits on the catalog API.
+    """
+
+    def __init__(self, filename, paise=False, distinct_error=None, cache_size=RESULT_CACHE_SIZE,
+                 fetch_catalog=True):
+        self.filename = filename
+        self.paise = paise
+        self.distinct_error = distinct_error
+        self.fetch_catalog = fetch_catalog
+        self.cache = LRUCache(cache_size)
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+        self.reloads = 0
+        self.signature = None
+        self.query = None
+        self.enrichment = None
+        self.mapping = {}
+        self.catalog = CatalogFetch() if fetch_catalog else None
+        self.loaded_at = None
+        self.endpoints = {
+            '/health': self._health,
+            '/summary': self._summary,
+            '/regions': self._regions,
+            '/products/top': self._top_products,
+            '/products/bottom': self._bottom_products,
+            '/products/low': self._low_products,
+            '/customers': self._customers,
+            '/customers/top': self._top_customers,
+            '/daily': self._daily,
+            '/rollups': self._rollups,
+            '/peak': self._peak,
+            '/enrichment': self._enrichment
+        }
+        # Before serving, the first load may wait for the catalog
+        self._take_catalog(CATALOG_DEADLINE)
+        self.load()
+
+    def _file_signature(self):
+        stat = os.stat(self.filename)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _take_catalog(self, timeout=0):
+        """
+        Takes over the product mapping of the background catalog fetch once
+        it has finished, waiting up to timeout seconds for it. A failed
+        fetch leaves the current mapping in place.
+        Returns: True if a new mapping was taken over
+        """
+
+        if self.catalog is None or not self.catalog.done.wait(timeout):
+            return False
+        mapping = self.catalog.mapping
+        self.catalog = None
+        if not mapping:
+            return False
+        self.mapping = mapping
+        return True
+
+    def _enrich(self, query):
+        enrichment = new_enrichment_summary()
+        if self.fetch_catalog:
+            enrich_sales_data(query.select(), self.mapping, summary=enrichment)
+        return enrichment
+
+    def load(self):
+        """
+        Reads, parses, indexes and enriches the sales file with the current
+        product mapping, then replaces the loaded data and clears the result
+        cache under the request lock. Only the swap holds the lock.
+        """
+
+        signature = self._file_signature()
+        transactions = parse_transactions(read_sales_data(self.filename), paise=self.paise)
+        query = TransactionQuery(transactions, paise=self.paise)
+        # Aggregate the unfiltered view up front; most dashboards start there
+        query.aggregate(distinct_error=self.distinct_error)
+        enrichment = self._enrich(query)
+
+        with self.lock:
+            self.query = query
+            self.enrichment = enrichment
+            self.signature = signature
+            self.loaded_at = time.time()
+            self.cache.clear()
+
+    def refresh(self):
+        """
+        Reloads the data if the source file changed since it was loaded,
+        and re-enriches it when a background catalog fetch has finished.
+        Called without the request lock; while another request is reloading
+        it returns at once.
+        Returns: True if it was reloaded
+        """
+
+        if not self.reload_lock.acquire(blocking=False):
+            # Another request is reloading; answer from the copy loaded now
+            return False
+        try:
+            try:
+                changed = self._file_signature() != self.signature
+            except OSError:
+                # Keep serving the last good copy while the file is being replaced
+                return False
+            if changed:
+                self._take_catalog()
+                self.load()
+                self.reloads += 1
+                if self.fetch_catalog and self.catalog is None:
+                    # The catalog may have changed too; fetch it off the request path
+                    self.catalog = CatalogFetch()
+            elif self._take_catalog():
+                enrichment = self._enrich(self.query)
+                with self.lock:
+                    self.enrichment = enrichment
+                    self.cache.clear()
+            return changed
+        finally:
+            self.reload_lock.release()
+
+    def handle(self, path, params):
+        """
+        Answers one query. params maps parameter names to single values.
+        Returns: tuple (status, body bytes)
+        """
+
+        handler = self.endpoints.get(path)
+        if handler is None:
+            return 404, self._encode({'error': f"unknown endpoint {path}", 'endpoints': sorted(self.endpoints)})
+
+        self.refresh()
+        with self.lock:
+            if path == '/health':
+                return 200, self._encode(handler(None, params))
+
+            key = (path, tuple(sorted(params.items())))
+            body = self.cache.get(key)
+            if body is not None:
+                return 200, body
+
+            try:
+                filters = _parse_filters(params)
+                result = handler(self.query.aggregate(*filters, self.distinct_error), params)
+            except ValueError as e:
+                return 400, self._encode({'error': str(e)})
+
+            body = self._encode({
+                'filters': dict(zip(FILTER_PARAMS, filters)),
+                'filter_summary': self.query.filter_summary(*filters),
+                'paise': self.paise,
+                'result': result
+            })
+            self.cache.put(key, body)
+            return 200, body
+
+    @staticmethod
+    def _encode(document):
+        return json.dumps(document, default=_json_default).encode('utf-8')
+
+    def _health(self, aggregates, params):
+        return {
+            'file': self.filename,
+            'rows': self.query.total_input,
+            'valid': len(self.query.valid_offsets),
+            'paise': self.paise,
+            'loaded_at': self.loaded_at,
+            'reloads': self.reloads,
+            'catalog_products': len(self.mapping),
+            'catalog_pending': self.catalog is not None,
+            'cache': self.cache.stats()
+        }
+
+    def _summary(self, aggregates, params):
+        dates = list(aggregates['daily'])
+        count = aggregates['transaction_count']
+        return {
+            'total_revenue': aggregates['total_revenue'],
+            'transaction_count': count,
+            'avg_order_value': float(average_amount(aggregates['total_revenue'], count, self.paise)),
+            'date_range': [min(dates), max(dates)] if dates else None,
+            'regions': self.query.regions()
+        }
+
+    def _regions(self, aggregates, params):
+        return region_wise_sales(aggregates)
+
+    def _top_products(self, aggregates, params):
+        return top_products(aggregates, _int_param(params, 'n', 5), params.get('by', 'quantity'))
+
+    def _bottom_products(self, aggregates, params):
+        return bottom_products(aggregates, _int_param(params, 'n', 5), params.get('by', 'quantity'))
+
+    def _low_products(self, aggregates, params):
+        return low_performing_products(aggregates, _int_param(params, 'threshold', 10))
+
+    def _customers(self, aggregates, params):
+        return customer_analysis(aggregates)
+
+    def _top_customers(self, aggregates, params):
+        return top_customers(aggregates, _int_param(params, 'n', 5))
+
+    def _daily(self, aggregates, params):
+        return daily_sales_trend(aggregates)
+
+    def _rollups(self, aggregates, params):
+        rollups = sales_rollups(aggregates)
+        return {key: rollups[key] for key in ('weekly', 'monthly', 'rolling', 'peak_day')}
+
+    def _peak(self, aggregates, params):
+        return find_peak_sales_day(aggregates)
+
+    def _enrichment(self, aggregates, params):
+        return self.enrichment
+
+
+class AnalyticsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves AnalyticsService queries as GET requests returning JSON, e.g.
+    GET /regions?min_amount=1000
+    GET /products/top?n=3&by=revenue&region=North
+    """
+
+    service = None  # set by make_server()
+    protocol_version = 'HTTP/1.1'  # keep-alive, so dashboards reuse connections
+    # Headers and body are written separately; with Nagle's algorithm the
+    # body waits for the client's delayed ACK (~40 ms per request)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        # A repeated parameter keeps its last value
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            status, body = self.service.handle(url.path.rstrip('/') or '/', params)
+        except Exception as e:
+            status, body = 500, json.dumps({'error': str(e)}).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Per-request access logs would dominate the cost of cached answers
+        pass
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Returns: ThreadingHTTPServer answering queries from service
+    (call serve_forever() on it)
+    """
+
+    handler = type('BoundAnalyticsRequestHandler', (AnalyticsRequestHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(filename, host=DEFAULT_HOST, port=DEFAULT_PORT, paise=False, distinct_error=None,
+          cache_size=RESULT_CACHE_SIZE):
+    """
+    Loads filename and serves analytics queries until interrupted.
+    """
+
+    service = AnalyticsService(filename, paise, distinct_error, cache_size)
+    server = make_server(service, host, port)
+    print(f"Serving {filename} ({service.query.total_input} rows) on http://{host}:{server.server_port}")
+    print(f"Endpoints: {', '.join(sorted(service.endpoints))}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+    finally:
+        server.server_close()
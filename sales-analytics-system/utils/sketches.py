@@ -0,0 +1,333 @@
+import base64
+import hashlib
+import heapq
+import math
+
+
+class SpaceSaving:
+    """
+    Weighted Space-Saving heavy-hitters summary.
+    Tracks at most capacity keys. When a new key arrives and the summary is
+    full, the key with the smallest weight is evicted and the newcomer
+    inherits that weight as its error. Any key whose true weight exceeds
+    total_weight / capacity is guaranteed to be tracked, and every reported
+    weight overestimates the true weight by at most its error.
+    """
+
+    def __init__(self, capacity=1000):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.weights = {}
+        self.errors = {}
+        self.total_weight = 0
+        # Min-heap of (weight, key); entries go stale as weights grow and
+        # are skipped when popped
+        self._heap = []
+
+    def update(self, key, weight=1):
+        """
+        Adds weight to key.
+        """
+
+        self.total_weight += weight
+
+        if key in self.weights:
+            self.weights[key] += weight
+            heapq.heappush(self._heap, (self.weights[key], key))
+        elif len(self.weights) < self.capacity:
+            self.weights[key] = weight
+            self.errors[key] = 0
+            heapq.heappush(self._heap, (weight, key))
+        else:
+            min_weight, min_key = self._pop_min()
+            del self.weights[min_key]
+            del self.errors[min_key]
+            self.weights[key] = min_weight + weight
+            self.errors[key] = min_weight
+            heapq.heappush(self._heap, (self.weights[key], key))
+
+        # Drop stale heap entries once they outnumber live ones
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(w, k) for k, w in self.weights.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        while True:
+            weight, key = heapq.heappop(self._heap)
+            if self.weights.get(key) == weight:
+                return weight, key
+
+    def merge(self, other):
+        """
+        Merges another summary into this one (keeps the combined top
+        capacity keys). Returns: self
+        """
+
+        # A key missing from a full summary may still have up to that
+        # summary's smallest weight there
+        self_floor = min(self.weights.values()) if len(self.weights) >= self.capacity else 0
+        other_floor = min(other.weights.values()) if len(other.weights) >= other.capacity else 0
+
+        weights = {}
+        errors = {}
+        for key in self.weights.keys() | other.weights.keys():
+            weights[key] = self.weights.get(key, self_floor) + other.weights.get(key, other_floor)
+            errors[key] = self.errors.get(key, self_floor) + other.errors.get(key, other_floor)
+
+        kept = heapq.nlargest(self.capacity, weights.items(), key=lambda x: x[1])
+        self.weights = dict(kept)
+        self.errors = {key: errors[key] for key in self.weights}
+        self.total_weight += other.total_weight
+        self._heap = [(w, k) for k, w in self.weights.items()]
+        heapq.heapify(self._heap)
+        return self
+
+    def top(self, n):
+        """
+        Returns: list of (key, estimated_weight, max_error) tuples for the
+        n heaviest tracked keys, heaviest first
+        """
+
+        heaviest = heapq.nlargest(n, self.weights.items(), key=lambda x: x[1])
+        return [(key, weight, self.errors[key]) for key, weight in heaviest]
+
+
+HLL_MIN_PRECISION = 4
+HLL_MAX_PRECISION = 18  # 2**18 registers, 256 KB per sketch
+# Rough CPython size of one sparse register (dict slot plus int key); a
+# sketch densifies once its sparse registers would outgrow the bytearray
+SPARSE_ENTRY_BYTES = 64
+
+
+def hll_precision_for_error(error):
+    """
+    Picks the HyperLogLog precision p (2**p registers) whose standard
+    error, about 1.04 / sqrt(2**p), is at most error. Raises ValueError
+    when that takes more than 2**HLL_MAX_PRECISION registers.
+    Returns: int between HLL_MIN_PRECISION and HLL_MAX_PRECISION
+    """
+
+    if error <= 0:
+        raise ValueError("error must be positive")
+    p = max(math.ceil(math.log2((1.04 / error) ** 2)), HLL_MIN_PRECISION)
+    if p > HLL_MAX_PRECISION:
+        raise ValueError(f"error {error} needs 2**{p} HyperLogLog registers; the smallest supported error is "
+                         f"{1.04 / math.sqrt(1 << HLL_MAX_PRECISION):.5f}")
+    return p
+
+
+class HyperLogLog:
+    """
+    Mergeable approximate distinct counter.
+    Small sketches keep their registers in a dictionary and switch to a
+    dense bytearray before the dictionary would take more memory than
+    it, so a sketch that only ever sees a handful of values stays small.
+    Values are hashed with blake2b rather than hash(), so sketches built
+    in different processes or runs can be merged. len() returns the
+    estimated number of distinct values.
+    """
+
+    __slots__ = ('p', 'sparse', 'registers')
+
+    def __init__(self, error=0.01, p=None):
+        self.p = hll_precision_for_error(error) if p is None else p
+        self.sparse = {}
+        self.registers = None
+
+    def add(self, value):
+        """
+        Adds one value (anything with a stable str()).
+        """
+
+        x = int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+        bits = 64 - self.p
+        index = x >> bits
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+
+        if self.registers is not None:
+            if self.registers[index] < rank:
+                self.registers[index] = rank
+        elif self.sparse.get(index, 0) < rank:
+            self.sparse[index] = rank
+            if len(self.sparse) * SPARSE_ENTRY_BYTES > 1 << self.p:
+                self._densify()
+
+    def _densify(self):
+        self.registers = bytearray(1 << self.p)
+        for index, rank in self.sparse.items():
+            self.registers[index] = rank
+        self.sparse = {}
+
+    def merge(self, other):
+        """
+        Merges another sketch with the same precision into this one.
+        Returns: self
+        """
+
+        if other.p != self.p:
+            raise ValueError("cannot merge HyperLogLog sketches with different precision")
+
+        if other.registers is not None and self.registers is None:
+            self._densify()
+
+        if self.registers is not None:
+            registers = self.registers
+            if other.registers is not None:
+                for index, rank in enumerate(other.registers):
+                    if registers[index] < rank:
+                        registers[index] = rank
+            else:
+                for index, rank in other.sparse.items():
+                    if registers[index] < rank:
+                        registers[index] = rank
+        else:
+            for index, rank in other.sparse.items():
+                if self.sparse.get(index, 0) < rank:
+                    self.sparse[index] = rank
+            if len(self.sparse) * SPARSE_ENTRY_BYTES > 1 << self.p:
+                self._densify()
+
+        return self
+
+    __ior__ = merge
+
+    def copy(self):
+        """
+        Returns: independent copy of this sketch
+        """
+
+        sketch = HyperLogLog(p=self.p)
+        sketch.sparse = dict(self.sparse)
+        sketch.registers = None if self.registers is None else bytearray(self.registers)
+        return sketch
+
+    def count(self):
+        """
+        Returns: int (estimated number of distinct values added)
+        """
+
+        m = 1 << self.p
+        if self.registers is not None:
+            ranks = self.registers
+            zeros = ranks.count(0)
+        else:
+            ranks = self.sparse.values()
+            zeros = m - len(self.sparse)
+
+        harmonic = zeros + sum(2.0 ** -rank for rank in ranks if rank)
+        alpha = 0.7213 / (1 + 1.079 / m) if m >= 128 else {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / harmonic
+
+        # Linear counting is more accurate while many registers are empty
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+    def to_dict(self):
+        """
+        Returns: JSON-serialisable form of the sketch
+        """
+
+        if self.registers is not None:
+            return {'p': self.p, 'registers': base64.b64encode(bytes(self.registers)).decode('ascii')}
+        return {'p': self.p, 'sparse': [[index, rank] for index, rank in self.sparse.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Restores a sketch written by to_dict().
+        """
+
+        sketch = cls(p=data['p'])
+        if 'registers' in data:
+            sketch.registers = bytearray(base64.b64decode(data['registers']))
+        else:
+            sketch.sparse = {index: rank for index, rank in data['sparse']}
+            # Sketches saved before densifying moved earlier may hold more
+            if len(sketch.sparse) * SPARSE_ENTRY_BYTES > 1 << sketch.p:
+                sketch._densify()
+        return sketch
+
+
+class BloomFilter:
+    """
+    Fixed-memory set membership sketch. A value that was added is always
+    reported as present; a value that was not is wrongly reported as
+    present with probability false_positive_rate(), which grows as more
+    values are added. Values are hashed with blake2b (double hashing), so
+    filters of the same size built in different processes can be merged.
+    """
+
+    __slots__ = ('n_bits', 'n_hashes', 'bits', 'count')
+
+    def __init__(self, memory_bytes=64 * 1024 * 1024, n_hashes=7):
+        if memory_bytes < 1 or n_hashes < 1:
+            raise ValueError("memory_bytes and n_hashes must be at least 1")
+        self.n_bits = int(memory_bytes) * 8
+        self.n_hashes = n_hashes
+        self.bits = bytearray(int(memory_bytes))
+        self.count = 0
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        """
+        Sizes a filter for capacity values at the given false positive rate.
+        Returns: BloomFilter
+        """
+
+        n_bits = math.ceil(-max(capacity, 1) * math.log(error_rate) / math.log(2) ** 2)
+        n_hashes = max(1, round(n_bits / max(capacity, 1) * math.log(2)))
+        return cls(math.ceil(n_bits / 8), n_hashes)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def add(self, value):
+        """
+        Adds one value (anything with a stable str()).
+        Returns: True if the value may have been added before, False if it
+        certainly was not
+        """
+
+        bits = self.bits
+        present = True
+        for position in self._positions(value):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                present = False
+                bits[position >> 3] |= mask
+        if not present:
+            self.count += 1
+        return present
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def merge(self, other):
+        """
+        Merges another filter of the same size into this one in place.
+        Returns: self
+        """
+
+        if other.n_bits != self.n_bits or other.n_hashes != self.n_hashes:
+            raise ValueError("cannot merge Bloom filters of different sizes")
+        self.bits = bytearray((int.from_bytes(self.bits, 'big') | int.from_bytes(other.bits, 'big'))
+                              .to_bytes(len(self.bits), 'big'))
+        self.count += other.count
+        return self
+
+    def false_positive_rate(self):
+        """
+        Returns: float (estimated chance that an unseen value is reported
+        as present, given the number of distinct values added so far)
+        """
+
+        return (1 - math.exp(-self.n_hashes * self.count / self.n_bits)) ** self.n_hashes
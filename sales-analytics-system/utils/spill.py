@@ -0,0 +1,177 @@
+import heapq
+import os
+import tempfile
+
+DEFAULT_SPILL_MEMORY_MB = 256
+DEFAULT_PARTITIONS = 16
+MAX_SPLIT_DEPTH = 4  # a partition still too big after this many re-splits is aggregated anyway
+SPILL_BATCH_SIZE = 10000  # most lines buffered per partition before writing
+CHECK_INTERVAL = 1024  # rows aggregated between memory estimates
+
+# Rough CPython sizes of one customer's aggregate state and of one entry
+# in its products_bought set, used to keep a partition under the ceiling
+CUSTOMER_STATE_BYTES = 600
+PRODUCT_ENTRY_BYTES = 80
+SPILL_LINE_BYTES = 100
+
+
+def new_spill_stats():
+    """
+    Creates the statistics filled in by partitioned_customer_analysis().
+    """
+
+    return {'rows': 0, 'partitions': 0, 'resplits': 0, 'bytes_spilled': 0, 'customers': 0}
+def _write_partitions(rows, prefix, n_partitions, salt, limit_bytes, stats):
+    """
+    Hash-partitions spill rows (CustomerID, ProductName, amount, row
+    number) into the files prefix-0.txt ... prefix-<n-1>.txt; rows of a
+    customer stay in input order. Write buffers take at most a quarter of
+    limit_bytes.
+    Returns: list of partition file paths (None for an empty partition)
+    """
+
+    paths = [f"{prefix}-{i}.txt" for i in range(n_partitions)]
+    batch_size = max(16, min(SPILL_BATCH_SIZE, limit_bytes // (4 * n_partitions * SPILL_LINE_BYTES)))
+    buffers = [[] for _ in range(n_partitions)]
+    used = [False] * n_partitions
+
+    def flush(i):
+        with open(paths[i], 'a', encoding='utf-8') as f:
+            f.writelines(buffers[i])
+        stats['bytes_spilled'] += sum(len(line) for line in buffers[i])
+        buffers[i].clear()
+        used[i] = True
+
+    for customer, product, amount, row in rows:
+        # The files live only as long as this run, so hash() need not be
+        # stable across processes. Salting the string (not a tuple, whose
+        # hash keeps the split correlated) gives each level of re-splitting
+        # an independent split
+        i = hash(f"{salt}|{customer}") % n_partitions
+        buffer = buffers[i]
+        buffer.append(f"{customer}|{product}|{amount!r}|{row}\n")
+        if len(buffer) >= batch_size:
+            flush(i)
+
+    for i in range(n_partitions):
+        if buffers[i]:
+            flush(i)
+
+    stats['partitions'] += sum(used)
+    return [path if is_used else None for path, is_used in zip(paths, used)]
+def _rank_key(item):
+    # Highest total_spent first; ties go to the customer seen first, as in
+    # a stable sort of a single scan
+    return -item[1], item[4]
+def _merge_top(candidates, more, n):
+    """
+    Returns: the n best of two candidate lists (all of them when n is None)
+    """
+
+    if n is None:
+        candidates.extend(more)
+        return candidates
+    return heapq.nsmallest(n, candidates + more, key=_rank_key)
+def _read_partition(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            customer, product, amount, row = line.rstrip('\n').split('|')
+            # repr() of a float always has a '.', 'e' or 'inf'; paise are ints
+            yield customer, product, int(amount) if amount.lstrip('-').isdigit() else float(amount), int(row)
+def _aggregate_partition(path, limit_bytes):
+    """
+    Aggregates one partition file, giving up as soon as its estimated state
+    exceeds limit_bytes.
+    Returns: dictionary {CustomerID: [total_spent, purchase_count,
+    products_bought, first_row]}, or None when over the limit
+    """
+
+    customers = {}
+    product_entries = 0
+
+    for n, (customer, product, amount, row) in enumerate(_read_partition(path), start=1):
+        state = customers.get(customer)
+        if state is None:
+            customers[customer] = [amount, 1, {product}, row]
+            product_entries += 1
+        else:
+            state[0] += amount
+            state[1] += 1
+            if product not in state[2]:
+                state[2].add(product)
+                product_entries += 1
+
+        if limit_bytes is not None and n % CHECK_INTERVAL == 0:
+            if len(customers) * CUSTOMER_STATE_BYTES + product_entries * PRODUCT_ENTRY_BYTES > limit_bytes:
+                return None
+
+    return customers
+def _partition_top(path, n, limit_bytes, stats, depth=1):
+    """
+    Aggregates a partition and keeps its n heaviest customers, re-splitting
+    it with a new hash salt when its state does not fit in limit_bytes.
+    Returns: list of tuples (CustomerID, total_spent, purchase_count,
+    products_bought, first_row)
+    """
+
+    customers = _aggregate_partition(path, limit_bytes if depth <= MAX_SPLIT_DEPTH else None)
+    if customers is None:
+        stats['resplits'] += 1
+        sub_paths = _write_partitions(_read_partition(path), path[:-len('.txt')], DEFAULT_PARTITIONS, depth,
+                                      limit_bytes, stats)
+        os.remove(path)
+        candidates = []
+        for sub_path in sub_paths:
+            if sub_path is not None:
+                candidates = _merge_top(candidates, _partition_top(sub_path, n, limit_bytes, stats, depth + 1), n)
+        return candidates
+
+    os.remove(path)
+    stats['customers'] += len(customers)
+    items = ((customer, *state) for customer, state in customers.items())
+    return heapq.nsmallest(n, items, key=_rank_key) if n is not None else sorted(items, key=_rank_key)
+def partitioned_customer_analysis(transactions, n=None, memory_mb=DEFAULT_SPILL_MEMORY_MB, n_partitions=None,
+                                  temp_dir=None, stats=None):
+    """
+    Out-of-core customer_analysis() for customer bases whose state does
+    not fit in memory. Rows are hash-partitioned by CustomerID into
+    temporary files, each partition is aggregated on its own under a
+    memory ceiling of memory_mb (a partition over it is split again), and
+    the per-partition top n customers are merged.
+    Totals are summed in input order and ties keep first-seen order, so
+    the result is identical to customer_analysis() (or top_customers()
+    with n), in rupees or paise alike. Pass a dictionary from
+    new_spill_stats() as stats to collect spill counts.
+    Returns: dictionary in the customer_analysis() format, holding the n
+    heaviest customers (all of them when n is None)
+    """
+
+    if stats is None:
+        stats = new_spill_stats()
+    limit_bytes = int(memory_mb * 1024 * 1024)
+
+    def spill_rows():
+        for row, t in enumerate(transactions):
+            stats['rows'] += 1
+            yield t['CustomerID'], t['ProductName'], t['Quantity'] * t['UnitPrice'], row
+
+    with tempfile.TemporaryDirectory(prefix='sales-spill-', dir=temp_dir) as directory:
+        paths = _write_partitions(spill_rows(), os.path.join(directory, 'part'), n_partitions or DEFAULT_PARTITIONS, 0,
+                                  limit_bytes, stats)
+
+        candidates = []
+        for path in paths:
+            if path is not None:
+                candidates = _merge_top(candidates, _partition_top(path, n, limit_bytes, stats), n)
+
+    heaviest = sorted(candidates, key=_rank_key)
+
+    return {
+        customer: {
+            'total_spent': total_spent,
+            'purchase_count': purchase_count,
+            'products_bought': list(products_bought),
+            'avg_order_value': total_spent / purchase_count if purchase_count > 0 else 0.0
+        }
+        for customer, total_spent, purchase_count, products_bought, _ in heaviest
+    }
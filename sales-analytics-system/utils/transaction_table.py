@@ -0,0 +1,481 @@
+import struct
+from array import array
+from collections.abc import MutableMapping
+from operator import mul
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+BASE_FIELDS = ['TransactionID', 'Date', 'ProductID', 'ProductName',
+               'Quantity', 'UnitPrice', 'CustomerID', 'Region']
+
+# Columns stored as integer codes into a per-column list of distinct values
+ENCODED_FIELDS = ['Date', 'ProductID', 'ProductName', 'CustomerID', 'Region']
+
+
+def _extend_array(column, values):
+    """
+    Appends a list of numbers to a typed array. Packing them with struct
+    takes about half the time of array.fromlist() per value.
+    """
+
+    column.frombytes(struct.pack(f"{len(values)}{column.typecode}", *values))
+
+
+class TransactionTable:
+    """
+    Columnar store for parsed transactions.
+    Quantity, UnitPrice and the precomputed Amount (Quantity * UnitPrice)
+    are held in typed arrays, Date/ProductID/ProductName/CustomerID/Region
+    as integer codes into a dictionary of distinct values, and any extra
+    columns added later (e.g. API_* from enrichment) as plain lists.
+    Indexing or iterating returns TransactionRow views that behave like the
+    transaction dictionaries returned by parse_transactions().
+    With paise=True UnitPrice and Amount are int64 paise instead of float
+    rupees, so every sum over them is exact.
+    """
+
+    def __init__(self, paise=False):
+        self.paise = paise
+        money_type = 'q' if paise else 'd'
+        self.transaction_ids = []
+        self.quantity = array('q')
+        self.unit_price = array(money_type)
+        self.amount = array(money_type)
+        self.codes = {field: array('i') for field in ENCODED_FIELDS}
+        self.values = {field: [] for field in ENCODED_FIELDS}
+        self.lookup = {field: {} for field in ENCODED_FIELDS}
+        self.extra_columns = {}
+
+    @classmethod
+    def from_transactions(cls, transactions, extra_fields=(), paise=False):
+        """
+        Builds a table from an iterable of transaction dictionaries.
+        Keys listed in extra_fields are kept as extra columns. Pass
+        paise=True for transactions parsed in paise mode.
+        Returns: TransactionTable
+        """
+
+        table = cls(paise)
+        table.extra_columns = {field: [] for field in extra_fields}
+        for t in transactions:
+            table.append(t)
+        return table
+
+    def encode(self, field, value):
+        """
+        Returns the integer code for value in an encoded column, adding it
+        to the column dictionary if it has not been seen before.
+        """
+
+        lookup = self.lookup[field]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self.values[field])
+            self.values[field].append(value)
+        return code
+
+    def append(self, t):
+        """
+        Appends one transaction dictionary as a new row.
+        """
+
+        self.transaction_ids.append(t['TransactionID'])
+        self.quantity.append(t['Quantity'])
+        self.unit_price.append(t['UnitPrice'])
+        self.amount.append(t['Quantity'] * t['UnitPrice'])
+        for field in ENCODED_FIELDS:
+            self.codes[field].append(self.encode(field, t[field]))
+        for name, column in self.extra_columns.items():
+            column.append(t.get(name))
+
+    def extend_columns(self, columns):
+        """
+        Appends rows given column-wise, as a dictionary mapping each field
+        in BASE_FIELDS to a list of values. Encoded columns are looked up
+        with one map() each; only a block with new values is scanned again
+        to assign their codes.
+        """
+
+        quantities = columns['Quantity']
+        prices = columns['UnitPrice']
+        self.transaction_ids.extend(columns['TransactionID'])
+        _extend_array(self.quantity, quantities)
+        _extend_array(self.unit_price, prices)
+        _extend_array(self.amount, list(map(mul, quantities, prices)))
+
+        for field in ENCODED_FIELDS:
+            values = columns[field]
+            get_code = self.lookup[field].__getitem__
+            try:
+                codes = list(map(get_code, values))
+            except KeyError:
+                # Values not seen before get codes in first-seen order
+                for value in dict.fromkeys(values):
+                    self.encode(field, value)
+                codes = list(map(get_code, values))
+            _extend_array(self.codes[field], codes)
+
+        for column in self.extra_columns.values():
+            column.extend([None] * len(quantities))
+
+    def __len__(self):
+        return len(self.transaction_ids)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('row index out of range')
+        return TransactionRow(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield TransactionRow(self, index)
+
+    def get_value(self, index, field):
+        """
+        Returns the decoded value of one cell.
+        """
+
+        if field in self.codes:
+            return self.values[field][self.codes[field][index]]
+        if field == 'TransactionID':
+            return self.transaction_ids[index]
+        if field == 'Quantity':
+            return self.quantity[index]
+        if field == 'UnitPrice':
+            return self.unit_price[index]
+        if field in self.extra_columns:
+            return self.extra_columns[field][index]
+        raise KeyError(field)
+
+    def set_value(self, index, field, value):
+        """
+        Updates one cell, keeping the Amount column in step with
+        Quantity and UnitPrice. Unknown fields become extra columns.
+        """
+
+        if field in self.codes:
+            self.codes[field][index] = self.encode(field, value)
+        elif field == 'TransactionID':
+            self.transaction_ids[index] = value
+        elif field == 'Quantity':
+            self.quantity[index] = value
+            self.amount[index] = value * self.unit_price[index]
+        elif field == 'UnitPrice':
+            self.unit_price[index] = value
+            self.amount[index] = self.quantity[index] * value
+        else:
+            if field not in self.extra_columns:
+                self.extra_columns[field] = [None] * len(self)
+            self.extra_columns[field][index] = value
+
+    def column(self, field):
+        """
+        Returns the decoded values of a column as a list.
+        """
+
+        if field in self.codes:
+            values = self.values[field]
+            return [values[code] for code in self.codes[field]]
+        if field == 'TransactionID':
+            return list(self.transaction_ids)
+        if field == 'Quantity':
+            return list(self.quantity)
+        if field == 'UnitPrice':
+            return list(self.unit_price)
+        if field == 'Amount':
+            return list(self.amount)
+        return list(self.extra_columns[field])
+
+    def take(self, indices):
+        """
+        Builds a new table holding the given rows. The column dictionaries
+        are copied so codes mean the same thing in both tables.
+        Returns: TransactionTable
+        """
+
+        table = TransactionTable(self.paise)
+        table.values = {field: list(values) for field, values in self.values.items()}
+        table.lookup = {field: dict(lookup) for field, lookup in self.lookup.items()}
+        table.extra_columns = {name: [] for name in self.extra_columns}
+
+        for index in indices:
+            table.transaction_ids.append(self.transaction_ids[index])
+            table.quantity.append(self.quantity[index])
+            table.unit_price.append(self.unit_price[index])
+            table.amount.append(self.amount[index])
+            for field in ENCODED_FIELDS:
+                table.codes[field].append(self.codes[field][index])
+            for name, column in self.extra_columns.items():
+                table.extra_columns[name].append(column[index])
+
+        return table
+
+    def to_numpy(self):
+        """
+        Returns zero-copy NumPy views of the numeric and code columns.
+        Requires numpy.
+        """
+
+        if np is None:
+            raise ImportError("numpy is required for TransactionTable.to_numpy()")
+
+        money_dtype = np.int64 if self.paise else np.float64
+        columns = {
+            'Quantity': np.frombuffer(self.quantity, dtype=np.int64),
+            'UnitPrice': np.frombuffer(self.unit_price, dtype=money_dtype),
+            'Amount': np.frombuffer(self.amount, dtype=money_dtype)
+        }
+        for field in ENCODED_FIELDS:
+            columns[field] = np.frombuffer(self.codes[field], dtype=np.int32)
+        return columns
+
+    def total_revenue(self):
+        """
+        Returns: float (sum of the Amount column, added in row order),
+        or int paise for a paise table
+        """
+
+        if self.paise:
+            # Integer sums are exact in any order, so a plain reduction will do
+            if np is not None and len(self):
+                return int(np.frombuffer(self.amount, dtype=np.int64).sum())
+            return sum(self.amount)
+
+        if np is not None and len(self):
+            return float(np.cumsum(np.frombuffer(self.amount, dtype=np.float64))[-1])
+
+        total = 0.0
+        for amount in self.amount:
+            total += amount
+        return total
+
+    def aggregate(self):
+        """
+        Computes the same aggregate state as aggregate_transactions() with
+        group-bys over the integer code columns.
+        Returns: dictionary of aggregate state
+        """
+
+        if np is not None:
+            return self._aggregate_numpy()
+        return self._aggregate_python()
+
+    def _aggregate_python(self):
+        quantity = self.quantity
+        amount = self.amount
+        region_codes = self.codes['Region']
+        product_codes = self.codes['ProductName']
+        customer_codes = self.codes['CustomerID']
+        date_codes = self.codes['Date']
+
+        zero = 0 if self.paise else 0.0
+
+        region_sales = [zero] * len(self.values['Region'])
+        region_count = [0] * len(self.values['Region'])
+        product_quantity = [0] * len(self.values['ProductName'])
+        product_revenue = [zero] * len(self.values['ProductName'])
+        customer_spent = [zero] * len(self.values['CustomerID'])
+        customer_count = [0] * len(self.values['CustomerID'])
+        customer_products = {}
+        date_revenue = [zero] * len(self.values['Date'])
+        date_count = [0] * len(self.values['Date'])
+        date_customers = {}
+        first_seen = {field: {} for field in ('Region', 'ProductName', 'CustomerID', 'Date')}
+
+        total_revenue = zero
+        for i in range(len(self)):
+            a = amount[i]
+            rc = region_codes[i]
+            pc = product_codes[i]
+            cc = customer_codes[i]
+            dc = date_codes[i]
+
+            total_revenue += a
+            region_sales[rc] += a
+            region_count[rc] += 1
+            product_quantity[pc] += quantity[i]
+            product_revenue[pc] += a
+            customer_spent[cc] += a
+            customer_count[cc] += 1
+            date_revenue[dc] += a
+            date_count[dc] += 1
+
+            # Dicts keep insertion order, so the decoded sets are built in row order
+            if cc not in customer_products:
+                customer_products[cc] = {}
+            customer_products[cc][pc] = None
+            if dc not in date_customers:
+                date_customers[dc] = {}
+            date_customers[dc][cc] = None
+
+            first_seen['Region'].setdefault(rc, i)
+            first_seen['ProductName'].setdefault(pc, i)
+            first_seen['CustomerID'].setdefault(cc, i)
+            first_seen['Date'].setdefault(dc, i)
+
+        order = {field: list(seen) for field, seen in first_seen.items()}
+        return self._build_aggregates(
+            total_revenue, order,
+            region_sales, region_count,
+            product_quantity, product_revenue,
+            customer_spent, customer_count, customer_products,
+            date_revenue, date_count, date_customers
+        )
+
+    def _aggregate_numpy(self):
+        columns = self.to_numpy()
+        amount = columns['Amount']
+        quantity = columns['Quantity']
+        region_codes = columns['Region']
+        product_codes = columns['ProductName']
+        customer_codes = columns['CustomerID']
+        date_codes = columns['Date']
+
+        n_regions = len(self.values['Region'])
+        n_products = len(self.values['ProductName'])
+        n_customers = len(self.values['CustomerID'])
+        n_dates = len(self.values['Date'])
+
+        region_sales = self._group_sums(region_codes, amount, n_regions)
+        region_count = np.bincount(region_codes, minlength=n_regions).tolist()
+        product_quantity = self._group_sums(product_codes, quantity, n_products)
+        product_revenue = self._group_sums(product_codes, amount, n_products)
+        customer_spent = self._group_sums(customer_codes, amount, n_customers)
+        customer_count = np.bincount(customer_codes, minlength=n_customers).tolist()
+        date_revenue = self._group_sums(date_codes, amount, n_dates)
+        date_count = np.bincount(date_codes, minlength=n_dates).tolist()
+
+        customer_products = self._unique_pairs(customer_codes, product_codes, n_products)
+        date_customers = self._unique_pairs(date_codes, customer_codes, n_customers)
+
+        order = {}
+        for field, codes in (('Region', region_codes), ('ProductName', product_codes),
+                             ('CustomerID', customer_codes), ('Date', date_codes)):
+            present, first_index = np.unique(codes, return_index=True)
+            order[field] = present[np.argsort(first_index)].tolist()
+
+        return self._build_aggregates(
+            self.total_revenue(), order,
+            region_sales, region_count,
+            product_quantity, product_revenue,
+            customer_spent, customer_count, customer_products,
+            date_revenue, date_count, date_customers
+        )
+
+    @staticmethod
+    def _group_sums(codes, values, n_groups):
+        """
+        Sums values per group code.
+        Returns: list of n_groups Python numbers (ints for integer columns)
+        """
+
+        if values.dtype == np.int64:
+            # bincount would convert to float64; add.at keeps exact int64 sums
+            sums = np.zeros(n_groups, dtype=np.int64)
+            np.add.at(sums, codes, values)
+            return sums.tolist()
+        # bincount adds weights in row order, so sums match a sequential scan
+        return np.bincount(codes, weights=values, minlength=n_groups).tolist()
+
+    @staticmethod
+    def _unique_pairs(outer_codes, inner_codes, n_inner):
+        """
+        Finds the distinct (outer, inner) code pairs in first-seen row order.
+        Returns: dictionary {outer_code: {inner_code: None, ...}}
+        """
+
+        width = max(n_inner, 1)
+        keys = outer_codes.astype(np.int64) * width + inner_codes
+        unique_keys, first_index = np.unique(keys, return_index=True)
+        unique_keys = unique_keys[np.argsort(first_index)]
+
+        groups = {}
+        for outer, inner in zip((unique_keys // width).tolist(), (unique_keys % width).tolist()):
+            if outer not in groups:
+                groups[outer] = {}
+            groups[outer][inner] = None
+        return groups
+
+    def _build_aggregates(self, total_revenue, order,
+                          region_sales, region_count,
+                          product_quantity, product_revenue,
+                          customer_spent, customer_count, customer_products,
+                          date_revenue, date_count, date_customers):
+        """
+        Decodes per-code group arrays into the aggregate_transactions() format,
+        keeping groups in first-seen row order.
+        """
+
+        regions = self.values['Region']
+        products = self.values['ProductName']
+        customers = self.values['CustomerID']
+        dates = self.values['Date']
+
+        return {
+            'total_revenue': total_revenue,
+            'transaction_count': len(self),
+            'paise': self.paise,
+            'regions': {
+                regions[c]: {'total_sales': region_sales[c], 'transaction_count': region_count[c]}
+                for c in order['Region']
+            },
+            'products': {
+                products[c]: {'total_quantity': product_quantity[c], 'total_revenue': product_revenue[c]}
+                for c in order['ProductName']
+            },
+            'customers': {
+                customers[c]: {
+                    'total_spent': customer_spent[c],
+                    'purchase_count': customer_count[c],
+                    'products_bought': {products[p] for p in customer_products[c]}
+                }
+                for c in order['CustomerID']
+            },
+            'daily': {
+                dates[c]: {
+                    'revenue': date_revenue[c],
+                    'transaction_count': date_count[c],
+                    'unique_customers': {customers[u] for u in date_customers[c]}
+                }
+                for c in order['Date']
+            }
+        }
+
+
+class TransactionRow(MutableMapping):
+    """
+    Dictionary-like view of one TransactionTable row, so code written for
+    transaction dictionaries (validation, enrichment, saving) works unchanged.
+    Writes go straight to the table's columns.
+    """
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, field):
+        return self.table.get_value(self.index, field)
+
+    def __setitem__(self, field, value):
+        self.table.set_value(self.index, field, value)
+
+    def __delitem__(self, field):
+        raise TypeError("columns cannot be deleted from a TransactionRow")
+
+    def __iter__(self):
+        yield from BASE_FIELDS
+        yield from self.table.extra_columns
+
+    def __len__(self):
+        return len(BASE_FIELDS) + len(self.table.extra_columns)
+
+    def __repr__(self):
+        return repr(dict(self))